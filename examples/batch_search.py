@@ -0,0 +1,32 @@
+import argparse
+import json
+
+from kbmod.batch_runner import BatchRunner, load_manifest, summarize_timings
+from kbmod.configuration import KBMODConfig
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--manifest", dest="manifest", help="JSON lines file with one patch per line.")
+    parser.add_argument("--config", dest="config", default=None, help="The base configuration file.")
+    parser.add_argument("--workers", dest="workers", type=int, default=1)
+    parser.add_argument("--max_memory_mb", dest="max_memory_mb", type=int, default=None)
+    parser.add_argument("--retries", dest="retries", type=int, default=1)
+    parser.add_argument("--records", dest="records", default="batch_records.jsonl")
+    args = parser.parse_args()
+
+    config = KBMODConfig()
+    if args.config is not None:
+        config.load_from_file(args.config)
+
+    runner = BatchRunner(
+        config,
+        num_workers=args.workers,
+        max_memory_mb=args.max_memory_mb,
+        max_retries=args.retries,
+        record_file=args.records,
+    )
+    records = runner.run(load_manifest(args.manifest))
+
+    failed = [r["name"] for r in records if r["status"] != "success"]
+    print(f"Finished {len(records) - len(failed)} patches, {len(failed)} failed: {failed}")
+    print(json.dumps(summarize_timings(records), indent=2))
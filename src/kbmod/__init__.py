@@ -1,3 +1,4 @@
+import importlib
 import warnings
 
 try:
@@ -5,16 +6,37 @@ try:
 except ImportError:
     warnings.warn("Unable to determine the package version. " "This is likely a broken installation.")
 
-# lazy import analysis to arrest
-# loading large libraries in them
-# import the filters subdirectory
-from . import (
-    analysis,
-    analysis_utils,
-    file_utils,
-    filters,
-    image_info,
-    jointfit_functions,
-    result_list,
-    run_search,
-)
+# The submodules are imported lazily (PEP 562) on first attribute access,
+# so that ``import kbmod`` or ``import kbmod.search`` does not load large
+# libraries (scipy, sklearn, matplotlib, koffi, ...) that are not needed.
+_LAZY_SUBMODULES = [
+    "analysis",
+    "analysis_utils",
+    "batch_runner",
+    "checkpoint",
+    "completeness",
+    "configuration",
+    "fake_data_creator",
+    "file_utils",
+    "filters",
+    "image_info",
+    "instrumentation",
+    "jointfit_functions",
+    "known_objects",
+    "packed_stack",
+    "result_list",
+    "result_table",
+    "run_search",
+]
+
+__all__ = list(_LAZY_SUBMODULES)
+
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + _LAZY_SUBMODULES)
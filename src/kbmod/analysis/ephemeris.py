@@ -0,0 +1,234 @@
+"""Vectorized two-body ephemerides of barycentric orbits.
+
+These functions only depend on numpy and astropy, so they can be used (and
+tested) without pyOrbfit. ``OrbitUtils`` uses them to predict the positions
+of its fitted orbits.
+"""
+
+from functools import lru_cache
+
+import astropy.units as u
+import numpy as np
+from astropy.coordinates import EarthLocation, get_body_barycentric
+from astropy.time import Time
+
+# The gravitational parameter of the Sun plus the planets (for barycentric orbits) in AU^3/yr^2.
+_GM_BARY = 4.0 * np.pi**2 * 1.00134
+
+# The speed of light in AU/yr.
+_C_AU_YR = 63241.077
+
+# The obliquity of the ecliptic (J2000) in radians.
+_OBLIQUITY = np.radians(23.43928)
+
+# The MPC parallax constants (east longitude in degrees, rho * cos(phi'), rho * sin(phi'))
+# of the observatories that can be given by their codes. 807 (Cerro Tololo) is the
+# observatory used by pyOrbfit's predictions.
+_MPC_OBSERVATORIES = {
+    "500": (0.0, 0.0, 0.0),
+    "807": (289.19410, 0.86560, -0.49980),
+}
+
+# The equatorial radius of the Earth (used with the MPC parallax constants) in meters.
+_EARTH_RADIUS_M = 6378137.0
+
+# The number of sets of dates (and locations) whose observer positions are cached.
+OBSERVER_CACHE_SIZE = 64
+
+
+def mpc_observatory_location(code):
+    """
+    Get the location of an observatory from its MPC code.
+
+    Parameters
+    ----------
+    code: str
+        The three character MPC observatory code. Only a few codes are
+        available (see ``_MPC_OBSERVATORIES``).
+
+    Returns
+    -------
+    location: astropy EarthLocation or None
+        The location of the observatory (None for the geocenter, code 500).
+    """
+
+    if code not in _MPC_OBSERVATORIES:
+        raise ValueError(f"Unknown observatory code {code}.")
+    lon, rho_cos, rho_sin = _MPC_OBSERVATORIES[code]
+    if rho_cos == 0.0 and rho_sin == 0.0:
+        return None
+    return EarthLocation.from_geocentric(
+        _EARTH_RADIUS_M * rho_cos * np.cos(np.radians(lon)),
+        _EARTH_RADIUS_M * rho_cos * np.sin(np.radians(lon)),
+        _EARTH_RADIUS_M * rho_sin,
+        unit=u.m,
+    )
+
+
+@lru_cache(maxsize=OBSERVER_CACHE_SIZE)
+def _cached_observer_positions(dates_bytes, loc_key):
+    """Compute the observer positions for the dates (as bytes) and geocentric location (in meters)."""
+
+    times = Time(np.frombuffer(dates_bytes, dtype=float), format="mjd", scale="utc")
+    obs_pos = get_body_barycentric("earth", times).xyz.to_value(u.au).T
+    if loc_key is not None:
+        location = EarthLocation.from_geocentric(*loc_key, unit=u.m)
+        gcrs_pos, _ = location.get_gcrs_posvel(times)
+        obs_pos = obs_pos + gcrs_pos.xyz.to_value(u.au).T
+    obs_pos.setflags(write=False)
+    return obs_pos
+
+
+def clear_observer_cache():
+    """Clear the cached observer positions."""
+
+    _cached_observer_positions.cache_clear()
+
+
+def observer_positions(dates, location=None):
+    """
+    Compute the barycentric equatorial (ICRS) positions of an observer for many
+    dates at once. The results for the last ``OBSERVER_CACHE_SIZE`` sets of
+    dates are cached, so predictions for the same dates (for example for many
+    orbits) only compute them once.
+
+    Parameters
+    ----------
+    dates: numpy array
+        The dates in MJD (UTC).
+
+    location: astropy EarthLocation, default=None
+        The location of the observatory. If None the geocenter is used.
+
+    Returns
+    -------
+    obs_pos: numpy ndarray
+        A read-only (num_dates, 3) array with the positions in AU.
+    """
+
+    dates = np.atleast_1d(np.asarray(dates, dtype=float))
+    loc_key = None if location is None else tuple(float(v) for v in location.to_value(u.m))
+    return _cached_observer_positions(dates.tobytes(), loc_key)
+
+
+def _stumpff(z):
+    """The Stumpff functions C(z) and S(z) used by the universal variable propagation."""
+
+    c = np.empty_like(z)
+    s = np.empty_like(z)
+    pos = z > 1e-8
+    neg = z < -1e-8
+    small = ~(pos | neg)
+
+    sz = np.sqrt(z[pos])
+    c[pos] = (1.0 - np.cos(sz)) / z[pos]
+    s[pos] = (sz - np.sin(sz)) / sz**3
+    sz = np.sqrt(-z[neg])
+    c[neg] = (np.cosh(sz) - 1.0) / -z[neg]
+    s[neg] = (np.sinh(sz) - sz) / sz**3
+    c[small] = 0.5 - z[small] / 24.0
+    s[small] = 1.0 / 6.0 - z[small] / 120.0
+    return c, s
+
+
+def propagate_orbits(states, dt, num_iters=50):
+    """
+    Propagate two-body (Keplerian) barycentric orbits with the universal
+    variable formulation. All the orbits and time steps are computed at once.
+
+    Parameters
+    ----------
+    states: numpy ndarray
+        The (..., 6) positions (AU) and velocities (AU/yr).
+
+    dt: numpy ndarray
+        The time steps in years, broadcastable against ``states[..., 0]``.
+
+    num_iters: int, default=50
+        The maximum number of Newton iterations.
+
+    Returns
+    -------
+    pos: numpy ndarray
+        The (..., 3) positions in AU after each time step.
+    """
+
+    states = np.asarray(states, dtype=float)
+    dt = np.asarray(dt, dtype=float)
+    shape = np.broadcast_shapes(states.shape[:-1], dt.shape)
+    r0 = np.broadcast_to(states[..., 0:3], shape + (3,))
+    v0 = np.broadcast_to(states[..., 3:6], shape + (3,))
+    dt = np.broadcast_to(dt, shape)
+
+    sqrt_mu = np.sqrt(_GM_BARY)
+    r0_norm = np.linalg.norm(r0, axis=-1)
+    rv = np.sum(r0 * v0, axis=-1) / sqrt_mu
+    alpha = 2.0 / r0_norm - np.sum(v0 * v0, axis=-1) / _GM_BARY
+
+    # Solve the universal Kepler equation for chi with Newton's method.
+    chi = sqrt_mu * np.abs(alpha) * dt
+    for _ in range(num_iters):
+        z = alpha * chi * chi
+        c, s = _stumpff(z)
+        chi2 = chi * chi
+        f_chi = rv * chi2 * c + (1.0 - alpha * r0_norm) * chi2 * chi * s + r0_norm * chi - sqrt_mu * dt
+        df_chi = rv * chi * (1.0 - z * s) + (1.0 - alpha * r0_norm) * chi2 * c + r0_norm
+        step = f_chi / df_chi
+        chi = chi - step
+        if np.all(np.abs(step) < 1e-12):
+            break
+
+    z = alpha * chi * chi
+    c, s = _stumpff(z)
+    f = 1.0 - chi * chi * c / r0_norm
+    g = dt - chi**3 * s / sqrt_mu
+    return f[..., None] * r0 + g[..., None] * v0
+
+
+def predict_radec(states, jd0, dates, obs_pos):
+    """
+    Predict the apparent positions of barycentric orbits as seen by an observer,
+    including the light travel time. All the orbits and dates are computed at once.
+
+    Parameters
+    ----------
+    states: numpy ndarray
+        The (..., 6) barycentric ecliptic (J2000) positions (AU) and
+        velocities (AU/yr) at ``jd0``.
+
+    jd0: float
+        The Julian date of the states.
+
+    dates: numpy array
+        The dates in MJD for the predictions.
+
+    obs_pos: numpy ndarray
+        The (num_dates, 3) barycentric equatorial positions of the observer in AU
+        (see ``observer_positions``).
+
+    Returns
+    -------
+    ra: numpy ndarray
+        The (..., num_dates) right ascensions in degrees.
+
+    dec: numpy ndarray
+        The (..., num_dates) declinations in degrees.
+    """
+
+    states = np.asarray(states, dtype=float)[..., None, :]
+    dt = (np.asarray(dates, dtype=float) + 2400000.5 - jd0) / 365.25
+
+    # Rotate the orbits from ecliptic to equatorial coordinates and iterate on the light travel time.
+    cos_eps = np.cos(_OBLIQUITY)
+    sin_eps = np.sin(_OBLIQUITY)
+    light_time = np.zeros(dt.shape)
+    for _ in range(3):
+        pos = propagate_orbits(states, dt - light_time)
+        x = pos[..., 0] - obs_pos[:, 0]
+        y = pos[..., 1] * cos_eps - pos[..., 2] * sin_eps - obs_pos[:, 1]
+        z = pos[..., 1] * sin_eps + pos[..., 2] * cos_eps - obs_pos[:, 2]
+        light_time = np.sqrt(x * x + y * y + z * z) / _C_AU_YR
+
+    ra = np.degrees(np.arctan2(y, x)) % 360.0
+    dec = np.degrees(np.arctan2(z, np.sqrt(x * x + y * y)))
+    return ra, dec
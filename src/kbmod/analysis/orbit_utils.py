@@ -1,7 +1,6 @@
 from __future__ import print_function
 
 from collections import OrderedDict
-from math import copysign
 
 import astropy.units as u
 import ephem
@@ -17,6 +16,13 @@ from pyOrbfit.Orbit import Orbit
 from scipy.linalg import cholesky
 from scipy.stats import multivariate_normal
 
+from kbmod.analysis.ephemeris import mpc_observatory_location, observer_positions, predict_radec
+from kbmod.file_utils import FileUtils
+
+# pyOrbfit's predict_pos gives topocentric positions for Cerro Tololo (MPC code 807), so
+# the array predictions use the same observatory by default.
+PYORBFIT_LOCATION = mpc_observatory_location("807")
+
 
 class KbmodInfo(object):
     """
@@ -57,16 +63,21 @@ class KbmodInfo(object):
         self.visit_df = pd.DataFrame(visit_list, columns=["visit_num"])
         self.visit_df["visit_mjd"] = visit_mjd
 
-        results_array = np.genfromtxt(results_filename)
-
-        # Only keep values and not property names from results file
-        if len(np.shape(results_array)) == 1:
-            results_proper = [results_array[1::2]]
-        elif len(np.shape(results_array)) > 1:
-            results_proper = results_array[:, 1::2]
-
+        # Read the named columns (so files with or without the bary_index column work).
+        results_array = FileUtils.load_results_file(results_filename).ravel()
         self.results_df = pd.DataFrame(
-            results_proper, columns=["lh", "flux", "x0", "y0", "x_v", "y_v", "obs_count"]
+            {
+                name: results_array[column]
+                for name, column in [
+                    ("lh", "lh"),
+                    ("flux", "flux"),
+                    ("x0", "x"),
+                    ("y0", "y"),
+                    ("x_v", "vx"),
+                    ("y_v", "vy"),
+                    ("obs_count", "num_obs"),
+                ]
+            }
         )
 
         image_fits = fits.open(image_filename)
@@ -98,29 +109,7 @@ class KbmodInfo(object):
         times: astropy Time object
             Times of the observations
         """
-        iso_times = []
-        time_frac = []
-        ra = []
-        dec = []
-
-        with open(filename, "r") as f:
-            for line in f:
-                year = str(line[15:19])
-                month = str(line[20:22])
-                day = str(line[23:25])
-                iso_times.append(str("%s-%s-%s" % (year, month, day)))
-                time_frac.append(str(line[25:31]))
-                ra.append(str(line[32:44]))
-                dec.append(str(line[44:56]))
-
-        coords = SkyCoord(ra, dec, unit=(u.hourangle, u.deg))
-        t = Time(iso_times)
-        t_obs = []
-        for t_i, frac in zip(t, time_frac):
-            t_obs.append(t_i.mjd + float(frac))
-        obs_times = Time(t_obs, format="mjd")
-
-        return coords, obs_times
+        return FileUtils.mpc_reader(filename)
 
     def get_searched_radec(self, obj_idx):
         """
@@ -157,53 +146,9 @@ class KbmodInfo(object):
             List where each entry is an observation as an MPC-formatted string
         """
 
-        field_times = Time(self.results_mjd, format="mjd")
-
-        mpc_lines = []
-        for t, c in zip(field_times, self.coords):
-            mjd_frac = t.mjd % 1.0
-            ra_hms = c.ra.hms
-            dec_dms = c.dec.dms
-            if dec_dms.d != 0:
-                name = (
-                    "     c111112  c%4i %02i %08.5f %02i %02i %06.3f%+03i %02i %05.2f                     %s"
-                    % (
-                        t.datetime.year,
-                        t.datetime.month,
-                        t.datetime.day + mjd_frac,
-                        ra_hms.h,
-                        ra_hms.m,
-                        ra_hms.s,
-                        dec_dms.d,
-                        np.abs(dec_dms.m),
-                        np.abs(dec_dms.s),
-                        self.obs,
-                    )
-                )
-            else:
-                if copysign(1, dec_dms.d) == -1.0:
-                    dec_dms_d = "-00"
-                else:
-                    dec_dms_d = "+00"
-                name = (
-                    "     c111112  c%4i %02i %08.5f %02i %02i %06.3f%s %02i %05.2f                     %s"
-                    % (
-                        t.datetime.year,
-                        t.datetime.month,
-                        t.datetime.day + mjd_frac,
-                        ra_hms.h,
-                        ra_hms.m,
-                        ra_hms.s,
-                        dec_dms_d,
-                        np.abs(dec_dms.m),
-                        np.abs(dec_dms.s),
-                        self.obs,
-                    )
-                )
-
-            mpc_lines.append(name)
-
-        return mpc_lines
+        return FileUtils.format_results_mpc(
+            self.coords.ra.degree, self.coords.dec.degree, self.results_mjd, self.obs
+        )
 
     def save_results_mpc(self, file_out):
         """
@@ -218,10 +163,9 @@ class KbmodInfo(object):
             file in other methods below where file_in=None.
         """
 
-        mpc_lines = self.format_results_mpc()
-        with open(file_out, "w") as f:
-            for obs in mpc_lines:
-                f.write(obs + "\n")
+        FileUtils.save_radec_mpc(
+            file_out, self.coords.ra.degree, self.coords.dec.degree, self.results_mjd, self.obs
+        )
 
 
 class OrbitUtils:
@@ -317,6 +261,108 @@ class OrbitUtils:
 
         return pred_ra, pred_dec
 
+    def get_orbit_state(self):
+        """
+        Get the barycentric ecliptic state of the fitted orbit and its covariance.
+
+        Returns
+        -------
+        state: numpy ndarray
+            The position (AU) and velocity (AU/yr) of the object at ``jd0``.
+
+        cov: numpy ndarray
+            The 6 x 6 covariance matrix of the state.
+
+        jd0: float
+            The Julian date of the state.
+        """
+
+        xyz = self.orbit.orbit_xyz
+        state = np.array([xyz.x, xyz.y, xyz.z, xyz.xdot, xyz.ydot, xyz.zdot])
+        return state, np.array(self.orbit.covar_xyz), xyz.jd0
+
+    def sample_ephemeris(self, dates, n_samples, obs_location=PYORBFIT_LOCATION, seed=None):
+        """
+        Predict the positions of orbits sampled from the fitted orbit's
+        uncertainty for many dates in a single vectorized call.
+
+        Parameters
+        ----------
+        dates: numpy array
+            The dates in MJD for predicted observations.
+
+        n_samples: int
+            The number of orbits to sample.
+
+        obs_location: astropy EarthLocation, default=PYORBFIT_LOCATION
+            The location of the observatory (by default Cerro Tololo as in
+            ``get_ephemeris``). If None the geocenter is used.
+
+        seed: int, default=None
+            The seed for the random samples.
+
+        Returns
+        -------
+        sample_ra: numpy ndarray
+            A (n_samples, num_dates) array of predicted ra coordinates in degrees.
+
+        sample_dec: numpy ndarray
+            A (n_samples, num_dates) array of predicted dec coordinates in degrees.
+        """
+
+        state, cov, jd0 = self.get_orbit_state()
+        rng = np.random.default_rng(seed)
+        states = rng.multivariate_normal(state, cov, size=n_samples)
+        return predict_radec(states, jd0, dates, observer_positions(dates, obs_location))
+
+    def predict_ephemeris(self, dates, n_samples=0, obs_location=PYORBFIT_LOCATION, seed=None):
+        """
+        Predict the locations of the object for many dates at once by propagating
+        the fitted barycentric orbit. The uncertainties are the scatter of the
+        predictions for orbits sampled from the fit's covariance.
+
+        Parameters
+        ----------
+        dates: numpy array
+            The dates in MJD for predicted observations.
+
+        n_samples: int, default=0
+            The number of orbits to sample for the uncertainties. If 0 the
+            uncertainties are not computed.
+
+        obs_location: astropy EarthLocation, default=PYORBFIT_LOCATION
+            The location of the observatory (by default Cerro Tololo as in
+            ``get_ephemeris``). If None the geocenter is used.
+
+        seed: int, default=None
+            The seed for the random samples.
+
+        Returns
+        -------
+        pred_ra: numpy array
+            The predicted ra coordinates in degrees.
+
+        pred_dec: numpy array
+            The predicted dec coordinates in degrees.
+
+        ra_err: numpy array or None
+            The uncertainty of the ra coordinates (times cos(dec)) in arcseconds.
+
+        dec_err: numpy array or None
+            The uncertainty of the dec coordinates in arcseconds.
+        """
+
+        state, _, jd0 = self.get_orbit_state()
+        pred_ra, pred_dec = predict_radec(state, jd0, dates, observer_positions(dates, obs_location))
+        if n_samples <= 0:
+            return pred_ra, pred_dec, None, None
+
+        sample_ra, sample_dec = self.sample_ephemeris(dates, n_samples, obs_location, seed)
+        d_ra = (sample_ra - pred_ra + 180.0) % 360.0 - 180.0
+        ra_err = 3600.0 * np.std(d_ra, axis=0) * np.cos(np.radians(pred_dec))
+        dec_err = 3600.0 * np.std(sample_dec - pred_dec, axis=0)
+        return pred_ra, pred_dec, ra_err, dec_err
+
     def get_pq(self, return_cov=False):
         """
         Return perihelion (p) and aphelion (q). Return errors for both
@@ -513,7 +559,7 @@ class OrbitUtils:
         else:
             return elements, errs, self.orbit.covar_xyz
 
-    def predict_pixels(self, image_filename, obs_dates):
+    def predict_pixels(self, image_filename, obs_dates, obs_location=PYORBFIT_LOCATION):
         """
         Predict the pixels locations of the object in available data.
 
@@ -527,6 +573,10 @@ class OrbitUtils:
             An array with times in MJD to predict the pixel locations
             of the object in the given image.
 
+        obs_location: astropy EarthLocation, default=PYORBFIT_LOCATION
+            The location of the observatory (by default Cerro Tololo as in
+            ``get_ephemeris``). If None the geocenter is used.
+
         Returns
         -------
         x_pix: numpy array
@@ -541,13 +591,13 @@ class OrbitUtils:
         new_image = fits.open(image_filename)
         new_wcs = WCS(new_image[1].header)
 
-        pred_ra, pred_dec = self.get_ephemeris(obs_dates)
+        pred_ra, pred_dec, _, _ = self.predict_ephemeris(obs_dates, obs_location=obs_location)
 
         x_pix, y_pix = new_wcs.all_world2pix(pred_ra, pred_dec, 1)
 
         return x_pix, y_pix
 
-    def plot_predicted_ra_dec(self, date_range, include_kbmod_obs=True):
+    def plot_predicted_ra_dec(self, date_range, include_kbmod_obs=True, obs_location=PYORBFIT_LOCATION):
         """
         Take in results of B&K predictions along with errors and plot predicted path
         of objects.
@@ -561,6 +611,10 @@ class OrbitUtils:
             If true the plot will include the observations used in the
             KBMOD search.
 
+        obs_location: astropy EarthLocation, default=PYORBFIT_LOCATION
+            The location of the observatory (by default Cerro Tololo as in
+            ``get_ephemeris``). If None the geocenter is used.
+
         Returns
         -------
         fig: matplotlib figure
@@ -568,7 +622,7 @@ class OrbitUtils:
             ra, dec space color-coded by time of observation.
         """
 
-        pred_ra, pred_dec = self.get_ephemeris(date_range)
+        pred_ra, pred_dec, _, _ = self.predict_ephemeris(date_range, obs_location=obs_location)
 
         fig = plt.figure()
         plt.scatter(pred_ra, pred_dec, c=date_range)
@@ -639,6 +693,8 @@ class OrbitUtils:
             dist_mean, dist_covar, [element_1, element_2], n_samples=n_samples, fig=fig
         )
 
+        return fig
+
     def plot_pq_uncertainty(self, n_samples=10000, fig=None):
         """
         Plot the perihelion and aphelion elements and associated 1,2,3-sigma ellipses
@@ -8,6 +8,7 @@ import tensorflow as tf
 from IPython.display import clear_output, display
 
 from kbmod.analysis.create_stamps import *
+from kbmod.result_table import load_result_table, select_patch
 
 
 class VisualizeResults:
@@ -85,7 +86,14 @@ class VisualizeResults:
         print("There are {} results".format(len(x_loc[mask])))
 
     def recover_known_objects(
-        self, results_dir_format, im_dir_format, known_object_data_path, cutoff=0.75, suffix="XSEDE"
+        self,
+        results_dir_format,
+        im_dir_format,
+        known_object_data_path,
+        cutoff=0.75,
+        suffix="XSEDE",
+        num_workers=1,
+        cache_file=None,
     ):
         with open(known_object_data_path, "rb") as f:
             allObjectData = pickle.load(f)
@@ -96,6 +104,12 @@ class VisualizeResults:
             if (key != "legend") and (int(key[2:5]) > 100):
                 known_data.append(np.array([int(key[2:5]), int(key[9:])]))
 
+        # Parse the results of all the patches at once.
+        result_dirs = {}
+        for pg_num, ccd_num in known_data:
+            result_dirs[known_format.format(pg_num, ccd_num)] = results_dir_format.format(pg_num, ccd_num)
+        result_table = load_result_table(result_dirs, suffix, num_workers=num_workers, cache_file=cache_file)
+
         all_good_idx = []
         num_found_objects = 0
         found_objects = {}
@@ -126,17 +140,11 @@ class VisualizeResults:
                 v_array = allObjectData[object_key][2]
                 v_mag.append(allObjectData[object_key][1])
                 times_list = stamper.load_times(times_filename)
-                (
-                    keep_idx,
-                    results,
-                    stamper,
-                    stamps,
-                    all_stamps,
-                    lc_list,
-                    psi_list,
-                    phi_list,
-                    lc_index,
-                ) = load_stamps(results_dir, im_dir, suffix)
+                rows = select_patch(result_table, object_key)
+                results = rows[["lh", "flux", "x", "y", "vx", "vy", "num_obs"]].as_array()
+                stamps = np.asarray(rows["stamp"])
+                lc_list = np.asarray(rows["lc"])
+                lc_index = np.asarray(rows["valid"])
                 all_coadd_stamps.append(stamps)
             except Exception as e:
                 exception_list.append(e)
@@ -160,10 +168,7 @@ class VisualizeResults:
             for idx in good_idx:
                 good_coadd_stamps.append(stamps[idx])
 
-            if np.count_nonzero(results) != 0:
-                if len(lc_list) == 1:
-                    results = np.array([results])
-
+            if len(results) != 0:
                 stamps_fig, object_found, found_idx = stamper.target_results(
                     np.array(results)[good_idx],
                     np.array(lc_list)[good_idx],
@@ -3,14 +3,13 @@ import os
 import time
 
 import numpy as np
-from scipy.special import erfinv  # import mpmath
 
 import kbmod.search as kb
 
 from .file_utils import *
-from .filters.clustering_filters import DBSCANFilter
 from .filters.stats_filters import *
 from .image_info import *
+from .packed_stack import is_packed_stack, load_packed_stack
 from .result_list import ResultList, ResultRow
 
 
@@ -30,13 +29,18 @@ class Interface:
         mjd_lims,
         default_psf,
         verbose=False,
+        lazy=False,
+        region=None,
     ):
         """This function loads images and ingests them into a search object.
 
         Parameters
         ----------
         im_filepath : string
-            Image file path from which to load images.
+            Image file path from which to load images. This can also be a
+            packed stack file (see ``kbmod.packed_stack``), which already
+            includes the times and PSFs, so ``time_file``, ``psf_file``,
+            and ``default_psf`` are not used.
         time_file : string
             File name containing image times.
         psf_file : string
@@ -49,6 +53,13 @@ class Interface:
             The default PSF in case no image-specific PSF is provided.
         verbose : bool
             Use verbose output (mainly for debugging).
+        lazy : bool
+            Only read the headers of the FITS files. The image layers are
+            read from the files the first time they are used.
+        region : tuple, optional
+            Only read the pixels (x_min, x_max, y_min, y_max) of each FITS file.
+            The pixel positions within the loaded images are offset by
+            (x_min, y_min) from those in the files.
 
         Returns
         -------
@@ -61,6 +72,9 @@ class Interface:
         print("Loading Images")
         print("---------------------------------------")
 
+        if is_packed_stack(im_filepath):
+            return load_packed_stack(im_filepath, mjd_lims, region)
+
         # Load a mapping from visit numbers to the visit times. This dictionary stays
         # empty if no time file is specified.
         image_time_dict = FileUtils.load_time_dictionary(time_file)
@@ -129,7 +143,11 @@ class Interface:
             # Load the image file and set its time.
             if verbose:
                 print(f"Loading file: {full_file_path}")
-            img = kb.layered_image(full_file_path, psf)
+            img = kb.layered_image(full_file_path, psf, lazy or region is not None)
+            if region is not None:
+                img.set_region(*region)
+                if not lazy:
+                    img.load_layers()
             img.set_time(time_stamp)
 
             # Save the file, time, and image information.
@@ -262,6 +280,11 @@ class PostProcess:
         while likelihood_limit is False:
             print("Getting results...")
             results = search.get_results(res_num, chunk_size)
+            if len(results) == 0:
+                break
+
+            # Many results share a velocity, so precompute the offsets of each velocity once.
+            search.build_trajectory_offsets(results)
             print("---------------------------------------")
             print("Chunk Start = %i" % res_num)
             print("Chunk Max Likelihood = %.2f" % results[0].lh)
@@ -294,6 +317,11 @@ class PostProcess:
 
                 # Add the results to the final set.
                 keep.extend(result_batch)
+
+            # A short chunk is the last one (for example when the results were restored
+            # from a checkpoint that only kept the results above lh_level).
+            if len(results) < chunk_size:
+                break
             res_num += chunk_size
         return keep
 
@@ -371,6 +399,9 @@ class PostProcess:
         return coeff
 
     def _invert_Gaussian_CDF(self, z):
+        # Import scipy only when needed to keep the package import fast.
+        from scipy.special import erfinv  # import mpmath
+
         if z < 0.5:
             sign = -1
         else:
@@ -558,6 +589,9 @@ class PostProcess:
             return
         print("Clustering %i results" % result_list.num_results(), flush=True)
 
+        # Import the clustering filter (and sklearn) only when needed.
+        from .filters.clustering_filters import DBSCANFilter
+
         # Do the clustering and the filtering.
         f = DBSCANFilter(
             self.cluster_type,
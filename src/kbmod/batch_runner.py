@@ -0,0 +1,502 @@
+"""Run ``run_search`` over many patches (such as the pointing groups and CCDs
+of a survey) on a single node.
+
+Each patch is given by a dictionary with a unique "name" and the configuration
+parameters that differ from the base configuration (typically ``im_filepath``,
+``res_filepath``, and ``output_suffix``). The ``BatchRunner`` searches the patches
+in a pool of worker processes, retries the ones that fail, and appends one
+JSON record per attempt to a record file, so an interrupted batch can be
+restarted and skip the patches that already finished. Alternatively,
+``run_pipelined`` searches the patches in the current process while loading
+the next patches and saving the previous ones in the background.
+"""
+
+import json
+import multiprocessing as mp
+import os
+import queue
+import resource
+import threading
+import time
+import traceback
+from multiprocessing.connection import wait
+
+from .configuration import KBMODConfig
+
+
+def make_patch_manifest(im_dir_format, res_dir_format, patches, name_format="pg{:03d}_ccd{:02d}"):
+    """Create the manifest for a set of patches that follow a directory naming scheme.
+
+    Parameters
+    ----------
+    im_dir_format : str
+        The format string for a patch's image directory, such as "/data/{}/images".
+        It is filled in with the values of the patch's tuple.
+    res_dir_format : str
+        The format string for a patch's results directory.
+    patches : list of tuple
+        The values (such as the pointing group and CCD numbers) identifying each patch.
+    name_format : str
+        The format string for a patch's name, which is also used as its output suffix.
+
+    Returns
+    -------
+    manifest : list of dict
+        One dictionary of parameters per patch.
+    """
+    manifest = []
+    for values in patches:
+        name = name_format.format(*values)
+        manifest.append(
+            {
+                "name": name,
+                "im_filepath": im_dir_format.format(*values),
+                "res_filepath": res_dir_format.format(*values),
+                "output_suffix": name,
+            }
+        )
+    return manifest
+
+
+def load_manifest(filename):
+    """Load a manifest with one JSON dictionary of parameters per line.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the manifest file.
+
+    Returns
+    -------
+    manifest : list of dict
+        One dictionary of parameters per patch.
+    """
+    with open(filename, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_manifest(manifest, filename):
+    """Save a manifest with one JSON dictionary of parameters per line.
+
+    Parameters
+    ----------
+    manifest : list of dict
+        One dictionary of parameters per patch.
+    filename : str
+        The name of the manifest file.
+    """
+    with open(filename, "w") as f:
+        for patch in manifest:
+            f.write(json.dumps(patch) + "\n")
+
+
+def run_patch(params):
+    """Run the search for one patch. This is the default work function of
+    the ``BatchRunner``.
+
+    Parameters
+    ----------
+    params : dict
+        The full set of configuration parameters for the patch.
+
+    Returns
+    -------
+    summary : dict
+        The number of results ("num_results"), the time of each top level stage
+        ("timings"), and the peak memory of the process ("peak_rss_mb").
+    """
+    # Import the search in the worker process, so the parent never initializes the GPU.
+    from .run_search import run_search
+
+    rs = run_search(params)
+    keep = rs.run_search()
+    return _summarize_patch(rs, keep)
+
+
+def _summarize_patch(rs, keep):
+    """Summarize a finished search from its instrumentation records.
+
+    Parameters
+    ----------
+    rs : ``kbmod.run_search.run_search``
+        The search object.
+    keep : ``kbmod.result_list.ResultList``
+        The results.
+
+    Returns
+    -------
+    summary : dict
+        The number of results ("num_results"), the time of each top level stage
+        ("timings"), and the peak memory of the process ("peak_rss_mb").
+    """
+    timings = {}
+    for span in rs.instrumentation.spans:
+        if span.depth == 0:
+            timings[span.name] = timings.get(span.name, 0.0) + span.duration
+    peak_rss = max(
+        [s.peak_rss_mb for s in rs.instrumentation.spans if s.peak_rss_mb is not None], default=None
+    )
+    return {"num_results": keep.num_results(), "timings": timings, "peak_rss_mb": peak_rss}
+
+
+def _check_names(manifest):
+    """Check that every patch in the manifest has a unique name.
+
+    Parameters
+    ----------
+    manifest : list of dict
+        One dictionary of parameters per patch.
+
+    Raises
+    ------
+    Raises a ``ValueError`` if the patch names are missing or not unique.
+    """
+    names = [patch.get("name") for patch in manifest]
+    if None in names or len(set(names)) != len(names):
+        raise ValueError("Each patch in the manifest needs a unique name.")
+
+
+def _get_base_params(base_config):
+    """Get the base parameters as a dictionary from a ``KBMODConfig`` or dictionary."""
+    if isinstance(base_config, KBMODConfig):
+        return dict(base_config._params)
+    return dict(base_config)
+
+
+def run_pipelined(
+    base_config, manifest, prefetch=1, max_pending_writes=2, prepare_psi_phi=False, record_file=None
+):
+    """Search the patches one after the other in the current process, overlapping
+    the I/O of neighboring patches with the search.
+
+    A loader thread loads and masks the images of the next patches (and optionally
+    generates their psi/phi images) while the current patch is searched and
+    filtered, and a writer thread saves the results of the previous patches. The
+    search releases the GIL while it runs on the GPU, so the threads can make progress
+    at the same time. Both hand-offs use bounded queues, so at most ``prefetch``
+    loaded stacks and ``max_pending_writes`` result sets wait in memory at a time.
+
+    Parameters
+    ----------
+    base_config : ``KBMODConfig`` or dict
+        The parameters shared by all the patches.
+    manifest : list of dict
+        One dictionary of parameters per patch. Each dictionary must have a unique "name".
+    prefetch : int
+        The maximum number of loaded patches waiting to be searched.
+    max_pending_writes : int
+        The maximum number of searched patches waiting to be saved.
+    prepare_psi_phi : bool
+        Generate the psi/phi images in the loader thread.
+    record_file : str, optional
+        The JSON lines file to which a record is appended as each patch finishes.
+
+    Returns
+    -------
+    records : list of dict
+        The record of each patch in the order of the manifest.
+
+    Raises
+    ------
+    Raises a ``ValueError`` if a queue size is invalid or the patch names are
+    missing or not unique.
+    """
+    import kbmod.search as kb
+
+    from .run_search import run_search
+
+    if prefetch < 1 or max_pending_writes < 1:
+        raise ValueError("The queue sizes must be at least 1.")
+    _check_names(manifest)
+    base_params = _get_base_params(base_config)
+
+    records = {}
+    records_lock = threading.Lock()
+
+    def add_record(patch, start, outcome):
+        record = {"name": patch["name"], "attempt": 1, "seconds": time.time() - start, **outcome}
+        with records_lock:
+            records[patch["name"]] = record
+            if record_file is not None:
+                with open(record_file, "a") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+        print(f"Patch {patch['name']} finished with status {record['status']}.", flush=True)
+
+    def failure(e):
+        return {"status": "failed", "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+
+    load_queue = queue.Queue(maxsize=prefetch)
+    write_queue = queue.Queue(maxsize=max_pending_writes)
+
+    def loader():
+        for patch in manifest:
+            start = time.time()
+            try:
+                rs = run_search({**base_params, **{k: v for k, v in patch.items() if k != "name"}})
+                loaded = rs.load_and_mask_images()
+                search = None
+                if prepare_psi_phi:
+                    search = kb.stack_search(loaded[0])
+                    with rs.instrumentation.span("psi_phi"):
+                        search.prepare_psi_phi()
+                load_queue.put((patch, start, rs, loaded, search))
+            except Exception as e:
+                add_record(patch, start, failure(e))
+        load_queue.put(None)
+
+    def writer():
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            patch, start, rs, keep = item
+            try:
+                rs.save_results(keep)
+                add_record(patch, start, {"status": "success", **_summarize_patch(rs, keep)})
+            except Exception as e:
+                add_record(patch, start, failure(e))
+
+    threads = [threading.Thread(target=loader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    while True:
+        item = load_queue.get()
+        if item is None:
+            break
+        patch, start, rs, loaded, search = item
+        try:
+            keep = rs.run_search(loaded_images=loaded, search=search, save=False)
+        except Exception as e:
+            add_record(patch, start, failure(e))
+            continue
+        # Release the images before waiting for the writer.
+        del loaded, search
+        write_queue.put((patch, start, rs, keep))
+    write_queue.put(None)
+
+    for thread in threads:
+        thread.join()
+    return [records[patch["name"]] for patch in manifest if patch["name"] in records]
+
+
+def _worker_main(work_function, params, max_memory_mb, conn):
+    """The entry point of a worker process. Runs one patch and sends the outcome
+    back through a pipe.
+
+    Parameters
+    ----------
+    work_function : function
+        The function to run on the patch's parameters.
+    params : dict
+        The full set of configuration parameters for the patch.
+    max_memory_mb : int
+        The memory limit of the process in MB (or None for no limit).
+    conn : multiprocessing.connection.Connection
+        The pipe on which to send the outcome.
+    """
+    if max_memory_mb is not None:
+        # Limit the heap (RLIMIT_DATA) instead of the address space (RLIMIT_AS), because
+        # the GPU driver reserves a large range of virtual addresses without using it.
+        limit = int(max_memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+    try:
+        conn.send({"status": "success", **work_function(params)})
+    except BaseException as e:
+        conn.send(
+            {"status": "failed", "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+        )
+    finally:
+        conn.close()
+
+
+def summarize_timings(records):
+    """Aggregate the stage timings of the successful records.
+
+    Parameters
+    ----------
+    records : list of dict
+        The completion records from ``BatchRunner.run``.
+
+    Returns
+    -------
+    summary : dict
+        A dictionary mapping each stage (and "total" for the full patch) to a dictionary
+        with the number of patches ("count") and the "total", "mean", and "max" seconds.
+    """
+    values = {}
+    for record in records:
+        if record["status"] != "success":
+            continue
+        for stage, seconds in list(record.get("timings", {}).items()) + [("total", record["seconds"])]:
+            values.setdefault(stage, []).append(seconds)
+
+    summary = {}
+    for stage, times in values.items():
+        summary[stage] = {
+            "count": len(times),
+            "total": sum(times),
+            "mean": sum(times) / len(times),
+            "max": max(times),
+        }
+    return summary
+
+
+class BatchRunner:
+    """Searches many patches in a pool of worker processes.
+
+    Each attempt of each patch runs in a new process (started with "spawn"), so
+    that the GPU memory and the memory limit apply to one patch at a time and a
+    crash only affects that patch.
+
+    Parameters
+    ----------
+    base_config : ``KBMODConfig`` or dict
+        The parameters shared by all the patches.
+    num_workers : int
+        The number of patches to run at the same time.
+    max_memory_mb : int, optional
+        The memory limit of each worker process in MB.
+    max_retries : int
+        The number of times to retry a failed patch.
+    timeout : float, optional
+        The maximum number of seconds for one attempt. Workers that take longer are
+        terminated and the attempt counts as a failure.
+    record_file : str, optional
+        The JSON lines file to which a record is appended as each attempt finishes.
+    work_function : function, optional
+        The function run on each patch's parameters. Must be importable by the worker
+        processes and return a dictionary. Defaults to ``run_patch``.
+
+    Attributes
+    ----------
+    records : list of dict
+        The records of all the attempts of the most recent ``run``.
+    """
+
+    def __init__(
+        self,
+        base_config,
+        num_workers=1,
+        max_memory_mb=None,
+        max_retries=1,
+        timeout=None,
+        record_file=None,
+        work_function=run_patch,
+    ):
+        if num_workers < 1:
+            raise ValueError(f"Invalid number of workers {num_workers}.")
+        if max_retries < 0:
+            raise ValueError(f"Invalid number of retries {max_retries}.")
+
+        self.base_params = _get_base_params(base_config)
+        self.num_workers = num_workers
+        self.max_memory_mb = max_memory_mb
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.record_file = record_file
+        self.work_function = work_function
+        self.records = []
+
+    def completed_patches(self):
+        """Get the names of the patches that finished successfully according
+        to the record file.
+
+        Returns
+        -------
+        names : set of str
+            The names of the patches.
+        """
+        if self.record_file is None or not os.path.isfile(self.record_file):
+            return set()
+        with open(self.record_file, "r") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return set(r["name"] for r in records if r["status"] == "success")
+
+    def run(self, manifest, skip_completed=True):
+        """Search all the patches in the manifest.
+
+        Parameters
+        ----------
+        manifest : list of dict
+            One dictionary of parameters per patch. Each dictionary must have a unique "name".
+        skip_completed : bool
+            Skip the patches that already have a successful record in the record file.
+
+        Returns
+        -------
+        records : list of dict
+            The final record of each patch that was run.
+
+        Raises
+        ------
+        Raises a ``ValueError`` if the patch names are missing or not unique.
+        """
+        _check_names(manifest)
+        done = self.completed_patches() if skip_completed else set()
+        if len(done) > 0:
+            print(f"Skipping {len(done)} completed patches.")
+        pending = [(patch, 1) for patch in manifest if patch["name"] not in done]
+
+        context = mp.get_context("spawn")
+        running = {}
+        final = {}
+        self.records = []
+        while len(pending) > 0 or len(running) > 0:
+            # Start new workers while there are free slots.
+            while len(pending) > 0 and len(running) < self.num_workers:
+                patch, attempt = pending.pop(0)
+                params = {**self.base_params, **{k: v for k, v in patch.items() if k != "name"}}
+                recv_conn, send_conn = context.Pipe(duplex=False)
+                proc = context.Process(
+                    target=_worker_main, args=(self.work_function, params, self.max_memory_mb, send_conn)
+                )
+                proc.start()
+                send_conn.close()
+                running[recv_conn] = (proc, patch, attempt, time.time())
+
+            # Wait for a worker to send its outcome or exit (or the next timeout check). The
+            # pipe becomes readable in both cases, since the parent closed its sending end.
+            ready = wait(list(running.keys()), timeout=1.0 if self.timeout is not None else None)
+
+            for recv_conn in list(running.keys()):
+                proc, patch, attempt, start = running[recv_conn]
+                if recv_conn in ready:
+                    try:
+                        outcome = recv_conn.recv()
+                    except EOFError:
+                        # The worker died without sending anything.
+                        proc.join()
+                        outcome = {"status": "failed", "error": f"Worker exited with code {proc.exitcode}."}
+                elif self.timeout is not None and time.time() - start > self.timeout:
+                    proc.terminate()
+                    outcome = {"status": "failed", "error": f"Timed out after {self.timeout} seconds."}
+                else:
+                    continue
+                proc.join()
+                recv_conn.close()
+                del running[recv_conn]
+
+                record = {
+                    "name": patch["name"],
+                    "attempt": attempt,
+                    "seconds": time.time() - start,
+                    **outcome,
+                }
+                self._add_record(record)
+                if record["status"] != "success" and attempt <= self.max_retries:
+                    print(f"Patch {patch['name']} failed ({record['error']}), retrying.", flush=True)
+                    pending.append((patch, attempt + 1))
+                else:
+                    print(f"Patch {patch['name']} finished with status {record['status']}.", flush=True)
+                    final[patch["name"]] = record
+
+        return [final[patch["name"]] for patch in manifest if patch["name"] in final]
+
+    def _add_record(self, record):
+        """Save a record and append it to the record file."""
+        self.records.append(record)
+        if self.record_file is not None:
+            with open(self.record_file, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
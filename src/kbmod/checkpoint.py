@@ -0,0 +1,268 @@
+"""Checkpoints for resuming an interrupted KBMOD run.
+
+The output of each expensive stage of ``run_search`` is saved to the results
+directory together with a hash of the configuration parameters (and input
+files) that it depends on. When the search is rerun, it resumes after the last
+stage whose checkpoint is still valid. Since the hash of each stage includes
+the parameters of all the stages before it, a configuration change only
+invalidates the stages that are downstream of the changed parameter.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+import kbmod.search as kb
+
+# The checkpointed stages in the order they are run.
+CHECKPOINT_STAGES = ["search", "retrieve", "filter", "cluster", "stamps"]
+
+# The configuration parameters used by each stage after the search. The search
+# stage uses every parameter that is not listed here or in _IGNORED_PARAMS.
+_STAGE_PARAMS = {
+    "retrieve": ["chunk_size", "clip_negative", "max_lh", "sigmaG_lims"],
+    "filter": ["center_thresh", "do_stamp_filter", "mom_lims", "peak_offset", "stamp_radius", "stamp_type"],
+    "cluster": ["cluster_function", "cluster_type", "do_clustering", "eps"],
+    "stamps": [],
+}
+
+# The parameters that do not change the results.
+_IGNORED_PARAMS = [
+    "checkpoint",
+    "debug",
+    "known_obj_file",
+    "known_obj_jpl",
+    "known_obj_obs",
+    "known_obj_thresh",
+    "num_cores",
+    "output_suffix",
+    "release_layers",
+    "res_filepath",
+    "timing_format",
+]
+
+# The fields used to save the trajectories.
+_TRAJECTORY_FIELDS = [
+    ("x", np.int16),
+    ("y", np.int16),
+    ("x_v", np.float32),
+    ("y_v", np.float32),
+    ("lh", np.float32),
+    ("flux", np.float32),
+    ("obs_count", np.int16),
+    ("bary_index", np.int16),
+]
+
+
+def trajectories_to_array(trajectories):
+    """Pack a list of trajectories into a numpy structured array.
+
+    Parameters
+    ----------
+    trajectories : list of ``kbmod.search.trajectory`` or numpy.ndarray
+        The trajectories, either as objects or as an array of ``kbmod.search.trajectory_dtype``.
+
+    Returns
+    -------
+    arr : numpy.ndarray
+        A structured array with one entry per trajectory.
+    """
+    if not isinstance(trajectories, np.ndarray):
+        trajectories = kb.trajectory_array(list(trajectories))
+    arr = np.empty(len(trajectories), dtype=_TRAJECTORY_FIELDS)
+    for name, _ in _TRAJECTORY_FIELDS:
+        arr[name] = trajectories[name]
+    return arr
+
+
+def array_to_trajectories(arr):
+    """Unpack a numpy structured array into a list of trajectories.
+
+    Parameters
+    ----------
+    arr : numpy.ndarray
+        A structured array created by ``trajectories_to_array``.
+
+    Returns
+    -------
+    trajectories : list of ``kbmod.search.trajectory``
+        The trajectories.
+    """
+    packed = np.zeros(len(arr), dtype=kb.trajectory_dtype)
+    for name, _ in _TRAJECTORY_FIELDS:
+        packed[name] = arr[name]
+    return kb.trajectory_list(packed)
+
+
+def _file_fingerprint(path):
+    """Describe the files at a path by their names, sizes, and modification times.
+
+    Parameters
+    ----------
+    path : str
+        A file or directory (or None).
+
+    Returns
+    -------
+    fingerprint : list
+        One (name, size, modification time) entry per file.
+    """
+    if path is None or not os.path.exists(path):
+        return []
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    return [(os.path.basename(f), os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in files]
+
+
+class PipelineCheckpoints:
+    """Saves and loads the checkpoints for one run of the pipeline.
+
+    Parameters
+    ----------
+    config : ``KBMODConfig``
+        The configuration of the run.
+    directory : str
+        The directory in which to save the checkpoints. If ``None`` the
+        checkpoints are disabled: nothing is saved and nothing is loaded.
+    suffix : str
+        The suffix to append to the checkpoint file names.
+    """
+
+    def __init__(self, config, directory, suffix):
+        self.directory = directory
+        self.suffix = suffix
+        self.keys = {}
+        self.resume_stage = None
+        self.resume_data = None
+        if not self.enabled:
+            return
+
+        # Compute the key of each stage from its parameters and the key of the stage before it.
+        # The search checkpoint only keeps the results above ``lh_level``, so that parameter
+        # is part of the search key. The sigmaG limits change the search if filtering on the GPU.
+        downstream = set(name for names in _STAGE_PARAMS.values() for name in names)
+        search_params = [
+            key for key in config._params if key not in _IGNORED_PARAMS and key not in downstream
+        ]
+        if config["gpu_filter"]:
+            search_params.append("sigmaG_lims")
+
+        previous = ""
+        for stage in CHECKPOINT_STAGES:
+            names = search_params if stage == "search" else _STAGE_PARAMS[stage]
+            values = {name: config[name] for name in sorted(set(names))}
+            if stage == "search":
+                values["input_files"] = [
+                    _file_fingerprint(config[name]) for name in ["im_filepath", "time_file", "psf_file"]
+                ]
+            encoded = json.dumps([previous, values], sort_keys=True, default=str)
+            self.keys[stage] = hashlib.sha256(encoded.encode()).hexdigest()
+            previous = self.keys[stage]
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def filename(self, stage):
+        """Get the name of a stage's checkpoint file.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+
+        Returns
+        -------
+        filename : str
+            The path and name of the file.
+        """
+        return os.path.join(self.directory, f"checkpoint_{stage}_{self.suffix}.pkl")
+
+    def save(self, stage, data):
+        """Save the output of a stage (if checkpoints are enabled).
+
+        The data is written to a temporary file that is then renamed, so a run
+        that dies while saving does not leave a partial checkpoint.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+        data : object
+            The (picklable) output of the stage.
+        """
+        if not self.enabled:
+            return
+
+        filename = self.filename(stage)
+        with open(filename + ".tmp", "wb") as f:
+            pickle.dump({"stage": stage, "key": self.keys[stage], "data": data}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(filename + ".tmp", filename)
+
+    def load(self, stage):
+        """Load the output of a stage if it has a valid checkpoint.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+
+        Returns
+        -------
+        data : object
+            The output of the stage or ``None`` if there is no valid checkpoint.
+        """
+        if not self.enabled or not os.path.isfile(self.filename(stage)):
+            return None
+
+        try:
+            with open(self.filename(stage), "rb") as f:
+                saved = pickle.load(f)
+        except (EOFError, pickle.UnpicklingError):
+            return None
+
+        if saved.get("key") != self.keys[stage]:
+            return None
+        return saved["data"]
+
+    def completed(self, stage):
+        """Check whether a stage can be skipped because it (or a later stage)
+        was loaded from a checkpoint by ``find_resume_point``.
+
+        Parameters
+        ----------
+        stage : str
+            The name of the stage.
+
+        Returns
+        -------
+        result : bool
+            True if the stage can be skipped.
+        """
+        if self.resume_stage is None:
+            return False
+        return CHECKPOINT_STAGES.index(stage) <= CHECKPOINT_STAGES.index(self.resume_stage)
+
+    def find_resume_point(self):
+        """Find the last stage with a valid checkpoint. The result is also
+        stored in the ``resume_stage`` and ``resume_data`` attributes.
+
+        Returns
+        -------
+        stage : str
+            The name of the stage or ``None`` if no stage has a valid checkpoint.
+        data : object
+            The output of the stage or ``None``.
+        """
+        for stage in reversed(CHECKPOINT_STAGES):
+            data = self.load(stage)
+            if data is not None:
+                self.resume_stage = stage
+                self.resume_data = data
+                return stage, data
+        return None, None
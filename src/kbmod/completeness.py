@@ -0,0 +1,266 @@
+"""Measure the completeness of a search with injected fake objects.
+
+An ``InjectionRecovery`` run loads and masks the images once, then for each
+bin of a population grid (flux x velocity x angle) injects a set of fake
+objects into a copy of the stack, runs the standard search pipeline on it,
+and matches the recovered results to the injected trajectories. Since the
+injected objects only change the science layers, the phi images of the
+uninjected stack are computed once and reused by every search.
+"""
+
+import itertools
+import time
+
+import numpy as np
+
+import kbmod.search as kb
+
+from .run_search import run_search
+
+
+def make_injection_grid(fluxes, velocities, angles, zero_point=None):
+    """Create the bins of a population grid.
+
+    Parameters
+    ----------
+    fluxes : list of float
+        The fluxes of the objects (or their magnitudes if ``zero_point`` is given).
+    velocities : list of float
+        The speeds of the objects in pixels per day.
+    angles : list of float
+        The angles of the objects' motion in radians.
+    zero_point : float, optional
+        The magnitude zero point used to convert the magnitudes to fluxes.
+
+    Returns
+    -------
+    bins : list of dict
+        One dictionary with the ``flux``, ``velocity``, and ``angle`` (and the
+        ``magnitude`` if ``zero_point`` is given) of each bin.
+    """
+    bins = []
+    for f, v, a in itertools.product(fluxes, velocities, angles):
+        if zero_point is None:
+            bins.append({"flux": float(f), "velocity": float(v), "angle": float(a)})
+        else:
+            flux = 10.0 ** (-0.4 * (f - zero_point))
+            bins.append({"magnitude": float(f), "flux": flux, "velocity": float(v), "angle": float(a)})
+    return bins
+
+
+def make_fake_trajectories(num, flux, velocity, angle, width, height, duration, margin=10, rng=None):
+    """Create trajectories with random starting pixels that stay within the images.
+
+    Parameters
+    ----------
+    num : int
+        The number of trajectories.
+    flux : float
+        The flux of the objects.
+    velocity : float
+        The speed of the objects in pixels per day.
+    angle : float
+        The angle of the objects' motion in radians.
+    width : int
+        The width of the images in pixels.
+    height : int
+        The height of the images in pixels.
+    duration : float
+        The time between the first and last images in days.
+    margin : int
+        The minimum distance (in pixels) between the objects and the image edges.
+    rng : ``numpy.random.Generator``, optional
+        The random number generator.
+
+    Returns
+    -------
+    trjs : list of trajectory
+        The trajectories.
+
+    Raises
+    ------
+    Raises a ``ValueError`` if the objects cannot stay within the images.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    x_v = velocity * np.cos(angle)
+    y_v = velocity * np.sin(angle)
+
+    # The range of starting pixels where both the start and end points are inside the margins.
+    x_lims = (margin + max(0.0, -x_v * duration), width - margin - max(0.0, x_v * duration))
+    y_lims = (margin + max(0.0, -y_v * duration), height - margin - max(0.0, y_v * duration))
+    if x_lims[0] >= x_lims[1] or y_lims[0] >= y_lims[1]:
+        raise ValueError(f"Objects with velocity ({x_v}, {y_v}) do not stay in the images.")
+
+    xs = rng.integers(int(np.ceil(x_lims[0])), int(np.floor(x_lims[1])) + 1, size=num)
+    ys = rng.integers(int(np.ceil(y_lims[0])), int(np.floor(y_lims[1])) + 1, size=num)
+
+    trjs = []
+    for x, y in zip(xs, ys):
+        trj = kb.trajectory()
+        trj.x = int(x)
+        trj.y = int(y)
+        trj.x_v = x_v
+        trj.y_v = y_v
+        trj.flux = flux
+        trjs.append(trj)
+    return trjs
+
+
+def _trajectory_arrays(trjs):
+    """Get the (x, y, x_v, y_v) of a list of trajectories as arrays."""
+    arr = kb.trajectory_array(list(trjs))
+    return tuple(arr[name].astype(float) for name in ["x", "y", "x_v", "y_v"])
+
+
+def match_trajectories(injected, found, times, threshold=2.0, chunk_size=1024):
+    """Match each injected trajectory to its nearest found trajectory. The
+    distance between two trajectories is the mean distance between their
+    predicted positions at the given times.
+
+    Parameters
+    ----------
+    injected : list of trajectory
+        The N injected trajectories.
+    found : list of trajectory
+        The M found trajectories.
+    times : numpy array
+        The times (relative to the first image) at which to compare the positions.
+    threshold : float
+        The maximum mean distance (in pixels) for a match.
+    chunk_size : int
+        The number of injected trajectories compared at once.
+
+    Returns
+    -------
+    matched : numpy array
+        The index of the nearest found trajectory for each injected trajectory,
+        or -1 if there is none within the threshold.
+    distances : numpy array
+        The mean distance to the nearest found trajectory (inf if there are none).
+    """
+    times = np.asarray(times, dtype=float)
+    matched = np.full(len(injected), -1, dtype=int)
+    distances = np.full(len(injected), np.inf)
+    if len(injected) == 0 or len(found) == 0:
+        return matched, distances
+
+    # The (M, T) positions of the found trajectories.
+    fx, fy, fvx, fvy = _trajectory_arrays(found)
+    found_x = fx[:, None] + fvx[:, None] * times
+    found_y = fy[:, None] + fvy[:, None] * times
+
+    ix, iy, ivx, ivy = _trajectory_arrays(injected)
+    for start in range(0, len(injected), chunk_size):
+        end = min(start + chunk_size, len(injected))
+        inj_x = ix[start:end, None] + ivx[start:end, None] * times
+        inj_y = iy[start:end, None] + ivy[start:end, None] * times
+
+        # The (chunk, M) mean distances.
+        dist = np.mean(
+            np.hypot(inj_x[:, None, :] - found_x[None, :, :], inj_y[:, None, :] - found_y[None, :, :]), axis=2
+        )
+        nearest = np.argmin(dist, axis=1)
+        distances[start:end] = dist[np.arange(end - start), nearest]
+        matched[start:end] = np.where(distances[start:end] <= threshold, nearest, -1)
+    return matched, distances
+
+
+class InjectionRecovery:
+    """Run injection-recovery tests over a grid of fake object populations.
+
+    Parameters
+    ----------
+    config : dict or ``kbmod.configuration.KBMODConfig``
+        The search configuration.
+    num_per_bin : int
+        The number of objects injected into each bin's search.
+    threshold : float
+        The maximum mean distance (in pixels) for a recovered object.
+    margin : int
+        The minimum distance (in pixels) between the objects and the image edges.
+    seed : int, optional
+        The seed for the random starting positions.
+
+    Attributes
+    ----------
+    records : list of dict
+        The record of each bin (see ``run``).
+    """
+
+    def __init__(self, config, num_per_bin=20, threshold=2.0, margin=10, seed=None):
+        if num_per_bin < 1:
+            raise ValueError(f"Invalid number of objects per bin {num_per_bin}.")
+        params = dict(config) if isinstance(config, dict) else dict(config._params)
+
+        # The searches are run in memory on the full images.
+        params.update({"checkpoint": False, "release_layers": False, "load_search_region": False})
+        self.runner = run_search(params)
+        self.num_per_bin = num_per_bin
+        self.threshold = threshold
+        self.margin = margin
+        self.rng = np.random.default_rng(seed)
+        self.records = []
+
+    def run(self, bins):
+        """Inject and recover the objects of each bin.
+
+        Parameters
+        ----------
+        bins : list of dict
+            The ``flux``, ``velocity``, and ``angle`` of each bin (see ``make_injection_grid``).
+
+        Returns
+        -------
+        records : list of dict
+            For each bin, its parameters along with the number of objects injected
+            and recovered, the completeness, the number of results, and the run
+            time in seconds.
+        """
+        stack, img_info, suggested_angle, post_process = self.runner.load_and_mask_images()
+        times = np.array(stack.get_times())
+        width = stack.get_width()
+        height = stack.get_height()
+
+        # Generate the phi images of the uninjected stack once.
+        base_search = kb.stack_search(stack)
+        base_search.prepare_psi_phi()
+        phi_images = base_search.get_phi_images()
+
+        self.records = []
+        for params in bins:
+            start = time.time()
+            trjs = make_fake_trajectories(
+                self.num_per_bin,
+                params["flux"],
+                params["velocity"],
+                params["angle"],
+                width,
+                height,
+                times[-1],
+                self.margin,
+                self.rng,
+            )
+
+            # Inject the objects into a copy of the masked images and search it.
+            injected = kb.image_stack(stack.get_images())
+            injected.add_objects(trjs)
+            search = kb.stack_search(injected)
+            search.set_phi_images(phi_images)
+            results = self.runner.run_search(
+                loaded_images=(injected, img_info, suggested_angle, post_process), search=search, save=False
+            )
+
+            found = [row.trajectory for row in results.results]
+            matched, _ = match_trajectories(trjs, found, times, self.threshold)
+            num_recovered = int(np.count_nonzero(matched >= 0))
+            self.records.append(
+                {
+                    **params,
+                    "num_injected": len(trjs),
+                    "num_recovered": num_recovered,
+                    "completeness": num_recovered / len(trjs),
+                    "num_results": len(found),
+                    "seconds": time.time() - start,
+                }
+            )
+        return self.records
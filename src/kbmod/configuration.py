@@ -35,6 +35,7 @@ class KBMODConfig:
             "average_angle": None,
             "bary_dist": None,
             "center_thresh": 0.00,
+            "checkpoint": False,
             "chunk_size": 500000,
             "clip_negative": False,
             "cluster_function": "DBSCAN",
@@ -44,20 +45,27 @@ class KBMODConfig:
             "do_mask": True,
             "do_stamp_filter": True,
             "eps": 0.03,
+            "encode_clip_frac": 0.0,
+            "encode_half": False,
             "encode_psi_bytes": -1,
             "encode_phi_bytes": -1,
+            "encode_tile_size": 0,
             "flag_keys": default_flag_keys,
             "gpu_filter": False,
             "im_filepath": None,
+            "known_obj_file": None,
             "known_obj_obs": 3,
             "known_obj_thresh": None,
             "known_obj_jpl": False,
             "lh_level": 10.0,
+            "load_search_region": False,
             "mask_bits_dict": default_mask_bits_dict,
             "mask_grow": 10,
             "mask_num_images": 2,
             "mask_threshold": None,
+            "max_drift": None,
             "max_lh": 1000.0,
+            "min_reachable_frac": None,
             "mjd_lims": None,
             "mom_lims": [35.5, 35.5, 2.0, 0.3, 0.3],
             "num_cores": 1,
@@ -65,6 +73,7 @@ class KBMODConfig:
             "output_suffix": "search",
             "peak_offset": [2.0, 2.0],
             "psf_val": 1.4,
+            "release_layers": False,
             "psf_file": None,
             "repeated_flag_keys": default_repeated_flag_keys,
             "res_filepath": None,
@@ -72,6 +81,7 @@ class KBMODConfig:
             "stamp_radius": 10,
             "stamp_type": "sum",
             "time_file": None,
+            "timing_format": None,
             "v_arr": [92.0, 526.0, 256],
             "x_pixel_bounds": None,
             "x_pixel_buffer": None,
@@ -141,11 +151,14 @@ class KBMODConfig:
 
         Raises
         ------
-        Raises a ``ValueError`` if a parameter is missing.
+        Raises a ``ValueError`` if a parameter is missing or the ``timing_format``
+        is not None, "json", or "csv".
         """
         for p in self._required_params:
             if self._params.get(p, None) is None:
                 raise ValueError(f"Required configuration parameter {p} missing.")
+        if self._params["timing_format"] not in [None, "json", "csv"]:
+            raise ValueError(f"Unknown timing format {self._params['timing_format']}.")
 
     def load_from_file(self, filename, strict=True):
         """Load a configuration file and return the parameter dictionary.
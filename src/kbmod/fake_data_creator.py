@@ -5,6 +5,7 @@ for testing, including generating images with random noise and
 adding artificial objects. The fake data can be saved to files
 or used directly.
 """
+
 import os
 import random
 from pathlib import Path
@@ -97,22 +98,24 @@ class FakeDataSet:
         trj : trajectory
             The trajectory of the fake object to insert.
         """
-        t0 = self.times[0]
+        self.insert_objects([trj])
 
-        for i in range(self.num_times):
-            dt = self.times[i] - t0
-            px = trj.x + dt * trj.x_v + 0.5
-            py = trj.y + dt * trj.y_v + 0.5
-
-            # Get the image for the timestep, add the object, and
-            # re-set the image. This last step needs to be done
-            # explicitly because of how pybind handles references.
-            current_layered_image = self.stack.get_single_image(i)
-            current_layered_image.add_object(px, py, trj.flux)
-            self.stack.set_single_image(i, current_layered_image)
-
-        # Save the trajectory into the internal list.
-        self.trajectories.append(trj)
+    def insert_objects(self, trjs, bary_corrs=None):
+        """Insert many fake objects at once. The sources are added to the
+        science layers of the stack in place (in parallel over the images).
+
+        Parameters
+        ----------
+        trjs : list of trajectory
+            The trajectories of the fake objects to insert.
+        bary_corrs : list of baryCorrection, optional
+            The barycentric corrections for each of the trajectories' ``bary_index``
+            at each time (``img_count()`` corrections per index).
+        """
+        self.stack.add_objects(trjs, bary_corrs if bary_corrs is not None else [])
+
+        # Save the trajectories into the internal list.
+        self.trajectories.extend(trjs)
 
     def insert_random_object(self, flux):
         """Create a fake object and insert it into the image.
@@ -3,7 +3,6 @@
 import csv
 import re
 from collections import OrderedDict
-from math import copysign
 from pathlib import Path
 
 import astropy.units as u
@@ -13,6 +12,9 @@ from astropy.time import Time
 
 import kbmod.search as kb
 
+# The date of MJD 0.
+_MJD_EPOCH = np.datetime64("1858-11-17", "D")
+
 
 class FileUtils:
     """A class of static methods for working with KBMOD files.
@@ -228,6 +230,8 @@ class FileUtils:
         trj.flux = float(result["flux"])
         trj.lh = float(result["lh"])
         trj.obs_count = int(result["num_obs"])
+        if "bary_index" in result.dtype.names:
+            trj.bary_index = int(result["bary_index"])
         return trj
 
     @staticmethod
@@ -255,14 +259,48 @@ class FileUtils:
         Returns
         -------
         results : np array
-            A np array with the result trajectories.
+            A np array with the result trajectories. Files written before
+            the ``bary_index`` column was added do not have that field.
         """
-        results = np.genfromtxt(
-            filename,
-            usecols=(1, 3, 5, 7, 9, 11, 13),
-            names=["lh", "flux", "x", "y", "vx", "vy", "num_obs"],
-            ndmin=2,
-        )
+        usecols = [1, 3, 5, 7, 9, 11, 13]
+        names = ["lh", "flux", "x", "y", "vx", "vy", "num_obs"]
+        with open(filename, "r") as f:
+            has_bary_index = len(f.readline().split()) > 15
+        if has_bary_index:
+            usecols.append(15)
+            names.append("bary_index")
+
+        results = np.genfromtxt(filename, usecols=usecols, names=names, ndmin=2)
+        return results
+
+    @staticmethod
+    def load_results_file_as_array(filename):
+        """Load the result trajectories into a single array.
+
+        Parameters
+        ----------
+        filename : str
+            The full path and filename of the results.
+
+        Returns
+        -------
+        results : numpy.ndarray
+            A structured array of ``kbmod.search.trajectory_dtype``.
+        """
+        np_results = FileUtils.load_results_file(filename).ravel()
+        results = np.zeros(len(np_results), dtype=kb.trajectory_dtype)
+        for name, column in [
+            ("x", "x"),
+            ("y", "y"),
+            ("x_v", "vx"),
+            ("y_v", "vy"),
+            ("flux", "flux"),
+            ("lh", "lh"),
+            ("obs_count", "num_obs"),
+            ("bary_index", "bary_index"),
+        ]:
+            if column in np_results.dtype.names:
+                results[name] = np_results[column]
         return results
 
     @staticmethod
@@ -279,9 +317,7 @@ class FileUtils:
         results : list
             A list of trajectory objects
         """
-        np_results = FileUtils.load_results_file(filename)
-        results = [FileUtils.trajectory_from_np_object(x) for x in np_results]
-        return results
+        return kb.trajectory_list(FileUtils.load_results_file_as_array(filename))
 
     @staticmethod
     def mpc_reader(filename):
@@ -299,30 +335,87 @@ class FileUtils:
         times: astropy Time object
             Times of the observations
         """
-        iso_times = []
-        time_frac = []
-        ra = []
-        dec = []
-
         with open(filename, "r") as f:
-            for line in f:
-                year = str(line[15:19])
-                month = str(line[20:22])
-                day = str(line[23:25])
-                iso_times.append(str("%s-%s-%s" % (year, month, day)))
-                time_frac.append(str(line[25:31]))
-                ra.append(str(line[32:44]))
-                dec.append(str(line[44:56]))
-
-        coords = SkyCoord(ra, dec, unit=(u.hourangle, u.deg))
-        t = Time(iso_times)
-        t_obs = []
-        for t_i, frac in zip(t, time_frac):
-            t_obs.append(t_i.mjd + float(frac))
-        obs_times = Time(t_obs, format="mjd")
+            lines = [line for line in f.read().splitlines() if len(line.strip()) > 0]
 
+        # Slice the fixed-width columns and convert all the observations at once.
+        dates = np.array(
+            ["%s-%s-%s" % (line[15:19], line[20:22], line[23:25]) for line in lines], dtype="M8[D]"
+        )
+        day_frac = np.array([float(line[25:31]) for line in lines])
+        ra_hms = np.array([line[32:44].split() for line in lines], dtype=float).reshape(-1, 3)
+        dec_dms = np.array(
+            [line[44:56].replace("-", " ").replace("+", " ").split() for line in lines], dtype=float
+        )
+        dec_sign = np.array([-1.0 if "-" in line[44:56] else 1.0 for line in lines])
+
+        ra = 15.0 * (ra_hms[:, 0] + ra_hms[:, 1] / 60.0 + ra_hms[:, 2] / 3600.0)
+        dec = dec_sign * (dec_dms[:, 0] + dec_dms[:, 1] / 60.0 + dec_dms[:, 2] / 3600.0)
+        mjd = (dates - _MJD_EPOCH).astype(float) + day_frac
+
+        coords = SkyCoord(ra, dec, unit="deg")
+        obs_times = Time(mjd, format="mjd")
         return coords, obs_times
 
+    @staticmethod
+    def format_results_mpc(ra, dec, mjd, observatory="X05"):
+        """Format many observations as MPC strings at once. The dates and
+        sexagesimal coordinates are computed with numpy for all the
+        observations.
+
+        Parameters
+        ----------
+        ra : array-like
+            The right ascensions of the observations in degrees.
+        dec : array-like
+            The declinations of the observations in degrees.
+        mjd : array-like
+            The times of the observations in MJD (UTC).
+        observatory : string
+            The three digit observatory code to use.
+
+        Returns
+        -------
+        mpc_lines : list of strings
+            The MPC-formatted string of each observation.
+        """
+        ra = np.ravel(np.asarray(ra, dtype=float))
+        dec = np.ravel(np.asarray(dec, dtype=float))
+        mjd = np.ravel(np.asarray(mjd, dtype=float))
+        if len(ra) != len(dec) or len(ra) != len(mjd):
+            raise ValueError(f"Unequal arrays {len(ra)}, {len(dec)}, {len(mjd)}")
+
+        # The calendar date and the (fractional) day of the month. Every value is
+        # rounded to its printed precision before it is split into units so that
+        # rounding carries into the next unit (instead of printing 60 seconds).
+        mjd = np.round(mjd * 1e5) / 1e5
+        days = np.floor(mjd)
+        dates = _MJD_EPOCH + days.astype("m8[D]")
+        years = dates.astype("M8[Y]").astype(int) + 1970
+        months = dates.astype("M8[M]").astype(int) % 12 + 1
+        month_days = (dates - dates.astype("M8[M]")).astype(int) + 1 + (mjd - days)
+
+        # The right ascension in hours, minutes, and seconds (in milliseconds of time).
+        ra_ms = np.round(np.mod(ra, 360.0) / 15.0 * 3.6e6).astype(np.int64) % 86400000
+        ra_h = ra_ms // 3600000
+        ra_m = (ra_ms // 60000) % 60
+        ra_s = (ra_ms % 60000) / 1000.0
+
+        # The declination in degrees, minutes, and seconds (in hundredths of an
+        # arcsecond and keeping the sign of -00).
+        dec_sign = np.where(np.signbit(dec), "-", "+")
+        dec_cs = np.round(np.abs(dec) * 3.6e5).astype(np.int64)
+        dec_d = dec_cs // 360000
+        dec_m = (dec_cs // 6000) % 60
+        dec_s = (dec_cs % 6000) / 100.0
+
+        line_format = (
+            "     c111112  c%4i %02i %08.5f %02i %02i %06.3f%s%02i %02i %05.2f                     "
+            + observatory
+        )
+        columns = [years, months, month_days, ra_h, ra_m, ra_s, dec_sign, dec_d, dec_m, dec_s]
+        return [line_format % row for row in zip(*[col.tolist() for col in columns])]
+
     @staticmethod
     def format_result_mpc(coords, t, observatory="X05"):
         """
@@ -343,31 +436,45 @@ class FileUtils:
         mpc_line: string
             An MPC-formatted string of the observation
         """
-        mjd_frac = t.mjd % 1.0
-        ra_hms = coords.ra.hms
-        dec_dms = coords.dec.dms
+        return FileUtils.format_results_mpc([coords.ra.degree], [coords.dec.degree], [t.mjd], observatory)[0]
 
-        if dec_dms.d == 0:
-            if copysign(1, dec_dms.d) == -1.0:
-                dec_dms_d = "-00"
-            else:
-                dec_dms_d = "+00"
-        else:
-            dec_dms_d = "%+03i" % dec_dms.d
-
-        mpc_line = "     c111112  c%4i %02i %08.5f %02i %02i %06.3f%s %02i %05.2f                     %s" % (
-            t.datetime.year,
-            t.datetime.month,
-            t.datetime.day + mjd_frac,
-            ra_hms.h,
-            ra_hms.m,
-            ra_hms.s,
-            dec_dms_d,
-            np.abs(dec_dms.m),
-            np.abs(dec_dms.s),
-            observatory,
-        )
-        return mpc_line
+    @staticmethod
+    def save_radec_mpc(file_out, ra, dec, mjd, observatory="X05", chunk_size=100000):
+        """Save many observations to a file in MPC format. The observations
+        are formatted and written in chunks, so the whole file is never held
+        in memory.
+
+        Parameters
+        ----------
+        file_out : str
+            The output filename.
+        ra : array-like
+            The right ascensions in degrees, either one per observation or a
+            (num_objects, num_times) array with the positions of many objects.
+        dec : array-like
+            The declinations in degrees (the same shape as ``ra``).
+        mjd : array-like
+            The times in MJD, either the same shape as ``ra`` or one per time
+            step (shared by all the objects).
+        observatory : string
+            The three digit observatory code to use.
+        chunk_size : int
+            The number of observations to format at once.
+        """
+        ra = np.asarray(ra, dtype=float)
+        dec = np.asarray(dec, dtype=float)
+        if ra.shape != dec.shape:
+            raise ValueError(f"Unequal shapes {ra.shape} != {dec.shape}")
+        mjd = np.broadcast_to(np.asarray(mjd, dtype=float), ra.shape)
+
+        ra, dec, mjd = ra.ravel(), dec.ravel(), mjd.ravel()
+        with open(file_out, "w") as f:
+            for start in range(0, len(ra), chunk_size):
+                end = start + chunk_size
+                lines = FileUtils.format_results_mpc(
+                    ra[start:end], dec[start:end], mjd[start:end], observatory
+                )
+                f.write("\n".join(lines) + "\n")
 
     @staticmethod
     def save_results_mpc(file_out, coords, times, observatory="X05"):
@@ -389,7 +496,7 @@ class FileUtils:
         if len(times) != len(coords):
             raise ValueError(f"Unequal lists {len(times)} != {len(coords)}")
 
-        with open(file_out, "w") as f:
-            for i in range(len(times)):
-                mpc_line = FileUtils.format_result_mpc(coords[i], times[i], observatory)
-                f.write(mpc_line + "\n")
+        ra = [c.ra.degree for c in coords]
+        dec = [c.dec.degree for c in coords]
+        mjd = [t.mjd for t in times]
+        FileUtils.save_radec_mpc(file_out, ra, dec, mjd, observatory)
@@ -4,10 +4,12 @@ The ``ImageInfo`` class stores additional information for the
 input FITS files that is used during a variety of analysis.
 """
 
+import numpy as np
 from astropy.io import fits
 from astropy.time import Time
 from astropy.wcs import WCS
 
+import kbmod.search as kb
 from kbmod.file_utils import FileUtils
 
 
@@ -335,3 +337,63 @@ class ImageInfoSet:
             pos_y = trj.y + dt * trj.y_v
             results.append(self.stats[i].wcs.pixel_to_world(pos_x, pos_y))
         return results
+
+    def trajectories_to_pixels(self, trjs, bary_corr=None):
+        """Compute the pixel positions of many trajectories at every time step.
+
+        Parameters
+        ----------
+        trjs : list of trajectory or numpy structured array
+            The N trajectories, either as ``trajectory`` objects or as an array with
+            the fields ``x``, ``y``, ``x_v``, ``y_v`` (and ``bary_index`` if
+            ``bary_corr`` is given), such as created by
+            ``kbmod.search.trajectory_array``.
+        bary_corr : numpy array, optional
+            The barycentric correction coefficients (6 per image for each distance,
+            in the format passed to ``stack_search.enable_corr``). The trajectory's
+            ``bary_index`` selects the distance.
+
+        Returns
+        -------
+        x, y : numpy arrays
+            The (N, T) arrays of pixel positions.
+        """
+        if not isinstance(trjs, np.ndarray):
+            trjs = kb.trajectory_array(list(trjs))
+        fields = {name: np.asarray(trjs[name], dtype=float) for name in ["x", "y", "x_v", "y_v"]}
+        bary_index = trjs["bary_index"] if bary_corr is not None else None
+
+        times = np.array(self.get_zero_shifted_times())
+        x = fields["x"][:, np.newaxis] + np.outer(fields["x_v"], times)
+        y = fields["y"][:, np.newaxis] + np.outer(fields["y_v"], times)
+
+        if bary_corr is not None:
+            coeff = np.asarray(bary_corr, dtype=float).reshape(-1, self.num_images, 6)[bary_index]
+            x0 = fields["x"][:, np.newaxis]
+            y0 = fields["y"][:, np.newaxis]
+            x += coeff[:, :, 0] + x0 * coeff[:, :, 1] + y0 * coeff[:, :, 2]
+            y += coeff[:, :, 3] + x0 * coeff[:, :, 4] + y0 * coeff[:, :, 5]
+        return x, y
+
+    def trajectories_to_radec(self, trjs, bary_corr=None):
+        """Compute the (RA, Dec) of many trajectories at every time step. The WCS
+        of each image is applied once to the positions of all the trajectories.
+
+        Parameters
+        ----------
+        trjs : list of trajectory or numpy structured array
+            The N trajectories (see ``trajectories_to_pixels``).
+        bary_corr : numpy array, optional
+            The barycentric correction coefficients (see ``trajectories_to_pixels``).
+
+        Returns
+        -------
+        ra, dec : numpy arrays
+            The (N, T) arrays of coordinates in degrees.
+        """
+        x, y = self.trajectories_to_pixels(trjs, bary_corr)
+        ra = np.empty_like(x)
+        dec = np.empty_like(y)
+        for i in range(self.num_images):
+            ra[:, i], dec[:, i] = self.stats[i].wcs.all_pix2world(x[:, i], y[:, i], 0)
+        return ra, dec
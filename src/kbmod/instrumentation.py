@@ -0,0 +1,227 @@
+"""Structured timing and memory instrumentation for the KBMOD pipeline.
+
+The ``Instrumentation`` class records nested timing spans together with the
+peak memory (RSS) of the process and item counts, such as the number of
+candidates going into and out of each filter. The records can be saved as
+JSON or CSV and can optionally be passed to a callback as each span finishes.
+"""
+import csv
+import json
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+
+def peak_rss_mb():
+    """Get the peak resident set size of the current process.
+
+    Returns
+    -------
+    rss : float
+        The peak RSS in megabytes.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes on Linux.
+    if sys.platform == "darwin":
+        return max_rss / (1024.0 * 1024.0)
+    return max_rss / 1024.0
+
+
+class Span:
+    """The record for a single timed stage.
+
+    Attributes
+    ----------
+    name : str
+        The name of the stage.
+    path : str
+        The names of all the enclosing stages and this one, separated by "/".
+    depth : int
+        The nesting depth of the span (0 for a top level span).
+    source : str
+        Where the span was measured ("python" or "c++").
+    start : float
+        The start time in seconds relative to the creation of the
+        ``Instrumentation`` object (or None if unknown).
+    duration : float
+        The duration in seconds.
+    peak_rss_mb : float
+        The peak RSS of the process (in MB) at the end of the span.
+    peak_rss_increase_mb : float
+        How much the span raised the peak RSS (in MB).
+    counts : dict
+        A dictionary of named item counts.
+    """
+
+    __slots__ = (
+        "name",
+        "path",
+        "depth",
+        "source",
+        "start",
+        "duration",
+        "peak_rss_mb",
+        "peak_rss_increase_mb",
+        "counts",
+    )
+
+    def __init__(self, name, path, depth, source="python", start=None):
+        self.name = name
+        self.path = path
+        self.depth = depth
+        self.source = source
+        self.start = start
+        self.duration = None
+        self.peak_rss_mb = None
+        self.peak_rss_increase_mb = None
+        self.counts = {}
+
+    def set_count(self, key, value):
+        """Record an item count for the span.
+
+        Parameters
+        ----------
+        key : str
+            The name of the count, such as "in" or "out".
+        value : int
+            The count.
+        """
+        self.counts[key] = value
+
+    def to_dict(self):
+        """Get the record as a dictionary.
+
+        Returns
+        -------
+        record : dict
+            The span's attributes.
+        """
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class Instrumentation:
+    """Records nested timing spans, peak memory, and item counts.
+
+    Parameters
+    ----------
+    callback : function, optional
+        A function that is called with the finished ``Span`` each time a span ends.
+
+    Attributes
+    ----------
+    spans : list of Span
+        The finished spans in the order they were started.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.spans = []
+        self._stack = []
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, **counts):
+        """Time the code run inside the context as a (possibly nested) span.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+        **counts : dict
+            Initial item counts for the span.
+
+        Yields
+        ------
+        span : Span
+            The span's record, which can be used to add counts.
+        """
+        path = "/".join([s.name for s in self._stack] + [name])
+        current = Span(name, path, len(self._stack), start=time.perf_counter() - self._t0)
+        current.counts.update(counts)
+
+        # Add the span now so that spans are listed in the order they start.
+        self.spans.append(current)
+        self._stack.append(current)
+        rss_start = peak_rss_mb()
+        try:
+            yield current
+        finally:
+            current.duration = time.perf_counter() - self._t0 - current.start
+            current.peak_rss_mb = peak_rss_mb()
+            current.peak_rss_increase_mb = current.peak_rss_mb - rss_start
+            self._stack.pop()
+            if self.callback is not None:
+                self.callback(current)
+
+    def add_search_timings(self, search):
+        """Add the operations timed by the C++ search object as children
+        of the current span and clear them from the search object.
+
+        Parameters
+        ----------
+        search : ``kbmod.search.stack_search``
+            The search object.
+        """
+        prefix = "/".join(s.name for s in self._stack)
+        for name, seconds in search.get_timings():
+            current = Span(name, f"{prefix}/{name}" if prefix else name, len(self._stack), source="c++")
+            current.duration = seconds
+            self.spans.append(current)
+            if self.callback is not None:
+                self.callback(current)
+        search.clear_timings()
+
+    def to_records(self):
+        """Get all the spans as a list of dictionaries.
+
+        Returns
+        -------
+        records : list of dict
+            One dictionary per span.
+        """
+        return [s.to_dict() for s in self.spans]
+
+    def save_json(self, filename):
+        """Save the spans to a JSON file.
+
+        Parameters
+        ----------
+        filename : str
+            The name of the output file.
+        """
+        with open(filename, "w") as f:
+            json.dump(self.to_records(), f, indent=2)
+
+    def save_csv(self, filename):
+        """Save the spans to a CSV file with one row per span. Each count
+        is written to its own column named ``count_<key>``.
+
+        Parameters
+        ----------
+        filename : str
+            The name of the output file.
+        """
+        count_keys = sorted(set(key for s in self.spans for key in s.counts))
+        fields = [key for key in Span.__slots__ if key != "counts"]
+
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(fields + [f"count_{key}" for key in count_keys])
+            for s in self.spans:
+                writer.writerow(
+                    [getattr(s, key) for key in fields] + [s.counts.get(key) for key in count_keys]
+                )
+
+    def save(self, filename):
+        """Save the spans to a JSON or CSV file (based on the extension).
+
+        Parameters
+        ----------
+        filename : str
+            The name of the output file.
+        """
+        if filename.endswith(".csv"):
+            self.save_csv(filename)
+        else:
+            self.save_json(filename)
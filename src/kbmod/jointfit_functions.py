@@ -1,4 +1,6 @@
+import multiprocessing as mp
 import os
+from multiprocessing import shared_memory
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -9,15 +11,81 @@ from astropy.coordinates import EarthLocation, SkyCoord, get_body_barycentric, s
 from astropy.time import Time
 from scipy.ndimage import shift
 
+# The scale of the prior on the fluxes used for the best fit fluxes.
+_FLUX_REG = 25000
+
 # These functions run the orbit fitting
 
 # these four functions transform a coordinate c at date dates[ii]
 
 
+def compute_ephemeris(dates, site="ctio"):
+    """
+    Compute the barycentric positions of the Earth and the observatory at each
+    date. These only depend on the images, so they can be computed once and
+    shared by the ``JointFit`` of every candidate.
+
+    Parameters
+    ----------
+    dates : numpy array
+        The times of the images in MJD.
+    site : str
+        The name of the observatory site.
+
+    Returns
+    -------
+    earth_pos_list : list
+        The barycentric position of the Earth at each date.
+    obs_pos_list : list
+        The barycentric position of the observatory (SkyCoord) at each date.
+    """
+    earth_pos_list = []
+    obs_pos_list = []
+    for date in dates:
+        with solar_system_ephemeris.set(
+            "de432s"
+        ):  # https://docs.astropy.org/en/stable/coordinates/solarsystem.html
+            earth_pos = get_body_barycentric("earth", Time(date, format="mjd"))
+            earth_pos_list.append(earth_pos)
+
+            obs_pos = EarthLocation.of_site(site).get_gcrs(Time(date, format="mjd"))
+            obs_pos.representation_type = "cartesian"
+
+            obs_pos = SkyCoord(
+                earth_pos.x + obs_pos.x,
+                earth_pos.y + obs_pos.y,
+                earth_pos.z + obs_pos.z,
+                representation_type="cartesian",
+            )
+            obs_pos_list.append(obs_pos)
+    return earth_pos_list, obs_pos_list
+
+
 class JointFit:
-    def __init__(self, stamps, variances, dates, stamp_center_radec, stamp_center_pixel, psfs, wcs_list):
-        self.earth_pos_list = []
-        self.obs_pos_list = []
+    def __init__(
+        self, stamps, variances, dates, stamp_center_radec, stamp_center_pixel, psfs, wcs_list, ephemeris=None
+    ):
+        """
+        Parameters
+        ----------
+        stamps : numpy array
+            The (num_images, height, width) stamps around the object.
+        variances : numpy array
+            The variances of the stamps.
+        dates : numpy array
+            The times of the images in MJD.
+        stamp_center_radec : list
+            The sky coordinates of the stamp centers.
+        stamp_center_pixel : numpy array
+            The (num_images, 2) pixel coordinates of the stamp centers.
+        psfs : numpy array
+            The PSF of each image (the same shape as the stamps).
+        wcs_list : list
+            The WCS of each image.
+        ephemeris : tuple, optional
+            The (earth_pos_list, obs_pos_list) barycentric positions for the dates,
+            as returned by ``compute_ephemeris``. If None they are computed here.
+        """
         self.dates = dates
         self.j = len(stamps)
         self.stamps = stamps
@@ -29,23 +97,15 @@ class JointFit:
         self.stamp_pos = np.array(stamp_center_pixel)
         self.weights = 1 / np.array(self.variances)
 
-        for i in range(self.j):
-            with solar_system_ephemeris.set(
-                "de432s"
-            ):  # https://docs.astropy.org/en/stable/coordinates/solarsystem.html
-                earth_pos = get_body_barycentric("earth", Time(dates[i], format="mjd"))
-                self.earth_pos_list.append(earth_pos)
-
-                obs_pos = EarthLocation.of_site("ctio").get_gcrs(Time(dates[i], format="mjd"))
-                obs_pos.representation_type = "cartesian"
-
-                obs_pos = SkyCoord(
-                    earth_pos.x + obs_pos.x,
-                    earth_pos.y + obs_pos.y,
-                    earth_pos.z + obs_pos.z,
-                    representation_type="cartesian",
-                )
-                self.obs_pos_list.append(obs_pos)
+        # The Fourier transforms of the PSFs and the frequencies of their pixels, so the
+        # shifted models can be built with a phase ramp instead of an interpolation.
+        self.psf_fft = np.fft.fft2(np.asarray(psfs, dtype=float))
+        self.freq_y = np.fft.fftfreq(self.psf_fft.shape[1])[:, None]
+        self.freq_x = np.fft.fftfreq(self.psf_fft.shape[2])[None, :]
+
+        if ephemeris is None:
+            ephemeris = compute_ephemeris(dates)
+        self.earth_pos_list, self.obs_pos_list = ephemeris
 
     def geo_to_bary_fast(self, c, i):
         c.representation_type = "cartesian"
@@ -220,8 +280,117 @@ class JointFit:
 
         return mdl - streakstamps
 
+    def phase_ramps(self, dx, dy):
+        """
+        The Fourier-domain factors that shift an image by (dx, dy) pixels.
+
+        Parameters
+        ----------
+        dx : numpy array
+            The shifts along x, one per image.
+        dy : numpy array
+            The shifts along y, one per image.
+
+        Returns
+        -------
+        ramps : numpy array
+            The complex (num_images, height, width) phase ramps.
+        """
+        dx = np.asarray(dx, dtype=float)[:, None, None]
+        dy = np.asarray(dy, dtype=float)[:, None, None]
+        return np.exp(-2j * np.pi * (self.freq_x * dx + self.freq_y * dy))
+
+    def model_images_fft(self, traj, streaked=False):
+        """
+        Build the models for all the epochs at once by shifting the PSFs with
+        Fourier phase ramps. This matches ``model_images`` (or
+        ``model_images_streaked``) up to the interpolation, but costs two
+        batched FFTs instead of one (or T^2) spline shifts.
+
+        Parameters
+        ----------
+        traj : numpy array
+            The (num_images, 2) pixel positions of the object.
+        streaked : bool
+            Subtract the mean of the PSFs along the trajectory from each model.
+
+        Returns
+        -------
+        mdl : numpy array
+            The (num_images, height, width) models.
+        """
+        return np.fft.ifft2(self._model_fft(traj, streaked)).real
+
+    def _model_fft(self, traj, streaked):
+        """The Fourier transforms of the models built by ``model_images_fft``."""
+        mdl_fft = self.psf_fft * self.phase_ramps(
+            traj[:, 0] - self.stamp_pos[:, 0], traj[:, 1] - self.stamp_pos[:, 1]
+        )
+        if streaked:
+            # The streak at each epoch is the mean of the shifted PSFs, so the sum
+            # over epochs only needs to be done once.
+            streak = np.mean(self.psf_fft * self.phase_ramps(traj[:, 0], traj[:, 1]), axis=0)
+            mdl_fft = mdl_fft - self.phase_ramps(-self.stamp_pos[:, 0], -self.stamp_pos[:, 1]) * streak
+        return mdl_fft
+
+    def negloglike_traj(self, traj, streaked=False):
+        """
+        The negative log likelihood of a trajectory (using the best non-negative
+        flux at each epoch) and its analytic gradient with respect to the pixel
+        positions. The models are built with ``model_images_fft``.
+
+        Parameters
+        ----------
+        traj : numpy array
+            The (num_images, 2) pixel positions of the object.
+        streaked : bool
+            Use the streaked models.
+
+        Returns
+        -------
+        logL : float
+            The negative log likelihood.
+        grad : numpy array
+            The (num_images, 2) derivatives with respect to the x and y positions.
+        """
+        mdl_fft = self._model_fft(traj, streaked)
+        mdl = np.fft.ifft2(mdl_fft).real
+
+        reg = _FLUX_REG**-2
+        a = np.sum(mdl * mdl * self.weights, axis=(1, 2)) + reg
+        c = np.sum(mdl * self.stamps * self.weights, axis=(1, 2))
+        f = c / a
+        f[f < 0] = 0
+        resid = f[:, None, None] * mdl - self.stamps
+        logL = 0.5 * np.sum(self.weights * resid**2)
+
+        # The derivative with respect to each model pixel, including the change of the
+        # best flux. The epochs with a clipped flux do not depend on the model.
+        grad_mdl = f[:, None, None] * self.weights * resid - (reg * f / a)[:, None, None] * self.weights * (
+            self.stamps - 2.0 * f[:, None, None] * mdl
+        )
+
+        # Move the pixel derivatives to Fourier space (sum(g * ifft2(X)) = sum(X * conj(fft2(g))) / N)
+        # and apply the derivatives of the phase ramps.
+        grad_fft = np.conj(np.fft.fft2(grad_mdl)) / (mdl.shape[1] * mdl.shape[2])
+        weighted = (
+            self.psf_fft
+            * self.phase_ramps(traj[:, 0] - self.stamp_pos[:, 0], traj[:, 1] - self.stamp_pos[:, 1])
+            * grad_fft
+        )
+        if streaked:
+            adjoint = np.sum(
+                self.phase_ramps(-self.stamp_pos[:, 0], -self.stamp_pos[:, 1]) * grad_fft, axis=0
+            )
+            weighted = weighted - self.psf_fft * self.phase_ramps(traj[:, 0], traj[:, 1]) * adjoint / self.j
+
+        grad = np.zeros((self.j, 2))
+        grad[:, 0] = np.sum(weighted * (-2j * np.pi * self.freq_x), axis=(1, 2)).real
+        grad[:, 1] = np.sum(weighted * (-2j * np.pi * self.freq_y), axis=(1, 2)).real
+        return logL, grad
+
     def bestfluxes(self, traj):
-        freg = 25000
+        freg = _FLUX_REG
 
         mdl = self.model_images(traj)
         a = np.sum(mdl * mdl * self.weights, axis=(1, 2)) + freg**-2
@@ -433,6 +602,103 @@ class JointFit:
         logL = 0.5 * np.sum(self.weights * (bestmdl - self.stamps) ** 2)
         return logL
 
+    def _topo_traj_and_jacobian(self, ra, dec, step=1e-6):
+        """
+        The pixel positions of the topocentric coordinates at each epoch and the
+        derivatives of the pixel positions with respect to (ra, dec) in degrees.
+        """
+        traj = np.zeros((self.j, 2))
+        jac = np.zeros((self.j, 2, 2))
+        for i in range(self.j):
+            c = SkyCoord([ra[i], ra[i] + step, ra[i]], [dec[i], dec[i], dec[i] + step], unit="deg")
+            x, y = self.wcs_list[i].world_to_pixel(c)
+            traj[i] = [x[0], y[0]]
+            jac[i, :, 0] = [(x[1] - x[0]) / step, (y[1] - y[0]) / step]
+            jac[i, :, 1] = [(x[2] - x[0]) / step, (y[2] - y[0]) / step]
+        return traj, jac
+
+    def _negloglike_and_grad(self, traj, jac, streaked=False):
+        """Chain the trajectory gradient through the (num_images, 2, num_params) jacobian."""
+        logL, grad = self.negloglike_traj(traj, streaked)
+        return logL, np.einsum("ia,iap->p", grad, jac)
+
+    def negloglike_topo_pv_grad(self, x):
+        """
+        The likelihood of ``negloglike_topo_pv`` (using the Fourier models) and its
+        gradient, for use with ``scipy.optimize.minimize(..., jac=True)``.
+        """
+        ra_m, dec_m, v_ra, v_dec = x
+        dt = np.asarray(self.dates) - np.mean(self.dates)
+        traj, sky_jac = self._topo_traj_and_jacobian(ra_m + v_ra * dt, dec_m + v_dec * dt)
+
+        jac = np.zeros((self.j, 2, 4))
+        jac[:, :, 0] = sky_jac[:, :, 0]
+        jac[:, :, 1] = sky_jac[:, :, 1]
+        jac[:, :, 2] = sky_jac[:, :, 0] * dt[:, None]
+        jac[:, :, 3] = sky_jac[:, :, 1] * dt[:, None]
+        return self._negloglike_and_grad(traj, jac)
+
+    def negloglike_topo_pp_grad(self, x):
+        """
+        The likelihood of ``negloglike_topo_pp`` (using the Fourier models) and its
+        gradient, for use with ``scipy.optimize.minimize(..., jac=True)``.
+        """
+        ra_a, dec_a, ra_b, dec_b = x
+        dt = np.asarray(self.dates) - np.mean(self.dates)
+        frac_b = 0.5 + dt / (2 * np.std(self.dates))
+        traj, sky_jac = self._topo_traj_and_jacobian(
+            ra_a + (ra_b - ra_a) * frac_b, dec_a + (dec_b - dec_a) * frac_b
+        )
+
+        jac = np.zeros((self.j, 2, 4))
+        jac[:, :, 0] = sky_jac[:, :, 0] * (1.0 - frac_b)[:, None]
+        jac[:, :, 1] = sky_jac[:, :, 1] * (1.0 - frac_b)[:, None]
+        jac[:, :, 2] = sky_jac[:, :, 0] * frac_b[:, None]
+        jac[:, :, 3] = sky_jac[:, :, 1] * frac_b[:, None]
+        return self._negloglike_and_grad(traj, jac)
+
+    def negloglike_topo_start_end_grad(self, x, streaked=False):
+        """
+        The likelihood of ``negloglike_topo_start_end`` (or, with ``streaked``, of the
+        streaked models with their own best fluxes) using the Fourier models and its
+        gradient, for use with ``scipy.optimize.minimize(..., jac=True)``.
+        """
+        frac = (np.asarray(self.dates) - self.dates[0]) / (self.dates[-1] - self.dates[0])
+        traj = self.model_traj_topo_start_end(*x)
+
+        jac = np.zeros((self.j, 2, 4))
+        jac[:, 0, 0] = 1.0 - frac
+        jac[:, 1, 1] = 1.0 - frac
+        jac[:, 0, 2] = frac
+        jac[:, 1, 3] = frac
+        return self._negloglike_and_grad(traj, jac, streaked)
+
+    def negloglike_from_obs_grad(self, x, steps=(1e-3, 1e-3, 1e-3, 1e-3, 1e-4)):
+        """
+        The likelihood of ``negloglike_from_obs`` (using the Fourier models) and its
+        gradient, for use with ``scipy.optimize.minimize(..., jac=True)``. The
+        gradient with respect to the pixel positions is analytic, while the
+        derivatives of the barycentric trajectory use central differences.
+
+        Parameters
+        ----------
+        x : numpy array
+            The parameters (x1, y1, x2, y2, bary_dist).
+        steps : tuple
+            The finite difference step of each parameter.
+        """
+        x = np.asarray(x, dtype=float)
+        traj = self.model_traj_from_obs(*x)
+
+        jac = np.zeros((self.j, 2, len(x)))
+        for p, step in enumerate(steps):
+            dx = np.zeros(len(x))
+            dx[p] = step
+            jac[:, :, p] = (self.model_traj_from_obs(*(x + dx)) - self.model_traj_from_obs(*(x - dx))) / (
+                2 * step
+            )
+        return self._negloglike_and_grad(traj, jac)
+
     def compare_traj(self, traj):
         plt.figure(figsize=(16, 16))
         n = np.ceil(np.sqrt(self.j))
@@ -580,3 +846,177 @@ def shift_images(traj, stamps, stamp_pos):
             shift(stamps[i], [-traj[i, 1] + stamp_pos[i, 1], -traj[i, 0] + stamp_pos[i, 0]])
         )
     return shifted_stamps
+
+
+# The objective (a JointFit method and its extra arguments) and the parameter names of each
+# batch fitting model.
+_FIT_MODELS = {
+    "topo_start_end": ("negloglike_topo_start_end_grad", (), ["x1", "y1", "x2", "y2"]),
+    "topo_start_end_streaked": ("negloglike_topo_start_end_grad", (True,), ["x1", "y1", "x2", "y2"]),
+    "from_obs": ("negloglike_from_obs_grad", (), ["x1", "y1", "x2", "y2", "bary_dist"]),
+}
+
+# The inputs shared by all the candidates, set once in each worker process of fit_result_list.
+_fit_inputs = {}
+
+
+def _init_fit_worker(shm_name, shape, shared):
+    """Attach a worker process to the shared stamp and variance cubes."""
+    _fit_inputs["shm"] = shared_memory.SharedMemory(name=shm_name)
+    _fit_inputs["cubes"] = np.ndarray(shape, dtype=np.float64, buffer=_fit_inputs["shm"].buf)
+    _fit_inputs.update(shared)
+
+
+def _fit_candidates(indices):
+    """Fit the candidates with the given indices using the inputs in ``_fit_inputs``."""
+    from scipy.optimize import minimize
+
+    method, args, _ = _FIT_MODELS[_fit_inputs["model"]]
+    cubes = _fit_inputs["cubes"]
+
+    rows = []
+    for idx in indices:
+        fit = JointFit(
+            cubes[0, idx],
+            cubes[1, idx],
+            _fit_inputs["dates"],
+            None,
+            _fit_inputs["stamp_pos"][idx],
+            _fit_inputs["psfs"],
+            _fit_inputs["wcs_list"],
+            ephemeris=_fit_inputs["ephemeris"],
+        )
+        res = minimize(getattr(fit, method), _fit_inputs["x0"][idx], args=args, jac=True)
+        rows.append([idx] + list(res.x) + [res.fun, res.success, res.nfev])
+    return rows
+
+
+def fit_result_list(
+    result_list,
+    psfs,
+    variances,
+    model="topo_start_end",
+    wcs_list=None,
+    ephemeris=None,
+    bary_dist=40.0,
+    num_workers=1,
+    chunk_size=16,
+):
+    """
+    Fit all the candidates in a ``ResultList`` with ``JointFit``. The PSFs, WCS,
+    and ephemeris are shared by all the candidates and the stamp cubes are placed
+    in shared memory, so the candidates can be fit in parallel by a pool of
+    worker processes.
+
+    Parameters
+    ----------
+    result_list : ``kbmod.result_list.ResultList``
+        The candidates. Each row needs the per-image stamps in ``all_stamps``
+        (see ``Interface.get_all_stamps``), which are centered on the predicted
+        positions.
+    psfs : numpy array
+        The (num_images, height, width) PSF stamps (the same shape as the stamps).
+    variances : numpy array
+        The variances of the stamps, broadcastable to (num_results, num_images,
+        height, width). For example a (num_images, 1, 1) array of per-image variances.
+    model : str
+        The trajectory model: "topo_start_end", "topo_start_end_streaked", or
+        "from_obs" (which needs ``wcs_list``).
+    wcs_list : list, optional
+        The WCS of each image.
+    ephemeris : tuple, optional
+        The precomputed ephemeris (see ``compute_ephemeris``). Only used (and computed
+        when None) by the "from_obs" model.
+    bary_dist : float
+        The initial barycentric distance (in au) for the "from_obs" model.
+    num_workers : int
+        The number of worker processes. 1 fits the candidates in this process.
+    chunk_size : int
+        The number of candidates sent to a worker at a time.
+
+    Returns
+    -------
+    fits : pandas.DataFrame
+        One row per candidate (in the order of the results) with the best fit
+        parameters, the negative log likelihood, whether the optimizer succeeded,
+        and the number of evaluations.
+
+    Raises
+    ------
+    Raises a ``ValueError`` if the model is unknown, the inputs are missing, or the
+    results do not have stamps.
+    """
+    if model not in _FIT_MODELS:
+        raise ValueError(f"Unknown model {model}. Must be one of {list(_FIT_MODELS.keys())}.")
+    if num_workers < 1:
+        raise ValueError(f"Invalid number of workers {num_workers}.")
+    if model == "from_obs" and wcs_list is None:
+        raise ValueError("The from_obs model needs the WCS of each image.")
+    if any(row.all_stamps is None for row in result_list.results):
+        raise ValueError("All the results need per-image stamps.")
+
+    dates = np.asarray(result_list.all_times, dtype=float)
+    num_res = result_list.num_results()
+    columns = ["index"] + _FIT_MODELS[model][2] + ["negloglike", "success", "num_evals"]
+    if num_res == 0:
+        return pd.DataFrame(columns=columns)
+    if model != "from_obs":
+        # The pixel space models do not use the ephemeris.
+        ephemeris = ([], [])
+    elif ephemeris is None:
+        ephemeris = compute_ephemeris(dates)
+
+    # The predicted positions are both the stamp centers and the starting guesses.
+    trjs = [row.trajectory for row in result_list.results]
+    dt = dates - dates[0]
+    stamp_pos = np.zeros((num_res, len(dates), 2))
+    stamp_pos[:, :, 0] = (
+        np.array([t.x for t in trjs])[:, None] + np.array([t.x_v for t in trjs])[:, None] * dt
+    )
+    stamp_pos[:, :, 1] = (
+        np.array([t.y for t in trjs])[:, None] + np.array([t.y_v for t in trjs])[:, None] * dt
+    )
+    x0 = np.concatenate([stamp_pos[:, 0, :], stamp_pos[:, -1, :]], axis=1)
+    if model == "from_obs":
+        x0 = np.concatenate([x0, np.full((num_res, 1), bary_dist)], axis=1)
+
+    stamps = np.array([row.all_stamps for row in result_list.results], dtype=np.float64)
+    shape = (2,) + stamps.shape
+    shared = {
+        "model": model,
+        "dates": dates,
+        "stamp_pos": stamp_pos,
+        "x0": x0,
+        "psfs": np.asarray(psfs, dtype=np.float64),
+        "wcs_list": wcs_list,
+        "ephemeris": ephemeris,
+    }
+    chunks = [range(i, min(i + chunk_size, num_res)) for i in range(0, num_res, chunk_size)]
+
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    try:
+        cubes = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        cubes[0] = stamps
+        cubes[1] = np.broadcast_to(np.asarray(variances, dtype=np.float64), stamps.shape)
+        del stamps
+
+        if num_workers == 1:
+            _init_fit_worker(shm.name, shape, shared)
+            try:
+                rows = [r for chunk in chunks for r in _fit_candidates(chunk)]
+            finally:
+                # Drop all the inputs (the view of the cubes before its shared memory).
+                worker_shm = _fit_inputs.pop("shm")
+                _fit_inputs.clear()
+                worker_shm.close()
+        else:
+            with mp.Pool(
+                num_workers, initializer=_init_fit_worker, initargs=(shm.name, shape, shared)
+            ) as pool:
+                rows = [r for chunk_rows in pool.map(_fit_candidates, chunks) for r in chunk_rows]
+        del cubes
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,171 @@
+"""Match search results against a local table of known objects.
+
+The network based matching (``koffi`` with JPL or SkyBoT) queries an external
+service for every image. A ``KnownObjectIndex`` is built instead from a
+precomputed ephemeris table that gives the position of each known object at
+the times of the images, so the matching can run on machines without network
+access. The positions at each time are stored in a KD-tree of unit vectors on
+the sky and all the results are matched against it in a single pass per time.
+"""
+
+import numpy as np
+from astropy.table import Table
+from scipy.spatial import cKDTree
+
+
+def _radec_to_unit(ra, dec):
+    """Convert (RA, Dec) in degrees to unit vectors.
+
+    Parameters
+    ----------
+    ra : numpy array
+        The right ascensions in degrees.
+    dec : numpy array
+        The declinations in degrees.
+
+    Returns
+    -------
+    vecs : numpy array
+        The (..., 3) unit vectors.
+    """
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    cos_dec = np.cos(dec)
+    return np.stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)], axis=-1)
+
+
+class KnownObjectIndex:
+    """A per-time spatial index of the known objects' positions.
+
+    Parameters
+    ----------
+    names : list of str
+        The name of the object of each ephemeris entry.
+    mjd : numpy array
+        The time of each entry.
+    ra : numpy array
+        The right ascension of each entry in degrees.
+    dec : numpy array
+        The declination of each entry in degrees.
+    times : numpy array
+        The times of the images (in MJD).
+    time_tol : float
+        The maximum difference (in days) between an entry's time and the image time.
+
+    Attributes
+    ----------
+    object_names : numpy array
+        The unique object names.
+    num_times : int
+        The number of image times.
+    """
+
+    def __init__(self, names, mjd, ra, dec, times, time_tol=1e-3):
+        names = np.asarray(names).astype(str)
+        mjd = np.asarray(mjd, dtype=float)
+        ra = np.asarray(ra, dtype=float)
+        dec = np.asarray(dec, dtype=float)
+        times = np.asarray(times, dtype=float)
+        if len(names) != len(mjd) or len(names) != len(ra) or len(names) != len(dec):
+            raise ValueError("Mismatched lengths of the ephemeris columns.")
+
+        self.object_names, object_ids = np.unique(names, return_inverse=True)
+        self.num_times = len(times)
+
+        # Assign each entry to the closest image time and drop the ones that do not match any.
+        order = np.argsort(times)
+        pos = np.clip(np.searchsorted(times[order], mjd), 1, max(len(times) - 1, 1))
+        before = order[pos - 1]
+        after = order[np.minimum(pos, len(times) - 1)]
+        closest = np.where(np.abs(times[before] - mjd) <= np.abs(times[after] - mjd), before, after)
+        valid = np.abs(times[closest] - mjd) <= time_tol
+
+        vecs = _radec_to_unit(ra, dec)
+        self._trees = []
+        self._ids = []
+        for t in range(self.num_times):
+            mask = valid & (closest == t)
+            self._trees.append(cKDTree(vecs[mask]) if np.any(mask) else None)
+            self._ids.append(object_ids[mask])
+
+    @classmethod
+    def from_file(cls, filename, times, time_tol=1e-3):
+        """Load the ephemeris table from a file with the columns ``name``,
+        ``mjd``, ``ra``, and ``dec`` (in degrees). Any format that can be read
+        by ``astropy.table.Table.read`` (for example csv, ecsv, or fits) can be used.
+
+        Parameters
+        ----------
+        filename : str
+            The name of the file.
+        times : numpy array
+            The times of the images (in MJD).
+        time_tol : float
+            The maximum difference (in days) between an entry's time and the image time.
+
+        Returns
+        -------
+        index : KnownObjectIndex
+            The index.
+        """
+        data = Table.read(filename)
+        return cls(data["name"], data["mjd"], data["ra"], data["dec"], times, time_tol)
+
+    def match(self, ra, dec, thresh, min_obs):
+        """Find the known objects close to each result.
+
+        Parameters
+        ----------
+        ra : numpy array
+            The (N, T) right ascensions of the N results at each time in degrees.
+        dec : numpy array
+            The (N, T) declinations of the N results at each time in degrees.
+        thresh : float
+            The maximum distance (in arcseconds) for a match.
+        min_obs : int
+            The minimum number of times where an object must match a result.
+
+        Returns
+        -------
+        matches : dict
+            A dictionary mapping the index of each result to the list of the names
+            of the objects that match it.
+        """
+        ra = np.atleast_2d(ra)
+        dec = np.atleast_2d(dec)
+        if ra.shape != dec.shape or ra.shape[1] != self.num_times:
+            raise ValueError(f"Positions of shape {ra.shape} do not match {self.num_times} times.")
+        num_res = ra.shape[0]
+
+        # The chord length between two unit vectors separated by the threshold.
+        radius = 2.0 * np.sin(np.radians(thresh / 3600.0) / 2.0)
+        vecs = _radec_to_unit(ra, dec)
+
+        res_inds = []
+        obj_inds = []
+        time_inds = []
+        for t in range(self.num_times):
+            if self._trees[t] is None:
+                continue
+            hits = self._trees[t].query_ball_point(vecs[:, t], radius)
+            counts = np.array([len(h) for h in hits], dtype=int)
+            if np.sum(counts) == 0:
+                continue
+            res_inds.append(np.repeat(np.arange(num_res), counts))
+            obj_inds.append(self._ids[t][np.concatenate(hits).astype(int)])
+            time_inds.append(np.full(np.sum(counts), t))
+
+        matches = {i: [] for i in range(num_res)}
+        if len(res_inds) == 0:
+            return matches
+
+        # Count the distinct times at which each (result, object) pair matched. An object
+        # with several ephemeris entries near the same time only counts once for that time.
+        hits = np.unique(
+            np.stack([np.concatenate(res_inds), np.concatenate(obj_inds), np.concatenate(time_inds)], axis=1),
+            axis=0,
+        )
+        pairs, counts = np.unique(hits[:, 0:2], axis=0, return_counts=True)
+        for res_idx, obj_idx in pairs[counts >= min_obs]:
+            matches[int(res_idx)].append(str(self.object_names[obj_idx]))
+        return matches
@@ -0,0 +1,392 @@
+"""A single-file format for a stack of images and their metadata.
+
+Loading a search from the usual layout opens every FITS file in a directory,
+reads the times and PSFs from separate files, and parses the headers of each
+image. A packed stack file holds the science, variance, and mask layers of all
+the images as three (num_images, height, width) float32 cubes, along with the
+times, PSFs, visit IDs, and WCS headers, so the whole stack can be loaded
+without any per-file opens.
+
+The file starts with a short JSON header that gives the metadata, followed
+by the science, variance, and mask cubes. The cubes are page aligned and
+stored uncompressed, so they can be memory mapped and each image is a
+contiguous chunk that can be read on its own.
+"""
+
+import json
+import os
+
+import numpy as np
+from astropy.io import fits
+from astropy.time import Time
+from astropy.wcs import WCS
+
+import kbmod.search as kb
+
+from .image_info import ImageInfo, ImageInfoSet
+
+# The magic bytes at the start of a packed stack file and the format version.
+_MAGIC = b"KBMODPCK"
+_VERSION = 1
+
+# The alignment (in bytes) of the cubes within the file.
+_ALIGNMENT = 4096
+
+# The layers in the order they are stored.
+_LAYERS = ["science", "variance", "mask"]
+
+
+def _aligned(num_bytes):
+    """Round a number of bytes up to a multiple of the alignment."""
+    return -(-num_bytes // _ALIGNMENT) * _ALIGNMENT
+
+
+def _info_to_dict(info):
+    """Convert the metadata of one image to a JSON-serializable dictionary.
+
+    Parameters
+    ----------
+    info : ``kbmod.image_info.ImageInfo``
+        The image's metadata.
+
+    Returns
+    -------
+    data : dict
+        The metadata.
+    """
+    data = {
+        "filename": info.filename,
+        "visit_id": info.visit_id,
+        "wcs": info.wcs.to_header_string(relax=True) if info.wcs is not None else None,
+        "obs_code": info.obs_code,
+        "obs_loc_set": info.obs_loc_set,
+    }
+    if info.obs_loc_set and info.obs_code == "":
+        data["obs_position"] = [info.obs_lat, info.obs_long, info.obs_alt]
+    return data
+
+
+def _info_from_dict(data, width, height, mjd):
+    """Create the metadata of one image from a dictionary created by ``_info_to_dict``.
+
+    Parameters
+    ----------
+    data : dict
+        The metadata.
+    width : int
+        The width of the image in pixels.
+    height : int
+        The height of the image in pixels.
+    mjd : float
+        The time of the image.
+
+    Returns
+    -------
+    info : ``kbmod.image_info.ImageInfo``
+        The image's metadata.
+    """
+    info = ImageInfo()
+    info.filename = data["filename"]
+    info.visit_id = data["visit_id"]
+    info.width = width
+    info.height = height
+    if data["wcs"] is not None:
+        info.wcs = WCS(fits.Header.fromstring(data["wcs"]))
+        info.center = info.wcs.pixel_to_world(width / 2, height / 2)
+    if "obs_position" in data:
+        info.set_obs_position(*data["obs_position"])
+    elif data["obs_loc_set"]:
+        info.set_obs_code(data["obs_code"])
+    info.set_epoch(Time(mjd, format="mjd", scale="utc"))
+    return info
+
+
+def save_packed_stack(stack, img_info, filename):
+    """Write an image stack and its metadata to a packed stack file.
+
+    Parameters
+    ----------
+    stack : ``kbmod.search.image_stack``
+        The images.
+    img_info : ``kbmod.image_info.ImageInfoSet``
+        The metadata for the images.
+    filename : str
+        The name of the output file.
+
+    Raises
+    ------
+    Raises a ``ValueError`` if the number of images and metadata entries do not match.
+    """
+    images = stack.get_images()
+    num_images = len(images)
+    if num_images != img_info.num_images:
+        raise ValueError(f"Mismatched number of images {num_images} and metadata {img_info.num_images}.")
+    width = stack.get_width()
+    height = stack.get_height()
+
+    header = {
+        "version": _VERSION,
+        "num_images": num_images,
+        "width": width,
+        "height": height,
+        "mjd": img_info.get_all_mjd(),
+        "psfs": [np.array(img.get_psf()).tolist() for img in images],
+        "names": [img.get_name() for img in images],
+        "info": [_info_to_dict(info) for info in img_info.stats],
+    }
+    encoded = json.dumps(header).encode("utf-8")
+    offsets = _layer_offsets(len(encoded), num_images, width, height)
+
+    with open(filename, "wb") as f:
+        f.write(_MAGIC)
+        f.write(np.uint64(len(encoded)).tobytes())
+        f.write(encoded)
+        f.truncate(offsets[-1])
+
+    # Write the images one at a time through memory maps.
+    shape = (num_images, height, width)
+    for layer, offset in zip(_LAYERS, offsets):
+        cube = np.memmap(filename, dtype=np.float32, mode="r+", offset=offset, shape=shape)
+        for i, img in enumerate(images):
+            if layer == "science":
+                cube[i] = np.asarray(img.get_science())
+            elif layer == "variance":
+                cube[i] = np.asarray(img.get_variance())
+            else:
+                cube[i] = np.asarray(img.get_mask())
+        cube.flush()
+        del cube
+
+
+def _layer_offsets(header_size, num_images, width, height):
+    """Compute the byte offsets of the cubes in a packed stack file.
+
+    Parameters
+    ----------
+    header_size : int
+        The size of the encoded JSON header in bytes.
+    num_images : int
+        The number of images.
+    width : int
+        The width of the images in pixels.
+    height : int
+        The height of the images in pixels.
+
+    Returns
+    -------
+    offsets : list of int
+        The offset of each cube (in the order of ``_LAYERS``) followed by the size of the file.
+    """
+    cube_bytes = _aligned(num_images * width * height * np.dtype(np.float32).itemsize)
+    start = _aligned(len(_MAGIC) + 8 + header_size)
+    return [start + i * cube_bytes for i in range(len(_LAYERS) + 1)]
+
+
+def convert_to_packed_stack(im_filepath, time_file, psf_file, default_psf, filename, verbose=False):
+    """Convert a directory of FITS files (and the optional time and PSF files)
+    into a packed stack file.
+
+    Parameters
+    ----------
+    im_filepath : str
+        The directory with the FITS files.
+    time_file : str
+        The file with the image times (or None to use the times in the headers).
+    psf_file : str
+        The file with the image PSFs (or None to use the default PSF).
+    default_psf : ``kbmod.search.psf``
+        The PSF for the images without an entry in the PSF file.
+    filename : str
+        The name of the output file.
+    verbose : bool
+        Use verbose output.
+    """
+    from .analysis_utils import Interface
+
+    stack, img_info = Interface().load_images(im_filepath, time_file, psf_file, None, default_psf, verbose)
+    save_packed_stack(stack, img_info, filename)
+
+
+def is_packed_stack(filename):
+    """Check whether a file is a packed stack file.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the file.
+
+    Returns
+    -------
+    result : bool
+        True if the file is a packed stack.
+    """
+    if filename is None or not os.path.isfile(filename):
+        return False
+    with open(filename, "rb") as f:
+        return f.read(len(_MAGIC)) == _MAGIC
+
+
+class PackedStack:
+    """A read-only view of a packed stack file. The layers are memory mapped,
+    so only the images that are used are read from disk.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the packed stack file.
+
+    Attributes
+    ----------
+    num_images : int
+        The number of images.
+    width : int
+        The width of the images in pixels.
+    height : int
+        The height of the images in pixels.
+    mjd : numpy.ndarray
+        The time of each image.
+    science : numpy.memmap
+        The (num_images, height, width) science cube.
+    variance : numpy.memmap
+        The (num_images, height, width) variance cube.
+    mask : numpy.memmap
+        The (num_images, height, width) mask cube.
+    """
+
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{filename} is not a packed stack file.")
+            header_size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            self.header = json.loads(f.read(header_size).decode("utf-8"))
+        if self.header["version"] > _VERSION:
+            raise ValueError(f"Unsupported packed stack version {self.header['version']}.")
+
+        self.filename = filename
+        self.num_images = self.header["num_images"]
+        self.width = self.header["width"]
+        self.height = self.header["height"]
+        self.mjd = np.array(self.header["mjd"])
+
+        shape = (self.num_images, self.height, self.width)
+        offsets = _layer_offsets(header_size, self.num_images, self.width, self.height)
+        for layer, offset in zip(_LAYERS, offsets):
+            setattr(self, layer, np.memmap(filename, dtype=np.float32, mode="r", offset=offset, shape=shape))
+
+    def get_psf(self, index):
+        """Get the PSF of one image.
+
+        Parameters
+        ----------
+        index : int
+            The index of the image.
+
+        Returns
+        -------
+        psf : ``kbmod.search.psf``
+            The PSF.
+        """
+        return kb.psf(np.array(self.header["psfs"][index], dtype=np.float32))
+
+    def get_layered_image(self, index, region=None):
+        """Build the layered image for one image.
+
+        Parameters
+        ----------
+        index : int
+            The index of the image.
+        region : tuple, optional
+            Only use the pixels (x_min, x_max, y_min, y_max) of the image.
+
+        Returns
+        -------
+        img : ``kbmod.search.layered_image``
+            The image.
+        """
+        x_min, x_max, y_min, y_max = region if region is not None else (0, self.width, 0, self.height)
+        if (
+            x_min < 0
+            or y_min < 0
+            or x_min >= x_max
+            or y_min >= y_max
+            or x_max > self.width
+            or y_max > self.height
+        ):
+            raise ValueError(f"Invalid image region {region}.")
+        return kb.layered_image(
+            self.header["names"][index],
+            kb.raw_image(self.science[index, y_min:y_max, x_min:x_max]),
+            kb.raw_image(self.variance[index, y_min:y_max, x_min:x_max]),
+            kb.raw_image(self.mask[index, y_min:y_max, x_min:x_max]),
+            self.mjd[index],
+            self.get_psf(index),
+        )
+
+    def get_image_info(self, index):
+        """Get the metadata of one image.
+
+        Parameters
+        ----------
+        index : int
+            The index of the image.
+
+        Returns
+        -------
+        info : ``kbmod.image_info.ImageInfo``
+            The metadata.
+        """
+        return _info_from_dict(self.header["info"][index], self.width, self.height, self.mjd[index])
+
+    def load(self, mjd_lims=None, region=None):
+        """Build the image stack and metadata for the images within the time limits.
+
+        Parameters
+        ----------
+        mjd_lims : list of float, optional
+            The minimum and maximum times of the images to load.
+        region : tuple, optional
+            Only use the pixels (x_min, x_max, y_min, y_max) of each image.
+
+        Returns
+        -------
+        stack : ``kbmod.search.image_stack``
+            The images.
+        img_info : ``kbmod.image_info.ImageInfoSet``
+            The metadata for the images.
+        """
+        indices = np.arange(self.num_images)
+        if mjd_lims is not None:
+            indices = indices[(self.mjd >= mjd_lims[0]) & (self.mjd <= mjd_lims[1])]
+
+        img_info = ImageInfoSet()
+        images = []
+        for i in indices:
+            images.append(self.get_layered_image(i, region))
+            img_info.append(self.get_image_info(i))
+        print(f"Loaded {len(images)} images")
+
+        stack = kb.image_stack(images)
+        stack.set_times(img_info.get_zero_shifted_times())
+        return stack, img_info
+
+
+def load_packed_stack(filename, mjd_lims=None, region=None):
+    """Load an image stack and its metadata from a packed stack file.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the packed stack file.
+    mjd_lims : list of float, optional
+        The minimum and maximum times of the images to load.
+    region : tuple, optional
+        Only use the pixels (x_min, x_max, y_min, y_max) of each image.
+
+    Returns
+    -------
+    stack : ``kbmod.search.image_stack``
+        The images.
+    img_info : ``kbmod.image_info.ImageInfoSet``
+        The metadata for the images.
+    """
+    return PackedStack(filename).load(mjd_lims, region)
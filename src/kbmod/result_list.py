@@ -241,6 +241,23 @@ class ResultList:
             else:
                 self.filtered[key] = result_list.filtered[key]
 
+    def offset_positions(self, dx, dy):
+        """Shift the starting pixel of each result (including the filtered
+        results), for example to convert from the coordinates of a cutout
+        to those of the full image.
+
+        Parameters
+        ----------
+        dx : int
+            The shift in the x direction.
+        dy : int
+            The shift in the y direction.
+        """
+        all_rows = self.results + [row for rows in self.filtered.values() for row in rows]
+        for row in all_rows:
+            row.trajectory.x += dx
+            row.trajectory.y += dy
+
     def zip_phi_psi_idx(self):
         """Create and return a list of tuples for each psi/phi curve.
 
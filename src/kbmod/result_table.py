@@ -0,0 +1,273 @@
+"""Load the results of many searches into a single table.
+
+Recovery analyses over a survey read the result files of hundreds of
+searches (one directory per patch such as ``pg300_ccd10``). The files of each
+directory are parsed with whole-file numpy reads in a pool of worker
+processes and the results of all the directories are stacked into a single
+``astropy.table.Table`` with a ``patch`` column identifying their directory.
+The parsed table can be cached in a ``.npz`` file that is reused as long as
+none of the result files have changed.
+"""
+
+import json
+import multiprocessing as mp
+import os
+import warnings
+
+import numpy as np
+from astropy.table import Table
+
+# The columns of the results file (every other token of a trajectory's string).
+_RESULT_COLUMNS = ["lh", "flux", "x", "y", "vx", "vy", "num_obs", "bary_index"]
+
+# The result files that are read (as prefixes of the suffix).
+_RESULT_FILES = ["results", "psi", "phi", "lc", "lc_index", "ps", "all_times", "all_ps"]
+
+
+def _result_filename(results_dir, prefix, suffix):
+    """Get the name of one of the result files of a directory."""
+    ext = "npy" if prefix == "all_ps" else "txt"
+    return os.path.join(results_dir, f"{prefix}_{suffix}.{ext}")
+
+
+def _load_matrix(filename, num_rows, dtype=float):
+    """Load a file with one row of values per result as a 2D array.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the file. The values are separated by commas or whitespace.
+    num_rows : int
+        The number of results.
+    dtype : type
+        The array's dtype.
+
+    Returns
+    -------
+    data : numpy array
+        The (num_rows, M) array. Empty files (where the results do not have
+        the data) give an array with zero columns.
+    """
+    if num_rows == 0 or not os.path.isfile(filename) or os.path.getsize(filename) == 0:
+        return np.zeros((num_rows, 0), dtype=dtype)
+    with open(filename, "r") as f:
+        delimiter = "," if "," in f.readline() else None
+    data = np.loadtxt(filename, dtype=dtype, delimiter=delimiter, ndmin=2)
+    if data.shape[0] != num_rows:
+        raise ValueError(f"{filename} has {data.shape[0]} rows for {num_rows} results.")
+    return data
+
+
+def _load_valid_mask(filename, num_rows, num_times):
+    """Load the valid indices of each result as an (N, T) Boolean mask."""
+    valid = np.zeros((num_rows, num_times), dtype=bool)
+    if num_rows == 0 or not os.path.isfile(filename):
+        return valid
+    with open(filename, "r") as f:
+        rows = f.read().split("\n")
+    for i in range(num_rows):
+        indices = np.fromstring(rows[i], dtype=int, sep=",") if i < len(rows) else []
+        valid[i, indices] = True
+    return valid
+
+
+def load_result_directory(results_dir, suffix, load_all_stamps=False):
+    """Load the result files of one directory.
+
+    Parameters
+    ----------
+    results_dir : str
+        The directory of the result files.
+    suffix : str
+        The suffix of the result files.
+    load_all_stamps : bool
+        Load the individual stamps of each result (the ``all_ps`` file).
+
+    Returns
+    -------
+    columns : dict
+        The arrays of the table columns (see ``load_result_table``). There are no
+        rows if the directory does not have a results file.
+    times : numpy array
+        The times of the directory's images.
+    """
+    result_file = _result_filename(results_dir, "results", suffix)
+    if os.path.isfile(result_file) and os.path.getsize(result_file) > 0:
+        # Files written before the bary_index column was added have 14 tokens per line.
+        with open(result_file, "r") as f:
+            num_tokens = len(f.readline().split())
+        usecols = [1, 3, 5, 7, 9, 11, 13, 15][: num_tokens // 2]
+        res = np.loadtxt(result_file, usecols=usecols, ndmin=2)
+        if res.shape[1] < len(_RESULT_COLUMNS):
+            res = np.concatenate([res, np.zeros((res.shape[0], len(_RESULT_COLUMNS) - res.shape[1]))], axis=1)
+    else:
+        if not os.path.isfile(result_file):
+            warnings.warn(f"No results found in {results_dir}.")
+        res = np.zeros((0, len(_RESULT_COLUMNS)))
+    num_res = res.shape[0]
+
+    times = np.zeros(0)
+    times_file = _result_filename(results_dir, "all_times", suffix)
+    if os.path.isfile(times_file) and os.path.getsize(times_file) > 0:
+        times = np.loadtxt(times_file, delimiter=",", ndmin=1)
+
+    columns = {name: res[:, i] for i, name in enumerate(_RESULT_COLUMNS)}
+    columns["num_obs"] = columns["num_obs"].astype(int)
+    columns["bary_index"] = columns["bary_index"].astype(int)
+    for name in ["psi", "phi", "lc"]:
+        columns[name] = _load_matrix(_result_filename(results_dir, name, suffix), num_res)
+    num_times = max(len(times), columns["psi"].shape[1])
+    columns["valid"] = _load_valid_mask(_result_filename(results_dir, "lc_index", suffix), num_res, num_times)
+    columns["stamp"] = _load_matrix(_result_filename(results_dir, "ps", suffix), num_res)
+
+    if load_all_stamps:
+        all_stamps = np.zeros((num_res, 0))
+        if num_res > 0:
+            all_stamps = np.load(_result_filename(results_dir, "all_ps", suffix)).reshape(num_res, -1)
+        columns["all_stamps"] = all_stamps
+    return columns, times
+
+
+def _load_patch(args):
+    """Load one directory in a worker process."""
+    return load_result_directory(*args)
+
+
+def _pad_columns(column_list, fill):
+    """Stack 2D columns with different widths, padding the narrow ones."""
+    width = max(col.shape[1] for col in column_list)
+    padded = []
+    for col in column_list:
+        if col.shape[1] < width:
+            pad = np.full((col.shape[0], width - col.shape[1]), fill, dtype=col.dtype)
+            col = np.concatenate([col, pad], axis=1)
+        padded.append(col)
+    return np.concatenate(padded)
+
+
+def _fingerprint(directories, suffix, load_all_stamps):
+    """Describe the result files by their names, sizes, and modification times."""
+    files = []
+    for patch, results_dir in directories.items():
+        for prefix in _RESULT_FILES:
+            fname = _result_filename(results_dir, prefix, suffix)
+            if os.path.isfile(fname):
+                stat = os.stat(fname)
+                files.append([patch, fname, stat.st_size, stat.st_mtime_ns])
+    return json.dumps({"suffix": suffix, "all_stamps": load_all_stamps, "files": files})
+
+
+def _load_cache(cache_file, fingerprint):
+    """Load a cached table if it was created from the same files (otherwise return None)."""
+    if cache_file is None or not os.path.isfile(cache_file):
+        return None
+    with np.load(cache_file, allow_pickle=False) as data:
+        if str(data["_fingerprint"]) != fingerprint:
+            return None
+        table = Table({name: data[name] for name in data.files if not name.startswith("_")})
+        table.meta["times"] = {k: np.array(v) for k, v in json.loads(str(data["_times"])).items()}
+    return table
+
+
+def _save_cache(cache_file, fingerprint, table):
+    """Save a table along with the fingerprint of its files."""
+    times = json.dumps({k: v.tolist() for k, v in table.meta["times"].items()})
+    with open(cache_file, "wb") as f:
+        np.savez(
+            f,
+            _fingerprint=np.array(fingerprint),
+            _times=np.array(times),
+            **{name: np.asarray(table[name]) for name in table.colnames},
+        )
+
+
+def load_result_table(directories, suffix, num_workers=1, cache_file=None, load_all_stamps=False):
+    """Load the results of many directories into a single table.
+
+    Parameters
+    ----------
+    directories : dict or list of str
+        A dictionary mapping each patch's name to its result directory, or a list
+        of the directories (named by their base names).
+    suffix : str
+        The suffix of the result files.
+    num_workers : int
+        The number of processes used to parse the directories.
+    cache_file : str, optional
+        The name of a ``.npz`` file where the table is cached. The table is loaded
+        from the cache if none of the result files have changed since it was saved.
+    load_all_stamps : bool
+        Load the individual stamps of each result (the ``all_ps`` file).
+
+    Returns
+    -------
+    table : ``astropy.table.Table``
+        One row per result with the columns ``patch``, ``index`` (the row in the
+        patch's files), ``lh``, ``flux``, ``x``, ``y``, ``vx``, ``vy``, ``num_obs``,
+        ``bary_index``, the (N, T) ``psi``, ``phi``, ``lc``, and ``valid`` (a mask of
+        the valid indices) curves, the flattened coadded ``stamp``, and the flattened
+        ``all_stamps`` (if loaded). Patches with fewer times or smaller stamps
+        are padded with NaN (and invalid indices). The ``times`` of each patch
+        are stored in ``table.meta["times"]``.
+
+    Raises
+    ------
+    Raises a ``ValueError`` if the number of workers is invalid.
+    """
+    if num_workers < 1:
+        raise ValueError(f"Invalid number of workers {num_workers}.")
+    if not isinstance(directories, dict):
+        directories = {os.path.basename(os.path.normpath(d)): d for d in directories}
+
+    fingerprint = _fingerprint(directories, suffix, load_all_stamps)
+    table = _load_cache(cache_file, fingerprint)
+    if table is not None:
+        return table
+
+    args = [(d, suffix, load_all_stamps) for d in directories.values()]
+    if num_workers == 1 or len(args) <= 1:
+        loaded = [_load_patch(a) for a in args]
+    else:
+        with mp.Pool(min(num_workers, len(args))) as pool:
+            loaded = pool.map(_load_patch, args)
+
+    names = list(directories.keys())
+    table = Table()
+    if len(names) > 0:
+        counts = [len(cols["lh"]) for cols, _ in loaded]
+        table["patch"] = np.repeat(np.array(names, dtype=str), counts)
+        table["index"] = np.concatenate([np.arange(n) for n in counts])
+        for name in loaded[0][0]:
+            column_list = [cols[name] for cols, _ in loaded]
+            if column_list[0].ndim == 1:
+                table[name] = np.concatenate(column_list)
+            else:
+                table[name] = _pad_columns(column_list, False if name == "valid" else np.nan)
+    table.meta["times"] = {name: times for name, (_, times) in zip(names, loaded)}
+
+    if cache_file is not None:
+        _save_cache(cache_file, fingerprint, table)
+    return table
+
+
+def select_patch(table, patch):
+    """Get the results of one patch with its curves trimmed to the patch's times.
+
+    Parameters
+    ----------
+    table : ``astropy.table.Table``
+        The table from ``load_result_table``.
+    patch : str
+        The name of the patch.
+
+    Returns
+    -------
+    rows : ``astropy.table.Table``
+        The patch's results.
+    """
+    rows = table[table["patch"] == patch]
+    num_times = len(table.meta["times"].get(patch, []))
+    if num_times > 0:
+        for name in ["psi", "phi", "lc", "valid"]:
+            rows[name] = np.asarray(rows[name])[:, :num_times]
+    return rows
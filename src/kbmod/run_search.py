@@ -4,8 +4,9 @@ import warnings
 
 import astropy.coordinates as astroCoords
 import astropy.units as u
-import koffi
+from .checkpoint import PipelineCheckpoints, array_to_trajectories, trajectories_to_array
 from .configuration import KBMODConfig
+from .instrumentation import Instrumentation
 from .result_list import *
 import numpy as np
 from astropy.time import Time
@@ -32,8 +33,20 @@ class run_search:
     ----------
     config : ``KBMODConfig``
         Search parameters.
+    instrumentation : ``Instrumentation``
+        The timing, memory, and count records for the stages of the most recent run.
+    pixel_offset : ``tuple``
+        The (x, y) position of the loaded region within the full images. The search
+        runs in the coordinates of the region and the results are moved back to the
+        coordinates of the full images.
+    bary_corr : ``numpy.ndarray``
+        The barycentric correction coefficients of the most recent search (or
+        ``None`` if they are not used).
     """
 
+    # The parameters that can change between the searches of ``run_search_sweep``.
+    SWEEP_PARAMS = ["ang_arr", "average_angle", "bary_dist", "lh_level", "max_drift", "num_obs", "v_arr"]
+
     def __init__(self, input_parameters, config_file=None):
         self.config = KBMODConfig()
 
@@ -48,6 +61,10 @@ class run_search:
         # Validate the configuration.
         self.config.validate()
 
+        self.instrumentation = Instrumentation()
+        self.pixel_offset = (0, 0)
+        self.bary_corr = None
+
     def do_gpu_search(self, search, img_info, suggested_angle, post_process):
         """
         Performs search on the GPU.
@@ -64,47 +81,32 @@ class run_search:
         post_process :
             Don't know
         """
-        search_params = {}
-
         # Run the grid search
         # Set min and max values for angle and velocity
-        if self.config["average_angle"] == None:
-            average_angle = suggested_angle
-        else:
-            average_angle = self.config["average_angle"]
-        ang_min = average_angle - self.config["ang_arr"][0]
-        ang_max = average_angle + self.config["ang_arr"][1]
-        vel_min = self.config["v_arr"][0]
-        vel_max = self.config["v_arr"][1]
-        search_params["ang_lims"] = [ang_min, ang_max]
-        search_params["vel_lims"] = [vel_min, vel_max]
+        search_params = self._get_search_lims(suggested_angle)
 
-        # Set the search bounds.
+        # Set the search bounds. The bounds are given in the coordinates of the full
+        # images, while the search uses the coordinates of the loaded region.
+        x_offset, y_offset = self.pixel_offset
         if self.config["x_pixel_bounds"] and len(self.config["x_pixel_bounds"]) == 2:
-            search.set_start_bounds_x(self.config["x_pixel_bounds"][0], self.config["x_pixel_bounds"][1])
+            search.set_start_bounds_x(
+                self.config["x_pixel_bounds"][0] - x_offset, self.config["x_pixel_bounds"][1] - x_offset
+            )
         elif self.config["x_pixel_buffer"] and self.config["x_pixel_buffer"] > 0:
             width = search.get_image_stack().get_width()
             search.set_start_bounds_x(-self.config["x_pixel_buffer"], width + self.config["x_pixel_buffer"])
 
         if self.config["y_pixel_bounds"] and len(self.config["y_pixel_bounds"]) == 2:
-            search.set_start_bounds_y(self.config["y_pixel_bounds"][0], self.config["y_pixel_bounds"][1])
+            search.set_start_bounds_y(
+                self.config["y_pixel_bounds"][0] - y_offset, self.config["y_pixel_bounds"][1] - y_offset
+            )
         elif self.config["y_pixel_buffer"] and self.config["y_pixel_buffer"] > 0:
             height = search.get_image_stack().get_height()
             search.set_start_bounds_y(-self.config["y_pixel_buffer"], height + self.config["y_pixel_buffer"])
 
         # If we are using barycentric corrections, compute the parameters and
         # enable it in the search function.
-        if self.config["bary_dist"] is not None:
-            bary_corr = self._calc_barycentric_corr(img_info, self.config["bary_dist"])
-            # print average barycentric velocity for debugging
-
-            mjd_range = img_info.get_duration()
-            bary_vx = bary_corr[-1, 0] / mjd_range
-            bary_vy = bary_corr[-1, 3] / mjd_range
-            bary_v = np.sqrt(bary_vx * bary_vx + bary_vy * bary_vy)
-            bary_ang = np.arctan2(bary_vy, bary_vx)
-            print("Average Velocity from Barycentric Correction", bary_v, "pix/day", bary_ang, "angle")
-            search.enable_corr(bary_corr.flatten())
+        self._set_barycentric_corr(search, img_info)
 
         search_start = time.time()
         print("Starting Search")
@@ -132,24 +134,41 @@ class run_search:
 
         # If we are using an encoded image representation on GPU, enable it and
         # set the parameters.
-        if self.config["encode_psi_bytes"] > 0 or self.config["encode_phi_bytes"] > 0:
-            search.enable_gpu_encoding(self.config["encode_psi_bytes"], self.config["encode_phi_bytes"])
+        self._enable_gpu_encoding(search)
+
+        # If requested, skip the starting pixels that cannot reach enough unmasked data.
+        if self.config["min_reachable_frac"] is not None:
+            search.enable_start_pixel_filter(float(self.config["min_reachable_frac"]))
 
         # Enable debugging.
         if self.config["debug"]:
             search.set_debug(self.config["debug"])
 
-        search.search(
-            int(self.config["ang_arr"][2]),
-            int(self.config["v_arr"][2]),
-            *search_params["ang_lims"],
-            *search_params["vel_lims"],
-            int(self.config["num_obs"]),
-        )
+        # If a maximum drift is given, build the velocity grid from it instead of
+        # using the fixed number of angle and velocity steps.
+        if self.config["max_drift"] is not None:
+            with self.instrumentation.span("search"):
+                search.search_drift(
+                    float(self.config["max_drift"]),
+                    *search_params["ang_lims"],
+                    *search_params["vel_lims"],
+                    int(self.config["num_obs"]),
+                )
+                self.instrumentation.add_search_timings(search)
+        else:
+            with self.instrumentation.span("search"):
+                search.search(
+                    int(self.config["ang_arr"][2]),
+                    int(self.config["v_arr"][2]),
+                    *search_params["ang_lims"],
+                    *search_params["vel_lims"],
+                    int(self.config["num_obs"]),
+                )
+                self.instrumentation.add_search_timings(search)
         print("Search finished in {0:.3f}s".format(time.time() - search_start), flush=True)
         return (search, search_params)
 
-    def run_search(self):
+    def run_search(self, instrumentation_callback=None, loaded_images=None, search=None, save=True):
         """This function serves as the highest-level python interface for starting
         a KBMOD search.
 
@@ -157,6 +176,19 @@ class run_search:
 
         Parameters
         ----------
+        instrumentation_callback : function, optional
+            A function that is called with each ``kbmod.instrumentation.Span``
+            as the stage finishes.
+        loaded_images : tuple, optional
+            The output of ``load_and_mask_images`` if the images were already
+            loaded (for example by a prefetching thread). In this case the
+            ``instrumentation`` attribute used while loading is kept.
+        search : ``kbmod.search.stack_search``, optional
+            A search object for the stack in ``loaded_images`` (for example
+            with the psi/phi images already generated).
+        save : bool
+            Save the results at the end of the search. If False, the caller
+            is responsible for calling ``save_results``.
         self.config.im_filepath : string
             Path to the folder containing the images to be ingested into
             KBMOD and searched over.
@@ -182,6 +214,9 @@ class run_search:
         self.config.average_angle : float
             Overrides the ecliptic angle calculation and instead centers
             the average search around average_angle.
+        self.config.checkpoint : bool
+            Save the output of each stage to ``res_filepath`` and resume
+            after the last valid checkpoint when rerun.
 
         Returns
         -------
@@ -189,60 +224,288 @@ class run_search:
             The results.
         """
         start = time.time()
+        if loaded_images is None:
+            self.instrumentation = Instrumentation(instrumentation_callback)
+
+        # Find the last stage that can be loaded from a checkpoint.
+        checkpoint_dir = self.config["res_filepath"] if self.config["checkpoint"] else None
+        checkpoints = PipelineCheckpoints(self.config, checkpoint_dir, self.config["output_suffix"])
+        resume_stage, resume_data = checkpoints.find_resume_point()
+        if resume_stage is not None:
+            print(f"Resuming from the {resume_stage} checkpoint.")
+
+        # The images are only needed if there is a stage left to run that uses them.
+        img_info, kb_post_process = None, None
+        if loaded_images is None and (not checkpoints.completed("stamps") or self.config["known_obj_thresh"]):
+            loaded_images = self.load_and_mask_images()
+        if loaded_images is not None:
+            stack, img_info, suggested_angle, kb_post_process = loaded_images
+            if search is None:
+                search = kb.stack_search(stack)
+            if self.config["release_layers"]:
+                self._release_layers(stack, search)
+
+        # Perform the actual search (or restore its results).
+        if resume_stage is None:
+            search, search_params = self.do_gpu_search(search, img_info, suggested_angle, kb_post_process)
+            if checkpoints.enabled:
+                trajectories = self._get_search_results(search)
+                checkpoints.save(
+                    "search",
+                    {"search_params": search_params, "trajectories": trajectories_to_array(trajectories)},
+                )
+        else:
+            search_params = resume_data["search_params"]
+            if search is not None:
+                self._set_barycentric_corr(search, img_info)
+            if resume_stage == "search":
+                search.set_results(array_to_trajectories(resume_data["trajectories"]))
+
+        # Load the KBMOD results into Python and filter them.
+        keep = self._filter_search_results(search, search_params, img_info, kb_post_process, checkpoints)
+
+        # Extract all the stamps.
+        if not checkpoints.completed("stamps"):
+            with self.instrumentation.span("stamps", num_results=keep.num_results()):
+                kb_post_process.get_all_stamps(keep, search, self.config["stamp_radius"])
+
+            # Move the results to the coordinates of the full images.
+            if self.pixel_offset != (0, 0):
+                keep.offset_positions(*self.pixel_offset)
+            checkpoints.save("stamps", {"search_params": search_params, "results": keep})
+
+        # Count how many known objects we found.
+        if self.config["known_obj_thresh"]:
+            with self.instrumentation.span("known_matches", num_results=keep.num_results()):
+                self._count_known_matches(keep, img_info)
+
+        del search
+
+        # Save the results and the configuration information used.
+        print(f"Found {keep.num_results()} potential trajectories.")
+        if save:
+            self.save_results(keep)
+
+        end = time.time()
+        print("Time taken for patch: ", end - start)
+
+        return keep
+
+    def save_results(self, keep):
+        """Save the results, the configuration, and (if ``timing_format`` is
+        set) the instrumentation records to ``res_filepath``.
+
+        Parameters
+        ----------
+        keep : ResultList
+            The results.
+        """
+        if self.config["res_filepath"] is not None:
+            with self.instrumentation.span("save", num_results=keep.num_results()):
+                keep.save_to_files(self.config["res_filepath"], self.config["output_suffix"])
+
+                config_filename = os.path.join(
+                    self.config["res_filepath"], f"config_{self.config['output_suffix']}.yml"
+                )
+                self.config.save_configuration(config_filename, overwrite=True)
+        self._save_instrumentation()
+
+    def run_search_sweep(self, sweep_params, instrumentation_callback=None):
+        """Run multiple searches over the same stack of images. The images are
+        loaded, masked, and transferred to the GPU once and then reused by each
+        of the searches.
+
+        Parameters
+        ----------
+        sweep_params : list of dict
+            Each dictionary gives the values of the parameters (from
+            ``SWEEP_PARAMS``) to use for one of the searches. All other parameters
+            are taken from the ``config`` attribute.
+        instrumentation_callback : function, optional
+            A function that is called with each ``kbmod.instrumentation.Span``
+            as the stage finishes.
+
+        Returns
+        -------
+        results : list of ResultList
+            The filtered results for each of the searches (in the same order
+            as ``sweep_params``). The stamps are not extracted.
+
+        Raises
+        ------
+        Raises a ``ValueError`` if a dictionary contains a parameter that cannot
+        vary within a sweep.
+        """
+        for params in sweep_params:
+            for key in params:
+                if key not in self.SWEEP_PARAMS:
+                    raise ValueError(f"Parameter {key} cannot vary within a search sweep.")
+
+        self.instrumentation = Instrumentation(instrumentation_callback)
+        # The region the search can reach depends on the parameters that vary, so the
+        # whole images are loaded.
+        stack, img_info, suggested_angle, kb_post_process = self.load_and_mask_images(use_search_region=False)
+        search = kb.stack_search(stack)
+        if self.config["release_layers"]:
+            self._release_layers(stack, search)
+
+        # The encoding is fixed once the images are on the GPU.
+        self._enable_gpu_encoding(search)
+        with self.instrumentation.span("start_session"):
+            search.start_session()
+            self.instrumentation.add_search_timings(search)
+
+        results = []
+        try:
+            for i, params in enumerate(sweep_params):
+                # Temporarily override the configuration for this search.
+                original = {key: self.config[key] for key in params}
+                self.config.set_from_dict(params)
+                try:
+                    with self.instrumentation.span(f"sweep_{i}"):
+                        search, search_params = self.do_gpu_search(
+                            search, img_info, suggested_angle, kb_post_process
+                        )
+                        keep = self._filter_search_results(search, search_params, img_info, kb_post_process)
+                finally:
+                    self.config.set_from_dict(original)
+
+                print(f"Found {keep.num_results()} potential trajectories.")
+                results.append(keep)
+        finally:
+            search.end_session()
+
+        self._save_instrumentation()
+        return results
+
+    def load_and_mask_images(self, use_search_region=True):
+        """Load the images and apply the masks.
+
+        Parameters
+        ----------
+        use_search_region : ``bool``
+            If ``load_search_region`` is set, only read the region of the images that
+            the search can reach (see ``_calc_search_region``) and set ``pixel_offset``.
+
+        Returns
+        -------
+        stack : ``kbmod.search.image_stack``
+            The masked images.
+        img_info : ``kbmod.image_info.ImageInfoSet``
+            The metadata for the images.
+        suggested_angle : ``float``
+            The ecliptic angle for the images.
+        kb_post_process : ``kbmod.analysis_utils.PostProcess``
+            The post processing object.
+        """
         kb_interface = Interface()
 
         # Load the PSF.
         default_psf = kb.psf(self.config["psf_val"])
 
         # Load images to search
-        stack, img_info = kb_interface.load_images(
-            self.config["im_filepath"],
-            self.config["time_file"],
-            self.config["psf_file"],
-            self.config["mjd_lims"],
-            default_psf,
-            verbose=self.config["debug"],
-        )
+        with self.instrumentation.span("load_images") as span:
+            stack, img_info = kb_interface.load_images(
+                self.config["im_filepath"],
+                self.config["time_file"],
+                self.config["psf_file"],
+                self.config["mjd_lims"],
+                default_psf,
+                verbose=self.config["debug"],
+                lazy=self.config["release_layers"] or self.config["load_search_region"],
+            )
+            span.set_count("num_images", stack.img_count())
 
         # Compute the ecliptic angle for the images.
         center_pixel = (img_info.stats[0].width / 2, img_info.stats[0].height / 2)
         suggested_angle = self._calc_suggested_angle(img_info.stats[0].wcs, center_pixel)
 
+        # Restrict the (not yet read) images to the region the search can reach. The
+        # images of a packed stack are already in memory, so they are not cropped.
+        self.pixel_offset = (0, 0)
+        if (
+            use_search_region
+            and self.config["load_search_region"]
+            and not stack.get_single_image(0).is_loaded()
+        ):
+            region = self._calc_search_region(stack, img_info, suggested_angle)
+            if region is not None:
+                print(f"Loading the region x=[{region[0]}, {region[1]}), y=[{region[2]}, {region[3]})")
+                stack.set_region(*region)
+                self.pixel_offset = (region[0], region[2])
+
         # Set up the post processing data structure.
         kb_post_process = PostProcess(self.config, img_info.get_all_mjd())
 
         # Apply the mask to the images.
         if self.config["do_mask"]:
-            stack = kb_post_process.apply_mask(
-                stack,
-                mask_num_images=self.config["mask_num_images"],
-                mask_threshold=self.config["mask_threshold"],
-                mask_grow=self.config["mask_grow"],
-            )
+            with self.instrumentation.span("mask"):
+                stack = kb_post_process.apply_mask(
+                    stack,
+                    mask_num_images=self.config["mask_num_images"],
+                    mask_threshold=self.config["mask_threshold"],
+                    mask_grow=self.config["mask_grow"],
+                )
 
-        # Perform the actual search.
-        search = kb.stack_search(stack)
-        search, search_params = self.do_gpu_search(search, img_info, suggested_angle, kb_post_process)
+        return stack, img_info, suggested_angle, kb_post_process
+
+    def _filter_search_results(self, search, search_params, img_info, kb_post_process, checkpoints=None):
+        """Load the results of a search into Python and apply the configured
+        likelihood, stamp, and clustering filters.
+
+        Parameters
+        ----------
+        search : ``kbmod.search.stack_search``
+            The search object after the search has been run.
+        search_params : ``dict``
+            The search limits returned by ``do_gpu_search``.
+        img_info : ``kbmod.image_info.ImageInfoSet``
+            The metadata for the images.
+        kb_post_process : ``kbmod.analysis_utils.PostProcess``
+            The post processing object.
+        checkpoints : ``kbmod.checkpoint.PipelineCheckpoints``, optional
+            The checkpoints for the run. The output of each filtering stage is
+            saved and the stages completed before the resume point are skipped.
+
+        Returns
+        -------
+        keep : ResultList
+            The filtered results.
+        """
+        if checkpoints is None:
+            checkpoints = PipelineCheckpoints(self.config, None, None)
+        if checkpoints.completed("cluster"):
+            return checkpoints.resume_data["results"]
 
         # Load the KBMOD results into Python and apply a filter based on
         # 'filter_type.
-        mjds = np.array(img_info.get_all_mjd())
-        keep = kb_post_process.load_and_filter_results(
-            search,
-            self.config["lh_level"],
-            chunk_size=self.config["chunk_size"],
-            max_lh=self.config["max_lh"],
-        )
-        if self.config["do_stamp_filter"]:
-            kb_post_process.apply_stamp_filter(
-                keep,
-                search,
-                center_thresh=self.config["center_thresh"],
-                peak_offset=self.config["peak_offset"],
-                mom_lims=self.config["mom_lims"],
-                stamp_type=self.config["stamp_type"],
-                stamp_radius=self.config["stamp_radius"],
-            )
+        if checkpoints.completed("retrieve"):
+            keep = checkpoints.resume_data["results"]
+        else:
+            with self.instrumentation.span("load_and_filter") as span:
+                keep = kb_post_process.load_and_filter_results(
+                    search,
+                    self.config["lh_level"],
+                    chunk_size=self.config["chunk_size"],
+                    max_lh=self.config["max_lh"],
+                )
+                span.set_count("out", keep.num_results())
+            checkpoints.save("retrieve", {"search_params": search_params, "results": keep})
+
+        if self.config["do_stamp_filter"] and not checkpoints.completed("filter"):
+            with self.instrumentation.span("stamp_filter", **{"in": keep.num_results()}) as span:
+                kb_post_process.apply_stamp_filter(
+                    keep,
+                    search,
+                    center_thresh=self.config["center_thresh"],
+                    peak_offset=self.config["peak_offset"],
+                    mom_lims=self.config["mom_lims"],
+                    stamp_type=self.config["stamp_type"],
+                    stamp_radius=self.config["stamp_radius"],
+                )
+                span.set_count("out", keep.num_results())
+        if not checkpoints.completed("filter"):
+            checkpoints.save("filter", {"search_params": search_params, "results": keep})
 
         if self.config["do_clustering"]:
             cluster_params = {}
@@ -250,34 +513,210 @@ class run_search:
             cluster_params["y_size"] = img_info.get_y_size()
             cluster_params["vel_lims"] = search_params["vel_lims"]
             cluster_params["ang_lims"] = search_params["ang_lims"]
-            cluster_params["mjd"] = mjds
-            kb_post_process.apply_clustering(keep, cluster_params)
+            cluster_params["mjd"] = np.array(img_info.get_all_mjd())
+            with self.instrumentation.span("clustering", **{"in": keep.num_results()}) as span:
+                kb_post_process.apply_clustering(keep, cluster_params)
+                span.set_count("out", keep.num_results())
+        checkpoints.save("cluster", {"search_params": search_params, "results": keep})
 
-        # Extract all the stamps.
-        kb_post_process.get_all_stamps(keep, search, self.config["stamp_radius"])
+        return keep
 
-        # Count how many known objects we found.
-        if self.config["known_obj_thresh"]:
-            self._count_known_matches(keep, search)
+    def _get_search_lims(self, suggested_angle):
+        """Get the angle and velocity limits of the search.
 
-        del search
+        Parameters
+        ----------
+        suggested_angle : ``float``
+            The ecliptic angle for the images, used if ``average_angle`` is not set.
 
-        # Save the results and the configuration information used.
-        print(f"Found {keep.num_results()} potential trajectories.")
-        if self.config["res_filepath"] is not None:
-            keep.save_to_files(self.config["res_filepath"], self.config["output_suffix"])
+        Returns
+        -------
+        search_params : ``dict``
+            The limits as ``ang_lims`` and ``vel_lims``.
+        """
+        if self.config["average_angle"] == None:
+            average_angle = suggested_angle
+        else:
+            average_angle = self.config["average_angle"]
+        ang_min = average_angle - self.config["ang_arr"][0]
+        ang_max = average_angle + self.config["ang_arr"][1]
+        vel_min = self.config["v_arr"][0]
+        vel_max = self.config["v_arr"][1]
+        return {"ang_lims": [ang_min, ang_max], "vel_lims": [vel_min, vel_max]}
+
+    def _calc_search_region(self, stack, img_info, suggested_angle):
+        """Compute the region of the images that trajectories starting within
+        ``x_pixel_bounds`` and ``y_pixel_bounds`` can reach with the configured
+        angle and velocity limits. The region is padded by the PSF radius (for the
+        convolution), the stamp radius, and the mask growth.
 
-            config_filename = os.path.join(
-                self.config["res_filepath"], f"config_{self.config['output_suffix']}.yml"
+        Parameters
+        ----------
+        stack : ``kbmod.search.image_stack``
+            The images.
+        img_info : ``kbmod.image_info.ImageInfoSet``
+            The metadata for the images.
+        suggested_angle : ``float``
+            The ecliptic angle for the images.
+
+        Returns
+        -------
+        region : ``tuple`` or ``None``
+            The region (x_min, x_max, y_min, y_max) in the coordinates of the full
+            images, or ``None`` if the whole images are needed. This is always the case
+            if no pixel bounds are given or barycentric corrections are used (they
+            shift the positions by amounts that are only known after loading).
+        """
+        x_bounds = self.config["x_pixel_bounds"]
+        y_bounds = self.config["y_pixel_bounds"]
+        has_x = x_bounds is not None and len(x_bounds) == 2
+        has_y = y_bounds is not None and len(y_bounds) == 2
+        if (not has_x and not has_y) or self.config["bary_dist"] is not None:
+            return None
+
+        # The extremes of v * cos(a) and v * sin(a) over the ranges of angles and
+        # velocities are at the ends of the ranges or at the multiples of pi/2.
+        lims = self._get_search_lims(suggested_angle)
+        ang_min, ang_max = lims["ang_lims"]
+        first = int(np.ceil(ang_min / (np.pi / 2)))
+        last = int(np.floor(ang_max / (np.pi / 2)))
+        angles = np.array([ang_min, ang_max] + [k * np.pi / 2 for k in range(first, last + 1)])
+        vel = np.array(lims["vel_lims"])
+        times = np.array(img_info.get_zero_shifted_times())
+        t_lims = np.array([min(times.min(), 0.0), max(times.max(), 0.0)])
+        dx = np.outer(np.outer(np.cos(angles), vel), t_lims)
+        dy = np.outer(np.outer(np.sin(angles), vel), t_lims)
+
+        pad = max(stack.get_single_image(i).get_psf().get_radius() for i in range(stack.img_count()))
+        pad += self.config["stamp_radius"] + 1
+        if self.config["do_mask"]:
+            pad += self.config["mask_grow"]
+
+        width = stack.get_width()
+        height = stack.get_height()
+        region = [0, width, 0, height]
+        if has_x:
+            region[0] = max(int(np.floor(x_bounds[0] + dx.min() - pad)), 0)
+            region[1] = min(int(np.ceil(x_bounds[1] + dx.max() + pad)), width)
+        if has_y:
+            region[2] = max(int(np.floor(y_bounds[0] + dy.min() - pad)), 0)
+            region[3] = min(int(np.ceil(y_bounds[1] + dy.max() + pad)), height)
+
+        if region[0] >= region[1] or region[2] >= region[3] or region == [0, width, 0, height]:
+            return None
+        return tuple(region)
+
+    def _release_layers(self, stack, search):
+        """Free the image layers that are not needed once the search object exists.
+        The search keeps its own copy of the images, so all the layers of ``stack``
+        are released. The search's copy only needs the science layer (for the stamps)
+        once the psi and phi images are generated.
+
+        Parameters
+        ----------
+        stack : ``kbmod.search.image_stack``
+            The images used to create the search.
+        search : ``kbmod.search.stack_search``
+            The search object.
+        """
+        with self.instrumentation.span("psi_phi"):
+            stack.release_layers(False)
+            search.release_image_layers()
+
+    def _enable_gpu_encoding(self, search):
+        """Enable the compressed representation of the psi and phi images on
+        the GPU if it is configured.
+
+        Parameters
+        ----------
+        search : ``kbmod.search.stack_search``
+            The search object.
+        """
+        if self.config["encode_psi_bytes"] > 0 or self.config["encode_phi_bytes"] > 0:
+            search.enable_gpu_encoding(
+                self.config["encode_psi_bytes"],
+                self.config["encode_phi_bytes"],
+                tile_size=self.config["encode_tile_size"],
+                clip_frac=self.config["encode_clip_frac"],
+                half=self.config["encode_half"],
             )
-            self.config.save_configuration(config_filename, overwrite=True)
 
-        end = time.time()
-        print("Time taken for patch: ", end - start)
+    def _set_barycentric_corr(self, search, img_info):
+        """Enable the barycentric corrections for the distances in ``bary_dist``
+        (or disable them if it is ``None``).
 
-        return keep
+        Parameters
+        ----------
+        search : ``kbmod.search.stack_search``
+            The search object.
+        img_info : ``kbmod.image_info.ImageInfoSet``
+            The metadata for the images.
+        """
+        # If multiple distances are given, every trajectory is searched with each of them
+        # and the result's bary_index gives the position of the distance in the list.
+        if self.config["bary_dist"] is not None:
+            all_bary_corr = []
+            for dist in np.atleast_1d(self.config["bary_dist"]):
+                bary_corr = self._calc_barycentric_corr(img_info, dist)
+                # print average barycentric velocity for debugging
+
+                mjd_range = img_info.get_duration()
+                bary_vx = bary_corr[-1, 0] / mjd_range
+                bary_vy = bary_corr[-1, 3] / mjd_range
+                bary_v = np.sqrt(bary_vx * bary_vx + bary_vy * bary_vy)
+                bary_ang = np.arctan2(bary_vy, bary_vx)
+                print(
+                    f"Average Velocity from Barycentric Correction at {dist} au",
+                    bary_v,
+                    "pix/day",
+                    bary_ang,
+                    "angle",
+                )
+                all_bary_corr.append(bary_corr.flatten())
+            self.bary_corr = np.concatenate(all_bary_corr)
+            search.enable_corr(self.bary_corr)
+        else:
+            self.bary_corr = None
+            search.disable_corr()
+
+    def _get_search_results(self, search):
+        """Get all the search results with a likelihood of at least ``lh_level``
+        (the results that ``load_and_filter_results`` can use).
+
+        Parameters
+        ----------
+        search : ``kbmod.search.stack_search``
+            The search object after the search has been run.
+
+        Returns
+        -------
+        results : numpy.ndarray
+            The results (as an array of ``kbmod.search.trajectory_dtype``) sorted by
+            decreasing likelihood.
+        """
+        results = []
+        start = 0
+        chunk_size = self.config["chunk_size"]
+        while True:
+            chunk = search.get_results_array(start, chunk_size)
+            results.append(chunk[chunk["lh"] >= self.config["lh_level"]])
+            if len(chunk) < chunk_size or chunk["lh"][-1] < self.config["lh_level"]:
+                return np.concatenate(results)
+            start += chunk_size
+
+    def _save_instrumentation(self):
+        """Save the instrumentation records to the results directory if
+        the ``timing_format`` parameter is set (the format is checked when
+        the configuration is validated).
+        """
+        fmt = self.config["timing_format"]
+        if fmt is None or self.config["res_filepath"] is None:
+            return
+
+        filename = os.path.join(self.config["res_filepath"], f"timing_{self.config['output_suffix']}.{fmt}")
+        self.instrumentation.save(filename)
 
-    def _count_known_matches(self, result_list, search):
+    def _count_known_matches(self, result_list, img_info):
         """Look up the known objects that overlap the images and count how many
         are found among the results.
 
@@ -285,60 +724,93 @@ class run_search:
         ----------
         result_list : ``kbmod.ResultList``
             The result objects found by the search.
-        search : ``kbmod.search.stack_search``
-            A stack_search object containing information about the search.
+        img_info : ``kbmod.image_info.ImageInfoSet``
+            The metadata for the images.
+        """
+        known_obj_thresh = self.config["known_obj_thresh"]
+        min_obs = self.config["known_obj_obs"]
+        trjs = [row.trajectory for row in result_list.results]
+
+        print("-----------------")
+        if self.config["known_obj_file"] is not None:
+            from .known_objects import KnownObjectIndex
+
+            print(f"Matching known objects from {self.config['known_obj_file']}")
+            index = KnownObjectIndex.from_file(self.config["known_obj_file"], img_info.get_all_mjd())
+            ra, dec = img_info.trajectories_to_radec(trjs, self.bary_corr)
+            matches = index.match(ra, dec, known_obj_thresh, min_obs)
+        else:
+            matches = self._query_known_matches(trjs, img_info, known_obj_thresh, min_obs)
+
+        matches_string = ""
+        num_found = 0
+        for ps_id in matches.keys():
+            if len(matches[ps_id]) > 0:
+                num_found += 1
+                matches_string += f"result id {ps_id}:" + str(matches[ps_id])[1:-1] + "\n"
+        print(
+            "Found %i objects with at least %i potential observations." % (num_found, self.config["num_obs"])
+        )
+
+        if num_found > 0:
+            print(matches_string)
+        print("-----------------")
+
+    def _query_known_matches(self, trjs, img_info, known_obj_thresh, min_obs):
+        """Query JPL or SkyBoT for the known objects that overlap the images
+        and match them against the results.
+
+        Parameters
+        ----------
+        trjs : list of trajectory
+            The trajectories of the results.
+        img_info : ``kbmod.image_info.ImageInfoSet``
+            The metadata for the images.
+        known_obj_thresh : float
+            The matching threshold in arcseconds.
+        min_obs : int
+            The minimum number of matching observations.
+
+        Returns
+        -------
+        matches : dict
+            A dictionary mapping the index of each result to its matches.
         """
+        # Import koffi only when needed to keep the package import fast.
+        import koffi
+
         # Get the image metadata
         im_filepath = self.config["im_filepath"]
         filenames = sorted(os.listdir(im_filepath))
         image_list = [os.path.join(im_filepath, im_name) for im_name in filenames]
         metadata = koffi.ImageMetadataStack(image_list)
 
-        # Get the pixel positions of results
+        # Get the pixel positions of all the results at once.
+        xs, ys = img_info.trajectories_to_pixels(trjs, self.bary_corr)
         ps_list = []
 
-        for row in result_list.results:
-            pix_pos_objs = search.get_mult_traj_pos(row.trajectory)
-            pixel_positions = list(map(lambda p: [p.x, p.y], pix_pos_objs))
+        for i in range(len(trjs)):
+            pixel_positions = np.stack([xs[i], ys[i]], axis=-1).tolist()
             ps = koffi.PotentialSource()
             ps.build_from_images_and_xy_positions(pixel_positions, metadata)
             ps_list.append(ps)
 
-        print("-----------------")
-        matches = {}
-        known_obj_thresh = self.config["known_obj_thresh"]
-        min_obs = self.config["known_obj_obs"]
         if self.config["known_obj_jpl"]:
             print("Quering known objects from JPL")
-            matches = koffi.jpl_query_known_objects_stack(
-                potential_sources=ps_list,
-                images=metadata,
-                min_observations=min_obs,
-                tolerance=known_obj_thresh,
-            )
-        else:
-            print("Quering known objects from SkyBoT")
-            matches = koffi.skybot_query_known_objects_stack(
+            return koffi.jpl_query_known_objects_stack(
                 potential_sources=ps_list,
                 images=metadata,
                 min_observations=min_obs,
                 tolerance=known_obj_thresh,
             )
-
-        matches_string = ""
-        num_found = 0
-        for ps_id in matches.keys():
-            if len(matches[ps_id]) > 0:
-                num_found += 1
-                matches_string += f"result id {ps_id}:" + str(matches[ps_id])[1:-1] + "\n"
-        print(
-            "Found %i objects with at least %i potential observations." % (num_found, self.config["num_obs"])
+        print("Quering known objects from SkyBoT")
+        return koffi.skybot_query_known_objects_stack(
+            potential_sources=ps_list,
+            images=metadata,
+            min_observations=min_obs,
+            tolerance=known_obj_thresh,
         )
 
-        if num_found > 0:
-            print(matches_string)
-        print("-----------------")
-
     def _calc_barycentric_corr(self, img_info, dist):
         """
         This function calculates the barycentric corrections between
@@ -0,0 +1,240 @@
+/*
+ * ImageEncoding.cpp
+ *
+ * Helper functions for compressing the psi/phi images that are loaded on to the GPU.
+ */
+
+#include "ImageEncoding.h"
+
+namespace search {
+
+// The half precision value used for NO_DATA (a quiet NaN).
+constexpr uint16_t HALF_NO_DATA = 0x7e00;
+
+uint16_t floatToHalf(float value) {
+    uint32_t bits;
+    std::memcpy(&bits, &value, sizeof(bits));
+    const uint16_t sign = (bits >> 16) & 0x8000;
+    const int raw_exponent = (bits >> 23) & 0xff;
+    uint32_t mantissa = bits & 0x7fffff;
+
+    // Infinity and NaN.
+    if (raw_exponent == 0xff) return sign | 0x7c00 | (mantissa ? 0x200 : 0);
+
+    const int exponent = raw_exponent - 127 + 15;
+    if (exponent >= 31) return sign | 0x7c00;
+
+    // Values below the normal range become subnormals (or zero).
+    if (exponent <= 0) {
+        if (exponent < -10) return sign;
+        mantissa |= 0x800000;
+        const int shift = 14 - exponent;
+        uint32_t result = mantissa >> shift;
+        const uint32_t remainder = mantissa & ((1u << shift) - 1);
+        const uint32_t halfway = 1u << (shift - 1);
+        if (remainder > halfway || (remainder == halfway && (result & 1))) ++result;
+        return sign | result;
+    }
+
+    // A carry from the rounding correctly moves into the exponent.
+    uint16_t result = sign | (exponent << 10) | (mantissa >> 13);
+    const uint32_t remainder = mantissa & 0x1fff;
+    if (remainder > 0x1000 || (remainder == 0x1000 && (result & 1))) ++result;
+    return result;
+}
+
+float halfToFloat(uint16_t value) {
+    const uint32_t sign = (value & 0x8000) << 16;
+    uint32_t exponent = (value >> 10) & 0x1f;
+    uint32_t mantissa = value & 0x3ff;
+
+    uint32_t bits;
+    if (exponent == 0x1f) {
+        bits = sign | 0x7f800000 | (mantissa << 13);
+    } else if (exponent == 0) {
+        if (mantissa == 0) {
+            bits = sign;
+        } else {
+            // Normalize the subnormal value.
+            exponent = 127 - 14;
+            while (!(mantissa & 0x400)) {
+                mantissa <<= 1;
+                --exponent;
+            }
+            bits = sign | (exponent << 23) | ((mantissa & 0x3ff) << 13);
+        }
+    } else {
+        bits = sign | ((exponent + 127 - 15) << 23) | (mantissa << 13);
+    }
+
+    float result;
+    std::memcpy(&result, &bits, sizeof(result));
+    return result;
+}
+
+static void checkEncodingArgs(const std::vector<RawImage>& imgs, int numBytes, bool half) {
+    if (numBytes != 1 && numBytes != 2)
+        throw std::runtime_error("Images can only be encoded with 1 or 2 bytes.");
+    if (half && numBytes != 2) throw std::runtime_error("Half precision encoding requires 2 bytes.");
+    for (const RawImage& img : imgs) {
+        if (img.getWidth() != imgs[0].getWidth() || img.getHeight() != imgs[0].getHeight()) {
+            throw std::runtime_error("Mismatched sizes of the encoded images.");
+        }
+    }
+}
+
+std::vector<scaleParameters> computeScaleParameters(const std::vector<RawImage>& imgs, int numBytes,
+                                                    int tileSize, float clipFrac, bool half) {
+    checkEncodingArgs(imgs, numBytes, half);
+    if (clipFrac < 0.0 || clipFrac >= 0.5) throw std::runtime_error("The clip fraction must be in [0, 0.5).");
+
+    const int num_images = imgs.size();
+    const int width = (num_images > 0) ? imgs[0].getWidth() : 0;
+    const int height = (num_images > 0) ? imgs[0].getHeight() : 0;
+    const int edge = encodingTileEdge(width, height, tileSize);
+    const int tiles_x = (width + edge - 1) / edge;
+    const int num_tiles = numEncodingTiles(width, height, edge);
+    std::vector<scaleParameters> result(num_images * num_tiles);
+
+#pragma omp parallel for schedule(dynamic)
+    for (int ind = 0; ind < num_images * num_tiles; ++ind) {
+        const std::vector<float>& pixels = imgs[ind / num_tiles].getPixels();
+        const int x_start = ((ind % num_tiles) % tiles_x) * edge;
+        const int y_start = ((ind % num_tiles) / tiles_x) * edge;
+
+        // Collect the valid pixels of the tile.
+        std::vector<float> values;
+        values.reserve(edge * edge);
+        for (int y = y_start; y < std::min(y_start + edge, height); ++y) {
+            for (int x = x_start; x < std::min(x_start + edge, width); ++x) {
+                if (pixels[y * width + x] != NO_DATA) values.push_back(pixels[y * width + x]);
+            }
+        }
+
+        scaleParameters& params = result[ind];
+        params.minVal = 0.0;
+        params.maxVal = 0.0;
+        if (values.size() > 0) {
+            const int num_clip = static_cast<int>(clipFrac * (values.size() - 1));
+            if (num_clip > 0) {
+                std::nth_element(values.begin(), values.begin() + num_clip, values.end());
+                params.minVal = values[num_clip];
+                std::nth_element(values.begin(), values.end() - 1 - num_clip, values.end());
+                params.maxVal = values[values.size() - 1 - num_clip];
+            } else {
+                const auto bnds = std::minmax_element(values.begin(), values.end());
+                params.minVal = *bnds.first;
+                params.maxVal = *bnds.second;
+            }
+        }
+
+        if (half) {
+            // The values are stored relative to the largest magnitude of the tile.
+            params.scale = std::max(std::abs(params.minVal), std::abs(params.maxVal));
+            if (params.scale == 0.0) params.scale = 1.0;
+        } else {
+            // Increase width to avoid divide by zero.
+            float range = std::max(params.maxVal - params.minVal, 1e-6f);
+            long int num_values = (1 << (8 * numBytes)) - 1;
+            params.scale = range / (double)num_values;
+        }
+    }
+    return result;
+}
+
+template <typename T>
+static void encodePixels(const std::vector<RawImage>& imgs, int edge, bool half,
+                         const std::vector<scaleParameters>& params, T* encoded) {
+    const int num_images = imgs.size();
+    const int width = imgs[0].getWidth();
+    const int height = imgs[0].getHeight();
+    const int tiles_x = (width + edge - 1) / edge;
+    const int num_tiles = numEncodingTiles(width, height, edge);
+
+#pragma omp parallel for schedule(static)
+    for (int row = 0; row < num_images * height; ++row) {
+        const int i = row / height;
+        const int y = row % height;
+        const float* pixels = imgs[i].getPixels().data() + y * width;
+        T* output = encoded + static_cast<long>(row) * width;
+        for (int x = 0; x < width; ++x) {
+            const scaleParameters& p = params[i * num_tiles + (y / edge) * tiles_x + x / edge];
+            float value = pixels[x];
+            if (half) {
+                output[x] = (value == NO_DATA)
+                                    ? HALF_NO_DATA
+                                    : floatToHalf(std::min(std::max(value, p.minVal), p.maxVal) / p.scale);
+            } else if (value == NO_DATA) {
+                output[x] = 0;
+            } else {
+                value = std::min(value, static_cast<float>(p.maxVal - p.scale / 100.0));
+                value = std::max(value, p.minVal);
+                output[x] = static_cast<T>((value - p.minVal) / p.scale + 1.0);
+            }
+        }
+    }
+}
+
+std::vector<uint8_t> encodeImages(const std::vector<RawImage>& imgs, int numBytes, int tileSize, bool half,
+                                  const std::vector<scaleParameters>& params) {
+    checkEncodingArgs(imgs, numBytes, half);
+    if (imgs.size() == 0) return std::vector<uint8_t>();
+
+    const int width = imgs[0].getWidth();
+    const int height = imgs[0].getHeight();
+    const int edge = encodingTileEdge(width, height, tileSize);
+    if (params.size() != imgs.size() * numEncodingTiles(width, height, edge)) {
+        throw std::runtime_error("Mismatched number of scale parameters.");
+    }
+
+    std::vector<uint8_t> result(imgs.size() * width * height * numBytes);
+    if (numBytes == 1) {
+        encodePixels<uint8_t>(imgs, edge, half, params, result.data());
+    } else {
+        encodePixels<uint16_t>(imgs, edge, half, params, reinterpret_cast<uint16_t*>(result.data()));
+    }
+    return result;
+}
+
+std::vector<RawImage> decodeImages(const std::vector<uint8_t>& data, int numImages, int width, int height,
+                                   int numBytes, int tileSize, bool half,
+                                   const std::vector<scaleParameters>& params) {
+    const int edge = encodingTileEdge(width, height, tileSize);
+    const int tiles_x = (width + edge - 1) / edge;
+    const int num_tiles = numEncodingTiles(width, height, edge);
+    if (data.size() != static_cast<size_t>(numImages) * width * height * numBytes ||
+        params.size() != static_cast<size_t>(numImages) * num_tiles) {
+        throw std::runtime_error("Mismatched size of the encoded images.");
+    }
+
+    std::vector<RawImage> result(numImages, RawImage(width, height));
+#pragma omp parallel for schedule(static)
+    for (int i = 0; i < numImages; ++i) {
+        float* pixels = result[i].getDataRef();
+        for (int p = 0; p < width * height; ++p) {
+            const long index = static_cast<long>(i) * width * height + p;
+            const scaleParameters& sp =
+                    params[i * num_tiles + ((p / width) / edge) * tiles_x + (p % width) / edge];
+            if (half) {
+                const float value = halfToFloat(reinterpret_cast<const uint16_t*>(data.data())[index]);
+                pixels[p] = std::isnan(value) ? NO_DATA : value * sp.scale;
+            } else {
+                const float value =
+                        (numBytes == 1) ? data[index] : reinterpret_cast<const uint16_t*>(data.data())[index];
+                pixels[p] = (value == 0.0) ? NO_DATA : (value - 1.0) * sp.scale + sp.minVal;
+            }
+        }
+    }
+    return result;
+}
+
+std::vector<RawImage> encodeAndDecodeImages(const std::vector<RawImage>& imgs, int numBytes, int tileSize,
+                                            float clipFrac, bool half) {
+    if (imgs.size() == 0) return std::vector<RawImage>();
+    std::vector<scaleParameters> params = computeScaleParameters(imgs, numBytes, tileSize, clipFrac, half);
+    std::vector<uint8_t> data = encodeImages(imgs, numBytes, tileSize, half, params);
+    return decodeImages(data, imgs.size(), imgs[0].getWidth(), imgs[0].getHeight(), numBytes, tileSize, half,
+                        params);
+}
+
+} /* namespace search */
@@ -0,0 +1,65 @@
+/*
+ * ImageEncoding.h
+ *
+ * Helper functions for compressing the psi/phi images that are loaded on to the GPU.
+ *
+ * The images can be stored as 1 or 2 byte unsigned integers that are scaled to the
+ * [min, max] range of the pixels or as 2 byte IEEE half precision floats. Each image
+ * is split into square tiles with their own scale parameters, so a few extreme pixels
+ * only reduce the precision of their own tile. The range of a tile can also ignore
+ * a fraction of the most extreme pixels, which are clipped to the range.
+ */
+
+#ifndef IMAGEENCODING_H_
+#define IMAGEENCODING_H_
+
+#include <algorithm>
+#include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <stdexcept>
+#include <vector>
+
+#include "common.h"
+#include "RawImage.h"
+
+namespace search {
+
+/* The edge (in pixels) of the encoding tiles. A tileSize <= 0 uses a single tile per image. */
+inline int encodingTileEdge(int width, int height, int tileSize) {
+    return (tileSize > 0) ? tileSize : std::max(std::max(width, height), 1);
+}
+
+/* The number of encoding tiles per image. */
+inline int numEncodingTiles(int width, int height, int tileEdge) {
+    return ((width + tileEdge - 1) / tileEdge) * ((height + tileEdge - 1) / tileEdge);
+}
+
+/* Convert between floats and IEEE half precision floats (rounding to nearest even). */
+uint16_t floatToHalf(float value);
+float halfToFloat(uint16_t value);
+
+/* Compute the scale parameters of each tile of each image (stored image-major). The
+   numBytes must be 1 or 2 and clipFrac is the fraction of the valid pixels at each
+   end of the tile's range that are ignored. */
+std::vector<scaleParameters> computeScaleParameters(const std::vector<RawImage>& imgs, int numBytes,
+                                                    int tileSize, float clipFrac, bool half);
+
+/* Encode the images into numBytes per pixel using the scale parameters of each tile.
+   NO_DATA pixels are stored as 0 (or NaN for half precision). */
+std::vector<uint8_t> encodeImages(const std::vector<RawImage>& imgs, int numBytes, int tileSize, bool half,
+                                  const std::vector<scaleParameters>& params);
+
+/* Decode the images created by encodeImages. */
+std::vector<RawImage> decodeImages(const std::vector<uint8_t>& data, int numImages, int width, int height,
+                                   int numBytes, int tileSize, bool half,
+                                   const std::vector<scaleParameters>& params);
+
+/* Return the images as the search sees them after they are encoded. Used to check
+   the loss of precision from an encoding. */
+std::vector<RawImage> encodeAndDecodeImages(const std::vector<RawImage>& imgs, int numBytes, int tileSize,
+                                            float clipFrac, bool half);
+
+} /* namespace search */
+
+#endif /* IMAGEENCODING_H_ */
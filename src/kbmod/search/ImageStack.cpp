@@ -101,6 +101,43 @@ void ImageStack::saveImages(const std::string& path) {
     for (auto& i : images) i.saveLayers(path);
 }
 
+void ImageStack::releaseLayers(bool keepScience) {
+    for (auto& i : images) i.releaseLayers(keepScience);
+}
+
+void ImageStack::setRegion(int xMin, int xMax, int yMin, int yMax) {
+    for (auto& i : images) i.setRegion(xMin, xMax, yMin, yMax);
+}
+
+void ImageStack::addObjects(const std::vector<trajectory>& trjs,
+                            const std::vector<baryCorrection>& baryCorrs) {
+    const int numImages = imgCount();
+    const bool useCorr = !baryCorrs.empty();
+    if (useCorr) {
+        if (baryCorrs.size() % numImages != 0)
+            throw std::runtime_error("Barycentric corrections must be given for every image.");
+        const int numSets = baryCorrs.size() / numImages;
+        for (const trajectory& t : trjs) {
+            if (t.baryIndex < 0 || t.baryIndex >= numSets)
+                throw std::runtime_error("Invalid barycentric correction index.");
+        }
+    }
+
+    // Load any lazily loaded layers before the images are modified in parallel.
+    for (auto& img : images) img.getScience();
+
+#pragma omp parallel for schedule(dynamic)
+    for (int i = 0; i < numImages; ++i) {
+        const float time = imageTimes[i];
+        for (const trajectory& t : trjs) {
+            pixelPos pos = useCorr ? computeTrajPosBC(t, time, baryCorrs[t.baryIndex * numImages + i])
+                                   : computeTrajPos(t, time);
+            // The trajectories give pixel indices, so center the sources in the pixels.
+            images[i].addObject(pos.x + 0.5, pos.y + 0.5, t.flux);
+        }
+    }
+}
+
 const RawImage& ImageStack::getGlobalMask() const { return globalMask; }
 
 std::vector<RawImage> ImageStack::getSciences() {
@@ -16,6 +16,7 @@
 #include <iostream>
 #include <stdexcept>
 #include "LayeredImage.h"
+#include "TrajectoryUtils.h"
 
 namespace search {
 
@@ -58,6 +59,16 @@ public:
     void saveGlobalMask(const std::string& path);
     void saveImages(const std::string& path);
 
+    // Free the memory of the image layers (see LayeredImage::releaseLayers).
+    void releaseLayers(bool keepScience);
+
+    // Restrict all the (lazily loaded) images to a region (see LayeredImage::setRegion).
+    void setRegion(int xMin, int xMax, int yMin, int yMax);
+
+    // Add PSF-weighted point sources along the trajectories to the science layers. If baryCorrs
+    // is not empty, it holds imgCount() corrections for each barycentric index.
+    void addObjects(const std::vector<trajectory>& trjs, const std::vector<baryCorrection>& baryCorrs);
+
     // Create a RawImage from the shift-stacked images.
     RawImage simpleShiftAndStack(float v_x, float v_y, bool use_mean);
 
@@ -9,10 +9,15 @@
 
 namespace search {
 
-extern "C" void deviceSearchFilter(int imageCount, int width, int height, float* psiVect, float* phiVect,
-                                   perImageData img_data, searchParameters params, int trajCount,
-                                   trajectory* trajectoriesToSearch, int resultsCount,
-                                   trajectory* bestTrajects);
+extern "C" void deviceLoadSearchData(int imageCount, int width, int height, void* psiVect, void* phiVect,
+                                     perImageData img_data, searchParameters params, deviceSearchData* data);
+
+extern "C" void deviceFreeSearchData(deviceSearchData* data);
+
+extern "C" void deviceSearchLoaded(deviceSearchData data, perImageData img_data, searchParameters params,
+                                   int trajCount, trajectory* trajectoriesToSearch, int resultsCount,
+                                   trajectory* bestTrajects, bool useActiveList, int activeCount,
+                                   int* activePixels);
 
 void deviceGetCoadds(ImageStack& stack, perImageData image_data, int num_trajectories,
                      trajectory* trajectories, stampParameters params,
@@ -36,6 +41,9 @@ KBMOSearch::KBMOSearch(ImageStack& imstack) : stack(imstack) {
     // Default the encoding parameters.
     params.psiNumBytes = -1;
     params.phiNumBytes = -1;
+    params.encodeTileSize = 0;
+    params.encodeClipFrac = 0.0;
+    params.encodeHalf = false;
 
     // Default pixel starting bounds.
     params.x_start_min = 0;
@@ -43,23 +51,39 @@ KBMOSearch::KBMOSearch(ImageStack& imstack) : stack(imstack) {
     params.y_start_min = 0;
     params.y_start_max = stack.getHeight();
 
+    // By default search from every starting pixel.
+    useStartPixelFilter = false;
+    minReachableFrac = 0.0;
+
     // Set default values for the barycentric correction.
     baryCorrs = std::vector<baryCorrection>(stack.imgCount());
+    numBaryCorrSets = 1;
     params.useCorr = false;
     useCorr = false;
 
     params.debug = false;
+
+    sessionActive = false;
 }
 
+KBMOSearch::~KBMOSearch() { endSession(); }
+
 void KBMOSearch::setDebug(bool d) {
     debugInfo = d;
     params.debug = d;
 }
 
 void KBMOSearch::enableCorr(std::vector<float> pyBaryCorrCoeff) {
+    const int num_images = stack.imgCount();
+    if (num_images == 0 || pyBaryCorrCoeff.empty() || pyBaryCorrCoeff.size() % (6 * num_images) != 0) {
+        throw std::runtime_error("Barycentric corrections must have 6 coefficients per image and distance.");
+    }
+    numBaryCorrSets = pyBaryCorrCoeff.size() / (6 * num_images);
+    baryCorrs = std::vector<baryCorrection>(numBaryCorrSets * num_images);
+
     useCorr = true;
     params.useCorr = true;
-    for (int i = 0; i < stack.imgCount(); i++) {
+    for (int i = 0; i < numBaryCorrSets * num_images; i++) {
         int j = i * 6;
         baryCorrs[i].dx = pyBaryCorrCoeff[j];
         baryCorrs[i].dxdx = pyBaryCorrCoeff[j + 1];
@@ -70,6 +94,11 @@ void KBMOSearch::enableCorr(std::vector<float> pyBaryCorrCoeff) {
     }
 }
 
+void KBMOSearch::disableCorr() {
+    useCorr = false;
+    params.useCorr = false;
+}
+
 void KBMOSearch::enableGPUSigmaGFilter(std::vector<float> pyPercentiles, float pySigmaGCoeff, float pyMinLH) {
     params.do_sigmag_filter = true;
     params.sGL_L = pyPercentiles[0];
@@ -78,19 +107,36 @@ void KBMOSearch::enableGPUSigmaGFilter(std::vector<float> pyPercentiles, float p
     params.minLH = pyMinLH;
 }
 
-void KBMOSearch::enableGPUEncoding(int pyPsiNumBytes, int pyPhiNumBytes) {
+void KBMOSearch::enableGPUEncoding(int pyPsiNumBytes, int pyPhiNumBytes, int tileSize, float clipFrac,
+                                   bool half) {
     // Make sure the encoding is one of the supported options.
     // Otherwise use default float (aka no encoding).
-    if (pyPsiNumBytes == 1 || pyPsiNumBytes == 2) {
-        params.psiNumBytes = pyPsiNumBytes;
-    } else {
-        params.psiNumBytes = -1;
+    int psiNumBytes = (pyPsiNumBytes == 1 || pyPsiNumBytes == 2) ? pyPsiNumBytes : -1;
+    int phiNumBytes = (pyPhiNumBytes == 1 || pyPhiNumBytes == 2) ? pyPhiNumBytes : -1;
+    if (clipFrac < 0.0 || clipFrac >= 0.5) throw std::runtime_error("The clip fraction must be in [0, 0.5).");
+    if (half && (psiNumBytes == 1 || phiNumBytes == 1)) {
+        throw std::runtime_error("Half precision encoding requires 2 bytes.");
     }
-    if (pyPhiNumBytes == 1 || pyPhiNumBytes == 2) {
-        params.phiNumBytes = pyPhiNumBytes;
-    } else {
-        params.phiNumBytes = -1;
+
+    // The encoded images are created when the session starts.
+    if (sessionActive && (psiNumBytes != params.psiNumBytes || phiNumBytes != params.phiNumBytes ||
+                          tileSize != params.encodeTileSize || clipFrac != params.encodeClipFrac ||
+                          half != params.encodeHalf)) {
+        throw std::runtime_error("Cannot change the GPU encoding during a search session.");
     }
+    params.psiNumBytes = psiNumBytes;
+    params.phiNumBytes = phiNumBytes;
+    params.encodeTileSize = tileSize;
+    params.encodeClipFrac = clipFrac;
+    params.encodeHalf = half;
+}
+
+void KBMOSearch::enableStartPixelFilter(float pyMinReachableFrac) {
+    if (pyMinReachableFrac < 0.0 || pyMinReachableFrac > 1.0) {
+        throw std::runtime_error("The minimum reachable fraction must be in [0, 1].");
+    }
+    useStartPixelFilter = true;
+    minReachableFrac = pyMinReachableFrac;
 }
 
 void KBMOSearch::setStartBoundsX(int x_min, int x_max) {
@@ -105,32 +151,72 @@ void KBMOSearch::setStartBoundsY(int y_min, int y_max) {
 
 void KBMOSearch::search(int aSteps, int vSteps, float minAngle, float maxAngle, float minVelocity,
                         float maxVelocity, int minObservations) {
-    preparePsiPhi();
     createSearchList(aSteps, vSteps, minAngle, maxAngle, minVelocity, maxVelocity);
+    runSearch(minObservations);
+}
+
+void KBMOSearch::searchDrift(float maxDrift, float minAngle, float maxAngle, float minVelocity,
+                             float maxVelocity, int minObservations) {
+    startTimer("Creating drift search list");
+    searchList = createDriftSearchList(maxDrift, minAngle, maxAngle, minVelocity, maxVelocity);
+    endTimer();
+    runSearch(minObservations);
+}
+
+void KBMOSearch::startSession() {
+    if (sessionActive) return;
+    preparePsiPhi();
 
+    // The images are encoded (in parallel) on the host, so only the compressed
+    // buffers are copied to the GPU.
     startTimer("Creating psi/phi buffers");
-    std::vector<float> psiVect;
-    std::vector<float> phiVect;
-    fillPsiAndPhiVects(psiImages, phiImages, &psiVect, &phiVect);
+    std::vector<uint8_t> psiVect;
+    std::vector<uint8_t> phiVect;
+    std::vector<scaleParameters> psiScaleVect;
+    std::vector<scaleParameters> phiScaleVect;
+    fillImageVect(psiImages, params.psiNumBytes, &psiVect, &psiScaleVect);
+    fillImageVect(phiImages, params.phiNumBytes, &phiVect, &phiScaleVect);
     endTimer();
 
     // Create a data stucture for the per-image data.
     perImageData img_data;
     img_data.numImages = stack.imgCount();
     img_data.imageTimes = stack.getTimesDataRef();
-    if (params.useCorr) img_data.baryCorrs = &baryCorrs[0];
+    if (params.psiNumBytes > 0) img_data.psiParams = psiScaleVect.data();
+    if (params.phiNumBytes > 0) img_data.phiParams = phiScaleVect.data();
 
-    // Compute the encoding parameters for psi and phi if needed.
-    // Vectors need to be created outside the if so they stay in scope.
-    std::vector<scaleParameters> psiScaleVect;
-    std::vector<scaleParameters> phiScaleVect;
-    if (params.psiNumBytes > 0) {
-        psiScaleVect = computeImageScaling(psiImages, params.psiNumBytes);
-        img_data.psiParams = psiScaleVect.data();
-    }
-    if (params.phiNumBytes > 0) {
-        phiScaleVect = computeImageScaling(phiImages, params.phiNumBytes);
-        img_data.phiParams = phiScaleVect.data();
+    // The device uses the actual edge of the tiles.
+    searchParameters load_params = params;
+    load_params.encodeTileSize = encodingTileEdge(stack.getWidth(), stack.getHeight(), params.encodeTileSize);
+
+    startTimer("Loading psi/phi on to the GPU");
+    deviceLoadSearchData(stack.imgCount(), stack.getWidth(), stack.getHeight(), psiVect.data(),
+                         phiVect.data(), img_data, load_params, &sessionData);
+    sessionActive = true;
+    endTimer();
+}
+
+void KBMOSearch::endSession() {
+    if (!sessionActive) return;
+    deviceFreeSearchData(&sessionData);
+    sessionActive = false;
+}
+
+void KBMOSearch::runSearch(int minObservations) {
+    // Load the psi/phi data on to the GPU for this search only if it is not
+    // already resident from a session.
+    const bool temporary_session = !sessionActive;
+    startSession();
+
+    // Create a data stucture for the per-image data. The times and images
+    // are already on the GPU, but the barycentric corrections can change
+    // between searches.
+    perImageData img_data;
+    img_data.numImages = stack.imgCount();
+    img_data.imageTimes = stack.getTimesDataRef();
+    if (params.useCorr) {
+        img_data.numBaryCorrSets = numBaryCorrSets;
+        img_data.baryCorrs = &baryCorrs[0];
     }
 
     // Allocate a vector for the results.
@@ -148,68 +234,187 @@ void KBMOSearch::search(int aSteps, int vSteps, float minAngle, float maxAngle,
     // Set the minimum number of observations.
     params.minObservations = minObservations;
 
-    // Do the actual search on the GPU.
+    // If we are filtering the starting pixels, compute the active ones and prefill the
+    // results so the skipped pixels look the same as pixels without any valid trajectory.
+    std::vector<int> activePixels;
+    if (useStartPixelFilter) {
+        activePixels = findActiveStartPixels(searchList, minObservations);
+        if (debugInfo) {
+            std::cout << "Searching from " << activePixels.size() << " of " << num_search_pixels
+                      << " starting pixels.\n";
+        }
+
+        const int search_width = params.x_start_max - params.x_start_min;
+        for (int p = 0; p < num_search_pixels; ++p) {
+            for (int r = 0; r < RESULTS_PER_PIXEL; ++r) {
+                trajectory& trj = results[p * RESULTS_PER_PIXEL + r];
+                trj.x = p % search_width + params.x_start_min;
+                trj.y = p / search_width + params.y_start_min;
+                trj.lh = -1.0;
+            }
+        }
+    }
+
+    // Do the actual search on the GPU. With the filter, an empty list of active pixels
+    // searches no pixels (rather than the full search space).
     startTimer("Searching");
-    deviceSearchFilter(stack.imgCount(), stack.getWidth(), stack.getHeight(), psiVect.data(), phiVect.data(),
-                       img_data, params, searchList.size(), searchList.data(), max_results, results.data());
+    deviceSearchLoaded(sessionData, img_data, params, searchList.size(), searchList.data(), max_results,
+                       results.data(), useStartPixelFilter, activePixels.size(), activePixels.data());
     endTimer();
 
+    if (temporary_session) endSession();
+
     startTimer("Sorting results");
     sortResults();
     endTimer();
 }
 
+std::vector<int> KBMOSearch::findActiveStartPixels(const std::vector<trajectory>& trjs, int minObservations) {
+    startTimer("Finding active starting pixels");
+    preparePsiPhi();
+
+    const int width = stack.getWidth();
+    const int height = stack.getHeight();
+    const int num_images = stack.imgCount();
+    const int search_width = params.x_start_max - params.x_start_min;
+    const int search_height = params.y_start_max - params.y_start_min;
+    const std::vector<float>& times = stack.getTimes();
+
+    std::vector<int> active;
+    if (trjs.empty() || search_width <= 0 || search_height <= 0) {
+        endTimer();
+        return active;
+    }
+
+    // A pixel needs valid data in at least this many images to be searched. A pixel that
+    // cannot reach any valid data never produces a result, so we always require one.
+    int min_images = std::max(minObservations, (int)ceil(minReachableFrac * num_images));
+    min_images = std::max(min_images, 1);
+
+    // The number of images in which each starting pixel can reach valid data.
+    std::vector<int> counts(search_width * search_height, 0);
+
+    // Summed-area table of valid (psi and phi not NO_DATA) pixels, reused for each image.
+    const int table_width = width + 1;
+    std::vector<int> table(table_width * (height + 1), 0);
+
+    for (int i = 0; i < num_images; ++i) {
+        // Compute the range of offsets covered by the trajectories at this time.
+        float min_dx = FLT_MAX;
+        float max_dx = -FLT_MAX;
+        float min_dy = FLT_MAX;
+        float max_dy = -FLT_MAX;
+        for (const trajectory& trj : trjs) {
+            min_dx = std::min(min_dx, trj.xVel * times[i]);
+            max_dx = std::max(max_dx, trj.xVel * times[i]);
+            min_dy = std::min(min_dy, trj.yVel * times[i]);
+            max_dy = std::max(max_dy, trj.yVel * times[i]);
+        }
+
+        // Build the summed-area table for this image.
+        const float* psi = psiImages[i].getDataRef();
+        const float* phi = phiImages[i].getDataRef();
+        for (int y = 0; y < height; ++y) {
+            int row_sum = 0;
+            for (int x = 0; x < width; ++x) {
+                const int index = y * width + x;
+                row_sum += (psi[index] != NO_DATA && phi[index] != NO_DATA) ? 1 : 0;
+                table[(y + 1) * table_width + x + 1] = table[y * table_width + x + 1] + row_sum;
+            }
+        }
+
+        for (int y_i = 0; y_i < search_height; ++y_i) {
+            const int y = y_i + params.y_start_min;
+            for (int x_i = 0; x_i < search_width; ++x_i) {
+                const int x = x_i + params.x_start_min;
+
+                // Predict the box of reachable pixels the same way as the search (for each
+                // barycentric correction set). The rounding is monotonic, so the extreme offsets
+                // give the extreme pixels. We pad the box by one pixel to guard against floating
+                // point differences with the GPU.
+                const int num_sets = useCorr ? numBaryCorrSets : 1;
+                bool reachable = false;
+                for (int s = 0; s < num_sets && !reachable; ++s) {
+                    int x0, x1, y0, y1;
+                    if (useCorr) {
+                        const baryCorrection& bc = baryCorrs[s * num_images + i];
+                        const float bx = bc.dx + x * bc.dxdx + y * bc.dxdy;
+                        const float by = bc.dy + x * bc.dydx + y * bc.dydy;
+                        x0 = int(x + min_dx + bx + 0.5) - 1;
+                        x1 = int(x + max_dx + bx + 0.5) + 1;
+                        y0 = int(y + min_dy + by + 0.5) - 1;
+                        y1 = int(y + max_dy + by + 0.5) + 1;
+                    } else {
+                        x0 = x + int(min_dx + 0.5) - 1;
+                        x1 = x + int(max_dx + 0.5) + 1;
+                        y0 = y + int(min_dy + 0.5) - 1;
+                        y1 = y + int(max_dy + 0.5) + 1;
+                    }
+
+                    // Clip the box to the image.
+                    x0 = std::max(x0, 0);
+                    y0 = std::max(y0, 0);
+                    x1 = std::min(x1, width - 1);
+                    y1 = std::min(y1, height - 1);
+                    if (x0 > x1 || y0 > y1) continue;
+
+                    const int num_valid = table[(y1 + 1) * table_width + x1 + 1] -
+                                          table[y0 * table_width + x1 + 1] -
+                                          table[(y1 + 1) * table_width + x0] + table[y0 * table_width + x0];
+                    reachable = (num_valid > 0);
+                }
+                if (reachable) counts[y_i * search_width + x_i] += 1;
+            }
+        }
+    }
+
+    for (int p = 0; p < search_width * search_height; ++p) {
+        if (counts[p] >= min_images) active.push_back(p);
+    }
+    endTimer();
+    return active;
+}
+
 void KBMOSearch::savePsiPhi(const std::string& path) {
     preparePsiPhi();
     saveImages(path);
 }
 
+void KBMOSearch::releaseImageLayers() {
+    preparePsiPhi();
+    stack.releaseLayers(true);
+}
+
 void KBMOSearch::preparePsiPhi() {
     if (!psiPhiGenerated) {
+        startTimer("Generating psi/phi images");
+        const int num_images = stack.imgCount();
+        const bool generatePhi = phiImages.size() != num_images;
         psiImages.clear();
-        phiImages.clear();
+        if (generatePhi) phiImages.clear();
 
         // Compute Phi and Psi from convolved images
         // while leaving masked pixels alone
         // Reinsert 0s for NO_DATA?
-        const int num_images = stack.imgCount();
         for (int i = 0; i < num_images; ++i) {
             LayeredImage& img = stack.getSingleImage(i);
             psiImages.push_back(img.generatePsiImage());
-            phiImages.push_back(img.generatePhiImage());
+            if (generatePhi) phiImages.push_back(img.generatePhiImage());
         }
 
         psiPhiGenerated = true;
+        endTimer();
     }
 }
 
-std::vector<scaleParameters> KBMOSearch::computeImageScaling(const std::vector<RawImage>& vect,
-                                                             int encoding_bytes) const {
-    std::vector<scaleParameters> result;
-
-    const int num_images = vect.size();
-    for (int i = 0; i < num_images; ++i) {
-        scaleParameters params;
-        params.scale = 1.0;
-
-        std::array<float, 2> bnds = vect[i].computeBounds();
-        params.minVal = bnds[0];
-        params.maxVal = bnds[1];
-
-        // Increase width to avoid divide by zero.
-        float width = (params.maxVal - params.minVal);
-        if (width < 1e-6) width = 1e-6;
-
-        // Set the scale if we are encoding the values.
-        if (encoding_bytes == 1 || encoding_bytes == 2) {
-            long int num_values = (1 << (8 * encoding_bytes)) - 1;
-            params.scale = width / (double)num_values;
-        }
-
-        result.push_back(params);
+void KBMOSearch::setPhiImages(const std::vector<RawImage>& phi) {
+    if (psiPhiGenerated) throw std::runtime_error("The psi/phi images have already been generated.");
+    if (phi.size() != stack.imgCount()) throw std::runtime_error("Mismatched number of phi images.");
+    for (const RawImage& img : phi) {
+        if (img.getWidth() != stack.getWidth() || img.getHeight() != stack.getHeight())
+            throw std::runtime_error("Mismatched size of phi images.");
     }
-
-    return result;
+    phiImages = phi;
 }
 
 void KBMOSearch::saveImages(const std::string& path) {
@@ -246,34 +451,94 @@ void KBMOSearch::createSearchList(int angleSteps, int velocitySteps, float minAn
     }
 }
 
-void KBMOSearch::fillPsiAndPhiVects(const std::vector<RawImage>& psiImgs,
-                                    const std::vector<RawImage>& phiImgs, std::vector<float>* psiVect,
-                                    std::vector<float>* phiVect) {
-    assert(psiVect != NULL);
-    assert(phiVect != NULL);
+std::vector<trajectory> KBMOSearch::createDriftSearchList(float maxDrift, float minAngle, float maxAngle,
+                                                          float minVelocity, float maxVelocity) const {
+    if (maxDrift <= 0.0) throw std::runtime_error("maxDrift must be positive.");
+    if (maxVelocity < minVelocity) throw std::runtime_error("maxVelocity must be >= minVelocity.");
 
-    int num_images = psiImgs.size();
-    assert(num_images > 0);
-    assert(phiImgs.size() == num_images);
+    const std::vector<float>& times = stack.getTimes();
+    const float timeSpan =
+            *std::max_element(times.begin(), times.end()) - *std::min_element(times.begin(), times.end());
+    if (timeSpan <= 0.0) throw std::runtime_error("Image times must span a positive interval.");
+
+    // Two trajectories whose velocities differ by dv drift apart by |dv| * timeSpan pixels,
+    // so every velocity in the region needs a grid velocity within maxDrift / timeSpan.
+    // We use a hexagonal lattice with that covering radius, which covers the plane with the
+    // fewest points.
+    const float radius = maxDrift / timeSpan;
+    const float colStep = sqrt(3.0) * radius;
+    const float rowStep = 1.5 * radius;
+
+    // Compute the bounding box of the search region from its corners and any axis
+    // crossings of the outer arc.
+    std::vector<float> xs = {minVelocity * cos(minAngle), minVelocity * cos(maxAngle),
+                             maxVelocity * cos(minAngle), maxVelocity * cos(maxAngle)};
+    std::vector<float> ys = {minVelocity * sin(minAngle), minVelocity * sin(maxAngle),
+                             maxVelocity * sin(minAngle), maxVelocity * sin(maxAngle)};
+    for (int k = int(ceil(minAngle / M_PI_2)); k * M_PI_2 <= maxAngle; ++k) {
+        xs.push_back(maxVelocity * cos(k * M_PI_2));
+        ys.push_back(maxVelocity * sin(k * M_PI_2));
+    }
+    const float minX = *std::min_element(xs.begin(), xs.end()) - radius;
+    const float maxX = *std::max_element(xs.begin(), xs.end()) + radius;
+    const float minY = *std::min_element(ys.begin(), ys.end()) - radius;
+    const float maxY = *std::max_element(ys.begin(), ys.end()) + radius;
+
+    // Keep each lattice velocity that is needed to cover part of the region and that
+    // produces a new sequence of rounded pixel offsets (computed the same way as the search).
+    std::vector<trajectory> results;
+    std::set<std::vector<int> > seenOffsets;
+    std::vector<int> offsets(2 * times.size());
+    const int numRows = int((maxY - minY) / rowStep) + 1;
+    for (int row = 0; row <= numRows; ++row) {
+        float yVel = minY + row * rowStep;
+        float xStart = minX + ((row % 2 == 0) ? 0.0 : 0.5 * colStep);
+        for (float xVel = xStart; xVel <= maxX + colStep; xVel += colStep) {
+            if (velocityDistanceToRegion(xVel, yVel, minAngle, maxAngle, minVelocity, maxVelocity) > radius)
+                continue;
+
+            for (unsigned i = 0; i < times.size(); ++i) {
+                offsets[2 * i] = int(xVel * times[i] + 0.5);
+                offsets[2 * i + 1] = int(yVel * times[i] + 0.5);
+            }
+            if (!seenOffsets.insert(offsets).second) continue;
+
+            trajectory trj = {xVel, yVel, 0.0, 0.0, 0, 0, 0};
+            results.push_back(trj);
+        }
+    }
+
+    if (debugInfo) {
+        std::cout << "Created drift search list with " << results.size() << " trajectories.\n";
+    }
+    return results;
+}
+
+void KBMOSearch::fillImageVect(const std::vector<RawImage>& imgs, int numBytes, std::vector<uint8_t>* vect,
+                               std::vector<scaleParameters>* scales) {
+    assert(vect != NULL);
+    assert(scales != NULL);
 
-    int num_pixels = psiImgs[0].getPPI();
+    const int num_images = imgs.size();
+    assert(num_images > 0);
+    const int num_pixels = imgs[0].getPPI();
     for (int i = 0; i < num_images; ++i) {
-        assert(psiImgs[i].getPPI() == num_pixels);
-        assert(phiImgs[i].getPPI() == num_pixels);
+        assert(imgs[i].getPPI() == num_pixels);
     }
 
-    psiVect->clear();
-    psiVect->reserve(num_images * num_pixels);
-    phiVect->clear();
-    phiVect->reserve(num_images * num_pixels);
+    if (numBytes == 1 || numBytes == 2) {
+        *scales = computeScaleParameters(imgs, numBytes, params.encodeTileSize, params.encodeClipFrac,
+                                         params.encodeHalf);
+        *vect = encodeImages(imgs, numBytes, params.encodeTileSize, params.encodeHalf, *scales);
+        return;
+    }
 
+    scales->clear();
+    vect->resize(sizeof(float) * num_images * num_pixels);
+    float* data = reinterpret_cast<float*>(vect->data());
+#pragma omp parallel for
     for (int i = 0; i < num_images; ++i) {
-        const std::vector<float>& psiRef = psiImgs[i].getPixels();
-        const std::vector<float>& phiRef = phiImgs[i].getPixels();
-        for (unsigned p = 0; p < num_pixels; ++p) {
-            psiVect->push_back(psiRef[p]);
-            phiVect->push_back(phiRef[p]);
-        }
+        std::copy(imgs[i].getPixels().begin(), imgs[i].getPixels().end(), data + (long)i * num_pixels);
     }
 }
 
@@ -286,11 +551,11 @@ std::vector<RawImage> KBMOSearch::scienceStamps(const trajectory& trj, int radiu
 
     std::vector<RawImage> stamps;
     int num_times = stack.imgCount();
+    std::vector<pixelPos> pos = getMultTrajPos(trj);
     for (int i = 0; i < num_times; ++i) {
         if (use_all_stamps || use_index[i]) {
-            pixelPos pos = getTrajPos(trj, i);
             RawImage& img = stack.getSingleImage(i).getScience();
-            stamps.push_back(img.createStamp(pos.x, pos.y, radius, interpolate, keep_no_data));
+            stamps.push_back(img.createStamp(pos[i].x, pos[i].y, radius, interpolate, keep_no_data));
         }
     }
     return stamps;
@@ -379,9 +644,9 @@ std::vector<RawImage> KBMOSearch::createStamps(trajectory t, int radius, const s
                                                bool interpolate) {
     if (radius < 0) throw std::runtime_error("stamp radius must be at least 0");
     std::vector<RawImage> stamps;
+    std::vector<pixelPos> pos = getMultTrajPos(t);
     for (int i = 0; i < imgs.size(); ++i) {
-        pixelPos pos = getTrajPos(t, i);
-        stamps.push_back(imgs[i]->createStamp(pos.x, pos.y, radius, interpolate, false));
+        stamps.push_back(imgs[i]->createStamp(pos[i].x, pos[i].y, radius, interpolate, false));
     }
     return stamps;
 }
@@ -389,22 +654,54 @@ std::vector<RawImage> KBMOSearch::createStamps(trajectory t, int radius, const s
 pixelPos KBMOSearch::getTrajPos(const trajectory& t, int i) const {
     float time = stack.getTimes()[i];
     if (useCorr) {
-        return computeTrajPosBC(t, time, baryCorrs[i]);
+        if (t.baryIndex < 0 || t.baryIndex >= numBaryCorrSets) {
+            throw std::runtime_error("Invalid barycentric correction index.");
+        }
+        return computeTrajPosBC(t, time, baryCorrs[t.baryIndex * stack.imgCount() + i]);
     } else {
         return computeTrajPos(t, time);
     }
 }
 
-std::vector<pixelPos> KBMOSearch::getMultTrajPos(trajectory& t) const {
-    std::vector<pixelPos> results;
-    int num_times = stack.imgCount();
-    for (int i = 0; i < num_times; ++i) {
-        pixelPos pos = getTrajPos(t, i);
-        results.push_back(pos);
+std::vector<pixelPos> KBMOSearch::getMultTrajPos(const trajectory& t) const {
+    const int v = offsets.find(t.xVel, t.yVel);
+    if (v < 0) {
+        std::vector<pixelPos> results;
+        int num_times = stack.imgCount();
+        for (int i = 0; i < num_times; ++i) {
+            pixelPos pos = getTrajPos(t, i);
+            results.push_back(pos);
+        }
+        return results;
+    }
+
+    // Add the precomputed offsets in the same order as computeTrajPos(BC).
+    const int num_times = offsets.getNumTimes();
+    const float* x_off = offsets.getXOffsets(v);
+    const float* y_off = offsets.getYOffsets(v);
+    std::vector<pixelPos> results(num_times);
+    if (useCorr) {
+        if (t.baryIndex < 0 || t.baryIndex >= numBaryCorrSets) {
+            throw std::runtime_error("Invalid barycentric correction index.");
+        }
+        const baryCorrection* bcs = &baryCorrs[t.baryIndex * num_times];
+        for (int i = 0; i < num_times; ++i) {
+            results[i].x = t.x + x_off[i] + bcs[i].dx + t.x * bcs[i].dxdx + t.y * bcs[i].dxdy;
+            results[i].y = t.y + y_off[i] + bcs[i].dy + t.x * bcs[i].dydx + t.y * bcs[i].dydy;
+        }
+    } else {
+        for (int i = 0; i < num_times; ++i) {
+            results[i].x = t.x + x_off[i];
+            results[i].y = t.y + y_off[i];
+        }
     }
     return results;
 }
 
+void KBMOSearch::buildTrajectoryOffsets(const std::vector<trajectory>& velocities) {
+    offsets = TrajectoryOffsets(velocities, stack.getTimes());
+}
+
 std::vector<float> KBMOSearch::createCurves(trajectory t, const std::vector<RawImage>& imgs) {
     /*Create a lightcurve from an image along a trajectory
      *
@@ -420,17 +717,22 @@ std::vector<float> KBMOSearch::createCurves(trajectory t, const std::vector<RawI
     std::vector<float> lightcurve;
     lightcurve.reserve(imgSize);
     const std::vector<float>& times = stack.getTimes();
+    const int v = offsets.find(t.xVel, t.yVel);
+    std::vector<pixelPos> positions;
+    if (useCorr) positions = getMultTrajPos(t);
     for (int i = 0; i < imgSize; ++i) {
         /* Do not use getPixelInterp(), because results from createCurves must
          * be able to recover the same likelihoods as the ones reported by the
          * gpu search.*/
         float pixVal;
         if (useCorr) {
-            pixelPos pos = getTrajPos(t, i);
-            pixVal = imgs[i].getPixel(int(pos.x + 0.5), int(pos.y + 0.5));
+            pixVal = imgs[i].getPixel(int(positions[i].x + 0.5), int(positions[i].y + 0.5));
         }
         /* Does not use getTrajPos to be backwards compatible with Hits_Rerun */
-        else {
+        else if (v >= 0) {
+            pixVal = imgs[i].getPixel(t.x + offsets.getXPixelOffsets(v)[i],
+                                      t.y + offsets.getYPixelOffsets(v)[i]);
+        } else {
             pixVal = imgs[i].getPixel(t.x + int(times[i] * t.xVel + 0.5), t.y + int(times[i] * t.yVel + 0.5));
         }
         if (pixVal == NO_DATA) pixVal = 0.0;
@@ -485,10 +787,12 @@ void KBMOSearch::filterResultsLH(float minLH) {
 }
 
 std::vector<trajectory> KBMOSearch::getResults(int start, int count) {
-    if (start + count >= results.size()) {
-        count = results.size() - start;
-    }
     if (start < 0) throw std::runtime_error("start must be 0 or greater");
+    const int numResults = results.size();
+    if (start > numResults) start = numResults;
+    if (start + count >= numResults) {
+        count = numResults - start;
+    }
     return std::vector<trajectory>(results.begin() + start, results.begin() + start + count);
 }
 
@@ -498,16 +802,23 @@ void KBMOSearch::setResults(const std::vector<trajectory>& new_results) { result
 void KBMOSearch::startTimer(const std::string& message) {
     if (debugInfo) {
         std::cout << message << "... " << std::flush;
-        tStart = std::chrono::system_clock::now();
     }
+    timerStack.push_back(std::make_pair(message, std::chrono::system_clock::now()));
 }
 
 void KBMOSearch::endTimer() {
+    // Timers can be nested, so each end matches the most recently started timer.
+    if (timerStack.empty()) return;
+    std::chrono::duration<double> tDelta = std::chrono::system_clock::now() - timerStack.back().second;
+    const std::string& name = timerStack.back().first;
+
+    // Keep only the most recent records if they are never collected.
+    if (timings.size() >= MAX_TIMINGS) timings.erase(timings.begin());
+    timings.push_back(std::make_pair(name, tDelta.count()));
     if (debugInfo) {
-        tEnd = std::chrono::system_clock::now();
-        tDelta = tEnd - tStart;
-        std::cout << " Took " << tDelta.count() << " seconds.\n" << std::flush;
+        std::cout << name << " took " << tDelta.count() << " seconds.\n" << std::flush;
     }
+    timerStack.pop_back();
 }
 
 } /* namespace search */
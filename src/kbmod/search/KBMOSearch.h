@@ -18,12 +18,14 @@
 #include <fstream>
 #include <chrono>
 #include <stdexcept>
+#include <set>
 #include <assert.h>
 #include <float.h>
 #include "common.h"
 #include "ImageStack.h"
 #include "PointSpreadFunc.h"
 #include "TrajectoryUtils.h"
+#include "ImageEncoding.h"
 
 namespace search {
 
@@ -38,8 +40,23 @@ public:
 
     // The primary search functions.
     void enableGPUSigmaGFilter(std::vector<float> pyPercentiles, float pySigmaGCoeff, float pyMinLH);
+
+    // Enable barycentric corrections with 6 coefficients per image for one or more distances
+    // (concatenated). Each trajectory is searched with every distance and its baryIndex
+    // records the distance used.
     void enableCorr(std::vector<float> pyBaryCorrCoeff);
-    void enableGPUEncoding(int psiNumBytes, int phiNumBytes);
+    void disableCorr();
+
+    // Store the psi/phi images on the GPU with 1 or 2 bytes per pixel (-1 for floats).
+    // Each image is split into tileSize x tileSize tiles (0 for a single tile) that are
+    // scaled to the range of their pixels ignoring the clipFrac most extreme pixels at
+    // each end. If half is set, the 2 byte encodings use half precision floats.
+    void enableGPUEncoding(int psiNumBytes, int phiNumBytes, int tileSize = 0, float clipFrac = 0.0,
+                           bool half = false);
+
+    // Only search from starting pixels whose reachable region has valid data in at least
+    // max(minObservations, ceil(minReachableFrac * numImages)) of the images.
+    void enableStartPixelFilter(float minReachableFrac);
 
     void setStartBoundsX(int x_min, int x_max);
     void setStartBoundsY(int y_min, int y_max);
@@ -47,12 +64,40 @@ public:
     void search(int aSteps, int vSteps, float minAngle, float maxAngle, float minVelocity, float maxVelocity,
                 int minObservations);
 
+    // Search using a velocity grid where the end points of any velocity in the search region
+    // and its closest grid velocity differ by at most maxDrift pixels.
+    void searchDrift(float maxDrift, float minAngle, float maxAngle, float minVelocity, float maxVelocity,
+                     int minObservations);
+
+    // Creates the list of trajectories (velocities) used by searchDrift.
+    std::vector<trajectory> createDriftSearchList(float maxDrift, float minAngle, float maxAngle,
+                                                  float minVelocity, float maxVelocity) const;
+
+    // Returns the (search space) indices y_i * search_width + x_i of the starting pixels that
+    // can reach enough valid data along the given trajectories.
+    std::vector<int> findActiveStartPixels(const std::vector<trajectory>& trjs, int minObservations);
+
+    // Load the psi/phi images on to the GPU and keep them there, so that subsequent
+    // searches (with different velocity grids, barycentric corrections, or thresholds)
+    // do not need to prepare, encode, and transfer them again.
+    void startSession();
+    void endSession();
+    bool inSession() const { return sessionActive; }
+
     // Gets the vector of result trajectories.
     std::vector<trajectory> getResults(int start, int end);
 
     // Get the predicted (pixel) positions for a given trajectory.
     pixelPos getTrajPos(const trajectory& t, int i) const;
-    std::vector<pixelPos> getMultTrajPos(trajectory& t) const;
+    std::vector<pixelPos> getMultTrajPos(const trajectory& t) const;
+
+    // Precompute the offsets of the velocities (or of the current search list) at each image
+    // time. The positions for the curves, stamps, and trajectory positions of trajectories
+    // with these velocities are then computed from the table.
+    void buildTrajectoryOffsets(const std::vector<trajectory>& velocities);
+    void buildSearchListOffsets() { buildTrajectoryOffsets(searchList); }
+    void clearTrajectoryOffsets() { offsets = TrajectoryOffsets(); }
+    int numTrajectoryOffsets() const { return offsets.numVelocities(); }
 
     // Filters the results based on various parameters.
     void filterResults(int minObservations);
@@ -87,26 +132,39 @@ public:
     // Save internal data products to a file.
     void savePsiPhi(const std::string& path);
 
+    // Generate the psi/phi images (if needed) and free the mask and variance layers
+    // of the search's copy of the images. Only the science layer (for stamps) is
+    // used after that point.
+    void releaseImageLayers();
+
     // Helper functions for computing Psi and Phi.
     void preparePsiPhi();
 
+    // Use precomputed phi images, for example from a search on the same images before
+    // sources were added to their science layers (which does not change phi). Only the
+    // psi images are generated by preparePsiPhi.
+    void setPhiImages(const std::vector<RawImage>& phi);
+
     // Helper functions for testing.
     void setResults(const std::vector<trajectory>& new_results);
 
-    virtual ~KBMOSearch(){};
+    // The (name, seconds) of every timed operation since the last clear (up to the
+    // MAX_TIMINGS most recent ones). These are recorded whether or not debugging
+    // output is enabled.
+    const std::vector<std::pair<std::string, double> >& getTimings() const { return timings; }
+    void clearTimings() { timings.clear(); }
+
+    virtual ~KBMOSearch();
 
 protected:
     void saveImages(const std::string& path);
     void sortResults();
     std::vector<float> createCurves(trajectory t, const std::vector<RawImage>& imgs);
 
-    // Fill an interleaved vector for the GPU functions.
-    void fillPsiAndPhiVects(const std::vector<RawImage>& psiImgs, const std::vector<RawImage>& phiImgs,
-                            std::vector<float>* psiVect, std::vector<float>* phiVect);
-
-    // Set the parameter min/max/scale from the psi/phi/other images.
-    std::vector<scaleParameters> computeImageScaling(const std::vector<RawImage>& vect,
-                                                     int encoding_bytes) const;
+    // Fill a contiguous buffer of the images (as floats or encoded with numBytes per pixel)
+    // for the GPU functions. The scale parameters of the encoding are filled if it is used.
+    void fillImageVect(const std::vector<RawImage>& imgs, int numBytes, std::vector<uint8_t>* vect,
+                       std::vector<scaleParameters>* scales);
 
     // Functions to create and access stamps around proposed trajectories or
     // regions. Used to visualize the results.
@@ -118,6 +176,9 @@ protected:
     void createSearchList(int angleSteps, int veloctiySteps, float minAngle, float maxAngle,
                           float minVelocity, float maxVelocity);
 
+    // Run the search on the GPU using the current searchList.
+    void runSearch(int minObservations);
+
     // Helper functions for timing operations of the search.
     void startTimer(const std::string& message);
     void endTimer();
@@ -131,16 +192,29 @@ protected:
     std::vector<RawImage> phiImages;
     std::vector<trajectory> results;
 
-    // Variables for the timer.
-    std::chrono::time_point<std::chrono::system_clock> tStart, tEnd;
-    std::chrono::duration<double> tDelta;
+    // Variables for the timer. The stack holds the (name, start) of the running timers.
+    static constexpr unsigned MAX_TIMINGS = 10000;
+    std::vector<std::pair<std::string, std::chrono::time_point<std::chrono::system_clock> > > timerStack;
+    std::vector<std::pair<std::string, double> > timings;
 
     // Parameters for the GPU search.
     searchParameters params;
 
+    // Parameters for skipping starting pixels without enough reachable data.
+    bool useStartPixelFilter;
+    float minReachableFrac;
+
+    // The search data resident on the GPU during a session.
+    bool sessionActive;
+    deviceSearchData sessionData;
+
     // Parameters to do barycentric corrections.
     bool useCorr;
+    int numBaryCorrSets;
     std::vector<baryCorrection> baryCorrs;
+
+    // The precomputed offsets of the velocities at each time.
+    TrajectoryOffsets offsets;
 };
 
 } /* namespace search */
@@ -9,17 +9,21 @@
 
 namespace search {
 
-LayeredImage::LayeredImage(std::string path, const PointSpreadFunc& psf) : psf(psf), psfSQ(psf) {
+LayeredImage::LayeredImage(std::string path, const PointSpreadFunc& psf) : LayeredImage(path, psf, false) {}
+
+LayeredImage::LayeredImage(std::string path, const PointSpreadFunc& psf, bool lazy)
+        : psf(psf), psfSQ(psf), filePath(path) {
     psfSQ.squarePSF();
 
     int fBegin = path.find_last_of("/");
     int fEnd = path.find_last_of(".fits") - 4;
     fileName = path.substr(fBegin, fEnd - fBegin);
     readHeader(path);
-    science = RawImage(width, height);
-    mask = RawImage(width, height);
-    variance = RawImage(width, height);
-    loadLayers(path);
+
+    scienceLoaded = false;
+    maskLoaded = false;
+    varianceLoaded = false;
+    if (!lazy) loadLayers();
 }
 
 LayeredImage::LayeredImage(std::string name, int w, int h, float noiseStDev, float pixelVariance, double time,
@@ -49,6 +53,25 @@ LayeredImage::LayeredImage(std::string name, int w, int h, float noiseStDev, flo
     variance = RawImage(w, h, std::vector<float>(pixelsPerImage, pixelVariance));
 }
 
+LayeredImage::LayeredImage(std::string name, const RawImage& sci, const RawImage& var, const RawImage& msk,
+                           double time, const PointSpreadFunc& psf)
+        : psf(psf), psfSQ(psf) {
+    fileName = name;
+    width = sci.getWidth();
+    height = sci.getHeight();
+    pixelsPerImage = width * height;
+    captureTime = time;
+    psfSQ.squarePSF();
+
+    if (var.getWidth() != width || msk.getWidth() != width)
+        throw std::runtime_error("Image width does not match");
+    if (var.getHeight() != height || msk.getHeight() != height)
+        throw std::runtime_error("Image height does not match");
+    science = sci;
+    variance = var;
+    mask = msk;
+}
+
 /* Read the image dimensions and capture time from header */
 void LayeredImage::readHeader(const std::string& filePath) {
     fitsfile* fptr;
@@ -77,17 +100,79 @@ void LayeredImage::readHeader(const std::string& filePath) {
 
     width = dimensions[0];
     height = dimensions[1];
+    fileWidth = width;
+    fileHeight = height;
     // Calculate pixels per image from dimensions x*y
     pixelsPerImage = width * height;
 
     if (fits_close_file(fptr, &status)) fits_report_error(stderr, status);
 }
 
-void LayeredImage::loadLayers(const std::string& filePath) {
-    // Load images from file into layers' pixels
-    readFitsImg((filePath + "[1]").c_str(), science.getDataRef());
-    readFitsImg((filePath + "[2]").c_str(), mask.getDataRef());
-    readFitsImg((filePath + "[3]").c_str(), variance.getDataRef());
+void LayeredImage::loadLayers() {
+    // Load images from file into layers' pixels, skipping the layers that are
+    // already in memory (read or set) and the released layers.
+    loadLayer(science, scienceLoaded, scienceReleased, 1);
+    loadLayer(mask, maskLoaded, maskReleased, 2);
+    loadLayer(variance, varianceLoaded, varianceReleased, 3);
+}
+
+void LayeredImage::loadLayer(RawImage& layer, bool& loaded, bool released, int hdu) {
+    if (loaded || released) return;
+    layer = RawImage(width, height);
+    readFitsImg((filePath + "[" + std::to_string(hdu) + "]").c_str(), layer.getDataRef());
+    loaded = true;
+}
+
+bool LayeredImage::isLoaded() const {
+    return (scienceLoaded || scienceReleased) && (maskLoaded || maskReleased) &&
+           (varianceLoaded || varianceReleased);
+}
+
+void LayeredImage::setRegion(int xMin, int xMax, int yMin, int yMax) {
+    if (scienceLoaded || maskLoaded || varianceLoaded)
+        throw std::runtime_error("The region must be set before the layers are loaded");
+    if (xMin < 0 || yMin < 0 || xMin >= xMax || yMin >= yMax || xMax > fileWidth || yMax > fileHeight)
+        throw std::runtime_error("Invalid image region");
+
+    xOffset = xMin;
+    yOffset = yMin;
+    width = xMax - xMin;
+    height = yMax - yMin;
+    pixelsPerImage = width * height;
+}
+
+void LayeredImage::releaseLayers(bool keepScience) {
+    // Assigning empty images frees the pixel memory.
+    if (!keepScience) {
+        science = RawImage();
+        scienceReleased = true;
+    }
+    mask = RawImage();
+    variance = RawImage();
+    maskReleased = true;
+    varianceReleased = true;
+}
+
+void LayeredImage::checkReleased(bool released, const std::string& layer) const {
+    if (released) throw std::runtime_error("The " + layer + " layer of " + fileName + " has been released");
+}
+
+RawImage& LayeredImage::getScience() {
+    checkReleased(scienceReleased, "science");
+    loadLayers();
+    return science;
+}
+
+RawImage& LayeredImage::getMask() {
+    checkReleased(maskReleased, "mask");
+    loadLayers();
+    return mask;
+}
+
+RawImage& LayeredImage::getVariance() {
+    checkReleased(varianceReleased, "variance");
+    loadLayers();
+    return variance;
 }
 
 void LayeredImage::readFitsImg(const char* name, float* target) {
@@ -97,7 +182,12 @@ void LayeredImage::readFitsImg(const char* name, float* target) {
     int status = 0;
 
     if (fits_open_file(&fptr, name, READONLY, &status)) fits_report_error(stderr, status);
-    if (fits_read_img(fptr, TFLOAT, 1, pixelsPerImage, &nullval, target, &anynull, &status))
+
+    // Only read the image's region (the whole image unless setRegion was called).
+    long fpixel[2] = {xOffset + 1, yOffset + 1};
+    long lpixel[2] = {xOffset + width, yOffset + height};
+    long inc[2] = {1, 1};
+    if (fits_read_subset(fptr, TFLOAT, fpixel, lpixel, inc, &nullval, target, &anynull, &status))
         fits_report_error(stderr, status);
     if (fits_close_file(fptr, &status)) fits_report_error(stderr, status);
 }
@@ -114,40 +204,41 @@ void LayeredImage::addObject(float x, float y, float flux) {
     float initialX = x - static_cast<float>(psf.getRadius());
     float initialY = y - static_cast<float>(psf.getRadius());
 
+    RawImage& sci = getScience();
     int count = 0;
     for (int i = 0; i < dim; ++i) {
         for (int j = 0; j < dim; ++j) {
-            science.addPixelInterp(initialX + static_cast<float>(i), initialY + static_cast<float>(j),
-                                   flux * k[count]);
+            sci.addPixelInterp(initialX + static_cast<float>(i), initialY + static_cast<float>(j),
+                               flux * k[count]);
             count++;
         }
     }
 }
 
 void LayeredImage::growMask(int steps, bool on_gpu) {
-    science.growMask(steps, on_gpu);
-    variance.growMask(steps, on_gpu);
+    getScience().growMask(steps, on_gpu);
+    getVariance().growMask(steps, on_gpu);
 }
 
 void LayeredImage::convolvePSF() {
-    science.convolve(psf);
-    variance.convolve(psfSQ);
+    getScience().convolve(psf);
+    getVariance().convolve(psfSQ);
 }
 
 void LayeredImage::applyMaskFlags(int flags, const std::vector<int>& exceptions) {
-    science.applyMask(flags, exceptions, mask);
-    variance.applyMask(flags, exceptions, mask);
+    getScience().applyMask(flags, exceptions, getMask());
+    getVariance().applyMask(flags, exceptions, getMask());
 }
 
 /* Mask all pixels that are not 0 in global mask */
 void LayeredImage::applyGlobalMask(const RawImage& globalM) {
-    science.applyMask(0xFFFFFF, {}, globalM);
-    variance.applyMask(0xFFFFFF, {}, globalM);
+    getScience().applyMask(0xFFFFFF, {}, globalM);
+    getVariance().applyMask(0xFFFFFF, {}, globalM);
 }
 
 void LayeredImage::applyMaskThreshold(float thresh) {
-    float* sciPix = science.getDataRef();
-    float* varPix = variance.getDataRef();
+    float* sciPix = getSDataRef();
+    float* varPix = getVDataRef();
     for (int i = 0; i < pixelsPerImage; ++i) {
         if (sciPix[i] > thresh) {
             sciPix[i] = NO_DATA;
@@ -158,7 +249,7 @@ void LayeredImage::applyMaskThreshold(float thresh) {
 
 void LayeredImage::subtractTemplate(const RawImage& subTemplate) {
     assert(getHeight() == subTemplate.getHeight() && getWidth() == subTemplate.getWidth());
-    float* sciPix = science.getDataRef();
+    float* sciPix = getSDataRef();
     const std::vector<float>& tempPix = subTemplate.getPixels();
     for (unsigned i = 0; i < pixelsPerImage; ++i) {
         if ((sciPix[i] != NO_DATA) && (tempPix[i] != NO_DATA)) {
@@ -189,36 +280,43 @@ void LayeredImage::saveLayers(const std::string& path) {
     fits_close_file(fptr, &status);
     fits_report_error(stderr, status);
 
-    science.saveToFile(path + fileName + ".fits", true);
-    mask.saveToFile(path + fileName + ".fits", true);
-    variance.saveToFile(path + fileName + ".fits", true);
+    getScience().saveToFile(path + fileName + ".fits", true);
+    getMask().saveToFile(path + fileName + ".fits", true);
+    getVariance().saveToFile(path + fileName + ".fits", true);
 }
 
 void LayeredImage::saveSci(const std::string& path) {
-    science.saveToFile(path + fileName + "SCI.fits", false);
+    getScience().saveToFile(path + fileName + "SCI.fits", false);
 }
 
 void LayeredImage::saveMask(const std::string& path) {
-    mask.saveToFile(path + fileName + "MASK.fits", false);
+    getMask().saveToFile(path + fileName + "MASK.fits", false);
 }
 
 void LayeredImage::saveVar(const std::string& path) {
-    variance.saveToFile(path + fileName + "VAR.fits", false);
+    getVariance().saveToFile(path + fileName + "VAR.fits", false);
 }
 
+// The setters replace the layer without reading it from the file (and restore a released layer).
 void LayeredImage::setScience(RawImage& im) {
     checkDims(im);
     science = im;
+    scienceLoaded = true;
+    scienceReleased = false;
 }
 
 void LayeredImage::setMask(RawImage& im) {
     checkDims(im);
     mask = im;
+    maskLoaded = true;
+    maskReleased = false;
 }
 
 void LayeredImage::setVariance(RawImage& im) {
     checkDims(im);
     variance = im;
+    varianceLoaded = true;
+    varianceReleased = false;
 }
 
 void LayeredImage::checkDims(RawImage& im) {
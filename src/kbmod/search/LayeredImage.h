@@ -26,11 +26,18 @@ namespace search {
 class LayeredImage {
 public:
     LayeredImage(std::string path, const PointSpreadFunc& psf);
+
+    // Read only the header of the file. The layers are read on first access.
+    LayeredImage(std::string path, const PointSpreadFunc& psf, bool lazy);
     LayeredImage(std::string name, int w, int h, float noiseStDev, float pixelVariance, double time,
                  const PointSpreadFunc& psf);
     LayeredImage(std::string name, int w, int h, float noiseStDev, float pixelVariance, double time,
                  const PointSpreadFunc& psf, int seed);
 
+    // Build an image from existing layers (such as those loaded from a packed stack).
+    LayeredImage(std::string name, const RawImage& sci, const RawImage& var, const RawImage& msk, double time,
+                 const PointSpreadFunc& psf);
+
     // Set an image specific point spread function.
     void setPSF(const PointSpreadFunc& psf);
     const PointSpreadFunc& getPSF() const { return psf; }
@@ -46,15 +53,33 @@ public:
     // Basic setter functions.
     void setTime(double timestamp) { captureTime = timestamp; }
 
-    // Getter functions for the data in the individual layers.
-    RawImage& getScience() { return science; }
-    RawImage& getMask() { return mask; }
-    RawImage& getVariance() { return variance; }
+    // Getter functions for the data in the individual layers. These read the
+    // layers from the file if they have not been loaded yet.
+    RawImage& getScience();
+    RawImage& getMask();
+    RawImage& getVariance();
 
     // Get pointers to the raw pixel arrays.
-    float* getSDataRef() { return science.getDataRef(); }
-    float* getVDataRef() { return variance.getDataRef(); }
-    float* getMDataRef() { return mask.getDataRef(); }
+    float* getSDataRef() { return getScience().getDataRef(); }
+    float* getVDataRef() { return getVariance().getDataRef(); }
+    float* getMDataRef() { return getMask().getDataRef(); }
+
+    // Read the layers of a lazily loaded image from its file. Does nothing if
+    // the layers are already in memory.
+    void loadLayers();
+    bool isLoaded() const;
+
+    // Free the memory of the mask and variance layers (and the science layer unless
+    // keepScience is true), for example once the psi and phi images have been
+    // generated. Accessing a released layer throws an error.
+    void releaseLayers(bool keepScience);
+
+    // Restrict a lazily loaded image to the pixels [xMin, xMax) x [yMin, yMax) of the
+    // file, so only that region is read. The offsets give the position of the region
+    // within the file's image.
+    void setRegion(int xMin, int xMax, int yMin, int yMax);
+    unsigned getXOffset() const { return xOffset; }
+    unsigned getYOffset() const { return yOffset; }
 
     // Applies the mask functions to each of the science and variance layers.
     void applyMaskFlags(int flag, const std::vector<int>& exceptions);
@@ -74,7 +99,8 @@ public:
     void saveMask(const std::string& path);
     void saveVar(const std::string& path);
 
-    // Setter functions for the individual layers.
+    // Setter functions for the individual layers. These do not read the layer
+    // from the file and can restore a released layer.
     void setScience(RawImage& im);
     void setMask(RawImage& im);
     void setVariance(RawImage& im);
@@ -88,13 +114,26 @@ public:
 
 private:
     void readHeader(const std::string& filePath);
-    void loadLayers(const std::string& filePath);
     void readFitsImg(const char* name, float* target);
     void checkDims(RawImage& im);
+    void checkReleased(bool released, const std::string& layer) const;
+    void loadLayer(RawImage& layer, bool& loaded, bool released, int hdu);
 
     std::string fileName;
+    std::string filePath;
+    // Whether each layer is in memory and whether it has been released.
+    bool scienceLoaded = true;
+    bool maskLoaded = true;
+    bool varianceLoaded = true;
+    bool scienceReleased = false;
+    bool maskReleased = false;
+    bool varianceReleased = false;
     unsigned width;
     unsigned height;
+    unsigned xOffset = 0;
+    unsigned yOffset = 0;
+    unsigned fileWidth;
+    unsigned fileHeight;
     unsigned pixelsPerImage;
     double captureTime;
 
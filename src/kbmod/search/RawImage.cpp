@@ -221,7 +221,10 @@ void RawImage::addToPixel(float fx, float fy, float value) {
     assert(fx - floor(fx) == 0.0 && fy - floor(fy) == 0.0);
     int x = static_cast<int>(fx);
     int y = static_cast<int>(fy);
-    if (x >= 0 && x < width && y >= 0 && y < height) pixels[y * width + x] += value;
+    // Masked pixels stay masked.
+    if (x >= 0 && x < width && y >= 0 && y < height && pixels[y * width + x] != NO_DATA) {
+        pixels[y * width + x] += value;
+    }
 }
 
 void RawImage::setPixel(int x, int y, float value) {
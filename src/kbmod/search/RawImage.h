@@ -63,6 +63,7 @@ public:
 
     void setAllPix(float value);
     void setPixel(int x, int y, float value);
+    // Add to the value of a pixel (NO_DATA pixels are left unchanged).
     void addToPixel(float fx, float fy, float value);
     void addPixelInterp(float x, float y, float value);
     std::vector<float> bilinearInterp(float x, float y) const;
@@ -26,4 +26,74 @@ double aveTrajectoryDistance(const std::vector<pixelPos>& posA, const std::vecto
     return sum / (double)num_times;
 }
 
+/* Compute the distance from a velocity to the (annular sector) search region.
+   Used to determine which grid velocities are needed to cover the region. */
+float velocityDistanceToRegion(float xVel, float yVel, float minAngle, float maxAngle, float minVelocity,
+                               float maxVelocity) {
+    const float two_pi = 2.0 * M_PI;
+    const float speed = sqrt(xVel * xVel + yVel * yVel);
+
+    // If the velocity's angle falls within the angle limits (or the angle limits
+    // cover the full circle), the closest point lies on the same ray.
+    float delta = fmod(atan2(yVel, xVel) - minAngle, two_pi);
+    if (delta < 0.0) delta += two_pi;
+    if ((maxAngle - minAngle >= two_pi) || (delta <= maxAngle - minAngle)) {
+        if (speed < minVelocity) return minVelocity - speed;
+        if (speed > maxVelocity) return speed - maxVelocity;
+        return 0.0;
+    }
+
+    // Otherwise the closest point lies on one of the two bounding line segments.
+    float best = FLT_MAX;
+    for (float angle : {minAngle, maxAngle}) {
+        float u_x = cos(angle);
+        float u_y = sin(angle);
+        float proj = std::min(std::max(xVel * u_x + yVel * u_y, minVelocity), maxVelocity);
+        float dx = xVel - proj * u_x;
+        float dy = yVel - proj * u_y;
+        best = std::min(best, sqrt(dx * dx + dy * dy));
+    }
+    return best;
+}
+
+static uint64_t velocityKey(float xVel, float yVel) {
+    uint32_t x_bits;
+    uint32_t y_bits;
+    std::memcpy(&x_bits, &xVel, sizeof(x_bits));
+    std::memcpy(&y_bits, &yVel, sizeof(y_bits));
+    return (static_cast<uint64_t>(x_bits) << 32) | y_bits;
+}
+
+TrajectoryOffsets::TrajectoryOffsets(const std::vector<trajectory>& velocities,
+                                     const std::vector<float>& times)
+        : numTimes(times.size()) {
+    // Only keep the first copy of each velocity.
+    std::vector<trajectory> unique;
+    for (const trajectory& trj : velocities) {
+        if (velocityIndex.emplace(velocityKey(trj.xVel, trj.yVel), unique.size()).second) {
+            unique.push_back(trj);
+        }
+    }
+
+    const int num_entries = unique.size() * numTimes;
+    xOffsets.resize(num_entries);
+    yOffsets.resize(num_entries);
+    xPixelOffsets.resize(num_entries);
+    yPixelOffsets.resize(num_entries);
+    for (int v = 0; v < unique.size(); ++v) {
+        for (int i = 0; i < numTimes; ++i) {
+            const int index = v * numTimes + i;
+            xOffsets[index] = times[i] * unique[v].xVel;
+            yOffsets[index] = times[i] * unique[v].yVel;
+            xPixelOffsets[index] = int(xOffsets[index] + 0.5);
+            yPixelOffsets[index] = int(yOffsets[index] + 0.5);
+        }
+    }
+}
+
+int TrajectoryOffsets::find(float xVel, float yVel) const {
+    auto it = velocityIndex.find(velocityKey(xVel, yVel));
+    return (it == velocityIndex.end()) ? -1 : it->second;
+}
+
 } /* namespace search */
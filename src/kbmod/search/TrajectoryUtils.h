@@ -10,7 +10,12 @@
 #define TRAJECTORYUTILS_H_
 
 #include "common.h"
+#include <algorithm>
 #include <cmath>
+#include <cstdint>
+#include <cstring>
+#include <float.h>
+#include <unordered_map>
 #include <vector>
 
 namespace search {
@@ -29,6 +34,45 @@ inline pixelPos computeTrajPosBC(const trajectory& t, float time, const baryCorr
    positions. Used in duplicate filtering and clustering. */
 double avePixelDistance(const std::vector<pixelPos>& posA, const std::vector<pixelPos>& posB);
 
+/* Compute the distance (in pixels per day) from a velocity to the search region
+   given by the angle and velocity limits. Returns 0.0 for velocities inside the region. */
+float velocityDistanceToRegion(float xVel, float yVel, float minAngle, float maxAngle, float minVelocity,
+                               float maxVelocity);
+
+/* A table of the offsets (time * velocity) of a list of velocities at each time along
+   with the offsets rounded to the nearest pixel. The positions of a trajectory with one
+   of the velocities are computed by adding the offsets to its starting pixel, so they
+   are only computed once for all the starting pixels. */
+class TrajectoryOffsets {
+public:
+    TrajectoryOffsets() : numTimes(0) {}
+    TrajectoryOffsets(const std::vector<trajectory>& velocities, const std::vector<float>& times);
+
+    int numVelocities() const { return velocityIndex.size(); }
+    int getNumTimes() const { return numTimes; }
+
+    // Returns the index of a velocity in the table or -1 if it is not in the table.
+    int find(float xVel, float yVel) const;
+
+    // The offsets of the velocity with index v at each time.
+    const float* getXOffsets(int v) const { return &xOffsets[v * numTimes]; }
+    const float* getYOffsets(int v) const { return &yOffsets[v * numTimes]; }
+
+    // The offsets rounded to the nearest pixel as in the search: int(time * velocity + 0.5).
+    const int* getXPixelOffsets(int v) const { return &xPixelOffsets[v * numTimes]; }
+    const int* getYPixelOffsets(int v) const { return &yPixelOffsets[v * numTimes]; }
+
+private:
+    int numTimes;
+    std::vector<float> xOffsets;
+    std::vector<float> yOffsets;
+    std::vector<int> xPixelOffsets;
+    std::vector<int> yPixelOffsets;
+
+    // Maps the bits of each (xVel, yVel) to its index.
+    std::unordered_map<uint64_t, int> velocityIndex;
+};
+
 } /* namespace search */
 
 #endif /* TRAJECTORYUTILS_H_ */
@@ -9,6 +9,7 @@
 #include "KBMOSearch.cpp"
 #include "Filtering.cpp"
 #include "TrajectoryUtils.cpp"
+#include "ImageEncoding.cpp"
 
 namespace py = pybind11;
 
@@ -23,8 +24,29 @@ using pp = search::pixelPos;
 
 using std::to_string;
 
+// Copy between vectors of structs and numpy structured arrays with a single
+// copy of the memory (without creating a Python object per element).
+template <typename T>
+py::array_t<T> vectorToArray(const std::vector<T>& vect) {
+    return py::array_t<T>(vect.size(), vect.data());
+}
+
+template <typename T>
+std::vector<T> arrayToVector(const py::array_t<T, py::array::c_style>& arr) {
+    return std::vector<T>(arr.data(), arr.data() + arr.size());
+}
+
 PYBIND11_MODULE(search, m) {
     m.attr("KB_NO_DATA") = pybind11::float_(search::NO_DATA);
+
+    // The numpy dtypes of the structs use the same field names as their Python bindings.
+    PYBIND11_NUMPY_DTYPE_EX(tj, xVel, "x_v", yVel, "y_v", lh, "lh", flux, "flux", x, "x", y, "y", obsCount,
+                            "obs_count", baryIndex, "bary_index");
+    PYBIND11_NUMPY_DTYPE(pp, x, y);
+    PYBIND11_NUMPY_DTYPE(bc, dx, dxdx, dxdy, dy, dydx, dydy);
+    m.attr("trajectory_dtype") = py::dtype::of<tj>();
+    m.attr("pixel_pos_dtype") = py::dtype::of<pp>();
+    m.attr("bary_correction_dtype") = py::dtype::of<bc>();
     py::enum_<search::StampType>(m, "StampType")
             .value("STAMP_SUM", search::StampType::STAMP_SUM)
             .value("STAMP_MEAN", search::StampType::STAMP_MEAN)
@@ -94,7 +116,7 @@ PYBIND11_MODULE(search, m) {
             .def("find_central_moments", &ri::findCentralMoments, "Returns the central moments of the image.")
             .def("create_stamp", &ri::createStamp)
             .def("set_pixel", &ri::setPixel, "Set the value of a given pixel.")
-            .def("add_pixel", &ri::addToPixel, "Add to the value of a given pixel.")
+            .def("add_pixel", &ri::addToPixel, "Add to the value of a given pixel (NO_DATA pixels are unchanged).")
             .def("apply_mask", &ri::applyMask)
             .def("grow_mask", &ri::growMask)
             .def("pixel_has_data", &ri::pixelHasData,
@@ -109,8 +131,10 @@ PYBIND11_MODULE(search, m) {
     m.def("create_mean_image", &search::createMeanImage);
     py::class_<li>(m, "layered_image")
             .def(py::init<const std::string, pf &>())
+            .def(py::init<const std::string, pf &, bool>())
             .def(py::init<std::string, int, int, double, float, float, pf &>())
             .def(py::init<std::string, int, int, double, float, float, pf &, int>())
+            .def(py::init<std::string, ri &, ri &, ri &, double, pf &>())
             .def("set_psf", &li::setPSF, "Sets the PSF object.")
             .def("get_psf", &li::getPSF, "Returns the PSF object.")
             .def("get_psfsq", &li::getPSFSQ)
@@ -124,6 +148,12 @@ PYBIND11_MODULE(search, m) {
             .def("get_science", &li::getScience, "Returns the science layer raw_image.")
             .def("get_mask", &li::getMask, "Returns the mask layer raw_image.")
             .def("get_variance", &li::getVariance, "Returns the variance layer raw_image.")
+            .def("load_layers", &li::loadLayers, "Reads the layers of a lazily loaded image.")
+            .def("is_loaded", &li::isLoaded, "Returns whether the layers are in memory.")
+            .def("release_layers", &li::releaseLayers, "Frees the memory of the image layers.")
+            .def("set_region", &li::setRegion, "Restricts a lazily loaded image to a region.")
+            .def("get_x_offset", &li::getXOffset, "Returns the x offset of the image's region.")
+            .def("get_y_offset", &li::getYOffset, "Returns the y offset of the image's region.")
             .def("set_science", &li::setScience)
             .def("set_mask", &li::setMask)
             .def("set_variance", &li::setVariance)
@@ -154,6 +184,10 @@ PYBIND11_MODULE(search, m) {
             .def("simple_difference", &is::simpleDifference)
             .def("save_global_mask", &is::saveGlobalMask)
             .def("save_images", &is::saveImages)
+            .def("release_layers", &is::releaseLayers)
+            .def("set_region", &is::setRegion)
+            .def("add_objects", &is::addObjects, py::arg("trjs"), py::arg("bary_corrs") = std::vector<bc>(),
+                 "Adds point sources along the trajectories to the science layers.")
             .def("get_global_mask", &is::getGlobalMask)
             .def("get_sciences", &is::getSciences)
             .def("get_masks", &is::getMasks)
@@ -166,13 +200,23 @@ PYBIND11_MODULE(search, m) {
     py::class_<ks>(m, "stack_search")
             .def(py::init<is &>())
             .def("save_psi_phi", &ks::savePsiPhi)
-            .def("search", &ks::search)
+            .def("release_image_layers", &ks::releaseImageLayers, py::call_guard<py::gil_scoped_release>())
+            .def("search", &ks::search, py::call_guard<py::gil_scoped_release>())
+            .def("search_drift", &ks::searchDrift, py::call_guard<py::gil_scoped_release>())
+            .def("create_drift_search_list", &ks::createDriftSearchList)
             .def("enable_gpu_sigmag_filter", &ks::enableGPUSigmaGFilter)
-            .def("enable_gpu_encoding", &ks::enableGPUEncoding)
+            .def("enable_gpu_encoding", &ks::enableGPUEncoding, py::arg("psi_num_bytes"),
+                 py::arg("phi_num_bytes"), py::arg("tile_size") = 0, py::arg("clip_frac") = 0.0,
+                 py::arg("half") = false)
             .def("enable_corr", &ks::enableCorr)
+            .def("disable_corr", &ks::disableCorr)
+            .def("enable_start_pixel_filter", &ks::enableStartPixelFilter)
             .def("set_start_bounds_x", &ks::setStartBoundsX)
             .def("set_start_bounds_y", &ks::setStartBoundsY)
             .def("set_debug", &ks::setDebug)
+            .def("start_session", &ks::startSession)
+            .def("end_session", &ks::endSession)
+            .def("in_session", &ks::inSession)
             .def("filter_min_obs", &ks::filterResults)
             .def("get_num_images", &ks::numImages)
             .def("get_image_stack", &ks::getImageStack)
@@ -185,16 +229,50 @@ PYBIND11_MODULE(search, m) {
                  (std::vector<ri>(ks::*)(std::vector<tj> &, std::vector<std::vector<bool>> &,
                                          const search::stampParameters &)) &
                          ks::coaddedScienceStampsGPU)
+            .def("gpu_coadded_stamps",
+                 [](ks &s, py::array_t<tj, py::array::c_style> trjs,
+                    std::vector<std::vector<bool>> &use_index, const search::stampParameters &params) {
+                     std::vector<tj> trj_vect = arrayToVector(trjs);
+                     return s.coaddedScienceStampsGPU(trj_vect, use_index, params);
+                 })
             // For testing
+            .def("find_active_start_pixels", &ks::findActiveStartPixels)
             .def("get_traj_pos", &ks::getTrajPos)
             .def("get_mult_traj_pos", &ks::getMultTrajPos)
+            .def("get_mult_traj_pos",
+                 [](const ks &s, py::array_t<tj, py::array::c_style> trjs) {
+                     // The (num_trajectories, num_images) positions.
+                     const int num_trjs = trjs.size();
+                     const int num_times = s.numImages();
+                     py::array_t<pp> result({num_trjs, num_times});
+                     pp *pos = result.mutable_data();
+                     const tj *trj_data = trjs.data();
+                     for (int t = 0; t < num_trjs; ++t) {
+                         std::vector<pp> trj_pos = s.getMultTrajPos(trj_data[t]);
+                         std::copy(trj_pos.begin(), trj_pos.end(), pos + t * num_times);
+                     }
+                     return result;
+                 })
+            .def("build_trajectory_offsets", &ks::buildTrajectoryOffsets,
+                 "Precomputes the offsets of the velocities at each time.")
+            .def("build_search_list_offsets", &ks::buildSearchListOffsets,
+                 "Precomputes the offsets of the velocities of the search list at each time.")
+            .def("clear_trajectory_offsets", &ks::clearTrajectoryOffsets)
+            .def("num_trajectory_offsets", &ks::numTrajectoryOffsets)
             .def("psi_curves", (std::vector<float>(ks::*)(tj &)) & ks::psiCurves)
             .def("phi_curves", (std::vector<float>(ks::*)(tj &)) & ks::phiCurves)
-            .def("prepare_psi_phi", &ks::preparePsiPhi)
+            .def("prepare_psi_phi", &ks::preparePsiPhi, py::call_guard<py::gil_scoped_release>())
             .def("get_psi_images", &ks::getPsiImages)
             .def("get_phi_images", &ks::getPhiImages)
+            .def("set_phi_images", &ks::setPhiImages)
+            .def("get_timings", &ks::getTimings)
+            .def("clear_timings", &ks::clearTimings)
             .def("get_results", &ks::getResults)
-            .def("set_results", &ks::setResults);
+            .def("get_results_array",
+                 [](ks &s, int start, int count) { return vectorToArray(s.getResults(start, count)); })
+            .def("set_results", &ks::setResults)
+            .def("set_results",
+                 [](ks &s, py::array_t<tj, py::array::c_style> trjs) { s.setResults(arrayToVector(trjs)); });
     py::class_<tj>(m, "trajectory", R"pbdoc(
             A trajectory structure holding basic information about potential results.
             )pbdoc")
@@ -206,21 +284,26 @@ PYBIND11_MODULE(search, m) {
             .def_readwrite("x", &tj::x)
             .def_readwrite("y", &tj::y)
             .def_readwrite("obs_count", &tj::obsCount)
+            .def_readwrite("bary_index", &tj::baryIndex)
             .def("__repr__",
                  [](const tj &t) {
                      return "lh: " + to_string(t.lh) + " flux: " + to_string(t.flux) +
                             " x: " + to_string(t.x) + " y: " + to_string(t.y) + " x_v: " + to_string(t.xVel) +
-                            " y_v: " + to_string(t.yVel) + " obs_count: " + to_string(t.obsCount);
+                            " y_v: " + to_string(t.yVel) + " obs_count: " + to_string(t.obsCount) +
+                            " bary_index: " + to_string(t.baryIndex);
                  })
             .def(py::pickle(
                     [](const tj &p) {  // __getstate__
-                        return py::make_tuple(p.xVel, p.yVel, p.lh, p.flux, p.x, p.y, p.obsCount);
+                        return py::make_tuple(p.xVel, p.yVel, p.lh, p.flux, p.x, p.y, p.obsCount,
+                                              p.baryIndex);
                     },
                     [](py::tuple t) {  // __setstate__
-                        if (t.size() != 7) throw std::runtime_error("Invalid state!");
+                        // Accept the older state without the barycentric correction index.
+                        if (t.size() != 7 && t.size() != 8) throw std::runtime_error("Invalid state!");
                         tj trj = {t[0].cast<float>(), t[1].cast<float>(), t[2].cast<float>(),
                                   t[3].cast<float>(), t[4].cast<short>(), t[5].cast<short>(),
-                                  t[6].cast<short>()};
+                                  t[6].cast<short>(), 0};
+                        if (t.size() == 8) trj.baryIndex = t[7].cast<short>();
                         return trj;
                     }));
     py::class_<pp>(m, "pixel_pos")
@@ -262,6 +345,9 @@ PYBIND11_MODULE(search, m) {
                        " y; " + " dy = " + to_string(b.dy) + " + " + to_string(b.dydx) + " x + " +
                        to_string(b.dydy) + " y";
             });
+    // Conversions between lists of trajectories and numpy arrays.
+    m.def("trajectory_array", &vectorToArray<tj>);
+    m.def("trajectory_list", &arrayToVector<tj>);
     // Functions from Filtering.cpp
     m.def("sigmag_filtered_indices", &search::sigmaGFilteredIndices);
     m.def("calculate_likelihood_psi_phi", &search::calculateLikelihoodFromPsiPhi);
@@ -270,4 +356,9 @@ PYBIND11_MODULE(search, m) {
     m.def("compute_traj_pos", &search::computeTrajPos);
     m.def("compute_traj_pos_bc", &search::computeTrajPosBC);
     m.def("ave_trajectory_dist", &search::aveTrajectoryDistance);
+    m.def("velocity_distance_to_region", &search::velocityDistanceToRegion);
+
+    // Functions from ImageEncoding
+    m.def("encode_and_decode_images", &search::encodeAndDecodeImages, py::arg("images"), py::arg("num_bytes"),
+          py::arg("tile_size") = 0, py::arg("clip_frac") = 0.0, py::arg("half") = false);
 }
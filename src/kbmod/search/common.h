@@ -37,6 +37,8 @@ struct trajectory {
     short y;
     // Number of images summed
     short obsCount;
+    // Index of the barycentric correction set used (if any)
+    short baryIndex;
 };
 
 // The position (in pixels) of a trajectory.
@@ -80,6 +82,13 @@ struct searchParameters {
     int psiNumBytes;  // -1 (No encoding), 1 or 2
     int phiNumBytes;  // -1 (No encoding), 1 or 2
 
+    // The edge (in pixels) of the square tiles that are scaled separately (0 for one
+    // scale per image), the fraction of the pixels at each end of a tile's range that
+    // are clipped, and whether the 2 byte encoding uses half precision floats.
+    int encodeTileSize;
+    float encodeClipFrac;
+    bool encodeHalf;
+
     // The bounds on which x and y pixels can be used
     // to start a search.
     int x_start_min;
@@ -91,6 +100,8 @@ struct searchParameters {
     bool debug;
 };
 
+// The scaling of one tile of an encoded image. Half precision encodings store
+// value / scale.
 struct scaleParameters {
     float minVal;
     float maxVal;
@@ -102,12 +113,35 @@ struct perImageData {
     int numImages = 0;
 
     float* imageTimes = nullptr;
+
+    // The barycentric corrections for numBaryCorrSets distances, stored as
+    // numImages corrections per distance.
+    int numBaryCorrSets = 1;
     baryCorrection* baryCorrs = nullptr;
 
     scaleParameters* psiParams = nullptr;
     scaleParameters* phiParams = nullptr;
 };
 
+// Search data (times and encoded psi/phi images) that has been loaded on to the device.
+struct deviceSearchData {
+    int numImages = 0;
+    int width = 0;
+    int height = 0;
+
+    // The encoding used for the psi and phi images: -1 (No encoding), 1 or 2
+    int psiNumBytes = -1;
+    int phiNumBytes = -1;
+    int encodeTileSize = 0;
+    bool encodeHalf = false;
+
+    float* imageTimes = nullptr;
+    void* psi = nullptr;
+    void* phi = nullptr;
+    scaleParameters* psiParams = nullptr;
+    scaleParameters* phiParams = nullptr;
+};
+
 struct stampParameters {
     int radius = 10;
     StampType stamp_type = STAMP_SUM;
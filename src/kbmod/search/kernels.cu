@@ -70,7 +70,19 @@ extern "C" __device__ __host__ void sigmaGFilteredIndicesCU(float *values, int n
     *maxKeepIndex = end - 1;
 }
 
-__device__ float readEncodedPixel(void *imageVect, int index, int numBytes, const scaleParameters &params) {
+// Convert an IEEE half precision value (stored as its bits) to a float.
+__device__ float halfBitsToFloat(uint16_t value) {
+    float result;
+    asm("cvt.f32.f16 %0, %1;" : "=f"(result) : "h"(value));
+    return result;
+}
+
+__device__ float readEncodedPixel(void *imageVect, int index, int numBytes, bool half,
+                                  const scaleParameters &params) {
+    if (half) {
+        float value = halfBitsToFloat(reinterpret_cast<uint16_t *>(imageVect)[index]);
+        return isnan(value) ? NO_DATA : value * params.scale;
+    }
     float value = (numBytes == 1) ? (float)reinterpret_cast<uint8_t *>(imageVect)[index]
                                   : (float)reinterpret_cast<uint16_t *>(imageVect)[index];
     float result = (value == 0.0) ? NO_DATA : (value - 1.0) * params.scale + params.minVal;
@@ -82,17 +94,38 @@ __device__ float readEncodedPixel(void *imageVect, int index, int numBytes, cons
  * trajectories in the given list. Outputs a results image of best trajectories. Returns a
  * fixed number of results per pixel specified by RESULTS_PER_PIXEL
  * filters results using a sigmaG-based filter and a central-moment filter.
+ *
+ * If activePixels is not null, the kernel is launched over a 1D list of activeCount
+ * starting pixels (given as search space indices) instead of the full search space.
  */
 __global__ void searchFilterImages(int imageCount, int width, int height, void *psiVect, void *phiVect,
                                    perImageData image_data, searchParameters params, int trajectoryCount,
-                                   trajectory *trajectories, trajectory *results) {
+                                   trajectory *trajectories, trajectory *results, int activeCount,
+                                   int *activePixels) {
+    const int search_width = params.x_start_max - params.x_start_min;
+    const int search_height = params.y_start_max - params.y_start_min;
+
+    // The layout of the tiles of the encoded images.
+    const int tile_edge = max(params.encodeTileSize, 1);
+    const int tiles_x = (width + tile_edge - 1) / tile_edge;
+    const int num_tiles = tiles_x * ((height + tile_edge - 1) / tile_edge);
+
     // Get the x and y coordinates within the search space.
-    const int x_i = blockIdx.x * THREAD_DIM_X + threadIdx.x;
-    const int y_i = blockIdx.y * THREAD_DIM_Y + threadIdx.y;
+    int x_i;
+    int y_i;
+    if (activePixels != nullptr) {
+        const int active_index = blockIdx.x * blockDim.x + threadIdx.x;
+        if (active_index >= activeCount) {
+            return;
+        }
+        x_i = activePixels[active_index] % search_width;
+        y_i = activePixels[active_index] / search_width;
+    } else {
+        x_i = blockIdx.x * THREAD_DIM_X + threadIdx.x;
+        y_i = blockIdx.y * THREAD_DIM_Y + threadIdx.y;
+    }
 
     // Check that the x and y coordinates are consistent with the search space.
-    const int search_width = params.x_start_max - params.x_start_min;
-    const int search_height = params.y_start_max - params.y_start_min;
     if ((x_i >= search_width) || (y_i >= search_height)) {
         return;
     }
@@ -118,8 +151,15 @@ __global__ void searchFilterImages(int imageCount, int width, int height, void *
         best[r].lh = -1.0;
     }
 
+    // Each trajectory is searched once for each set of barycentric corrections.
+    const bool use_corr = params.useCorr && (image_data.baryCorrs != nullptr);
+    const int num_bary_sets = use_corr ? image_data.numBaryCorrSets : 1;
+
     // For each trajectory we'd like to search
-    for (int t = 0; t < trajectoryCount; ++t) {
+    for (int s = 0; s < trajectoryCount * num_bary_sets; ++s) {
+        const int t = s % trajectoryCount;
+        const int bary_index = s / trajectoryCount;
+
         // Create a trajectory for this search.
         trajectory currentT;
         currentT.x = x;
@@ -127,6 +167,7 @@ __global__ void searchFilterImages(int imageCount, int width, int height, void *
         currentT.xVel = trajectories[t].xVel;
         currentT.yVel = trajectories[t].yVel;
         currentT.obsCount = 0;
+        currentT.baryIndex = bary_index;
 
         float psiSum = 0.0;
         float phiSum = 0.0;
@@ -149,8 +190,8 @@ __global__ void searchFilterImages(int imageCount, int width, int height, void *
 
             // If using barycentric correction, apply it.
             // Must be before out of bounds check
-            if (params.useCorr && (image_data.baryCorrs != nullptr)) {
-                baryCorrection bc = image_data.baryCorrs[i];
+            if (use_corr) {
+                baryCorrection bc = image_data.baryCorrs[bary_index * imageCount + i];
                 currentX = int(x + currentT.xVel * cTime + bc.dx + x * bc.dxdx + y * bc.dxdy + 0.5);
                 currentY = int(y + currentT.yVel * cTime + bc.dy + x * bc.dydx + y * bc.dydy + 0.5);
             }
@@ -164,16 +205,17 @@ __global__ void searchFilterImages(int imageCount, int width, int height, void *
 
             // Get the Psi and Phi pixel values.
             unsigned int pixel_index = (pixelsPerImage * i + currentY * width + currentX);
+            int tile_index = i * num_tiles + (currentY / tile_edge) * tiles_x + currentX / tile_edge;
             float cPsi = (params.psiNumBytes <= 0 || image_data.psiParams == nullptr)
                                  ? reinterpret_cast<float *>(psiVect)[pixel_index]
                                  : readEncodedPixel(psiVect, pixel_index, params.psiNumBytes,
-                                                    image_data.psiParams[i]);
+                                                    params.encodeHalf, image_data.psiParams[tile_index]);
             if (cPsi == NO_DATA) continue;
 
             float cPhi = (params.phiNumBytes <= 0 || image_data.phiParams == nullptr)
                                  ? reinterpret_cast<float *>(phiVect)[pixel_index]
                                  : readEncodedPixel(phiVect, pixel_index, params.phiNumBytes,
-                                                    image_data.phiParams[i]);
+                                                    params.encodeHalf, image_data.phiParams[tile_index]);
             if (cPhi == NO_DATA) continue;
 
             if (cPsi != NO_DATA && cPhi != NO_DATA) {
@@ -238,85 +280,99 @@ __global__ void searchFilterImages(int imageCount, int width, int height, void *
     }
 }
 
-template <typename T>
-void *encodeImage(float *imageVect, int numTimes, int numPixels, scaleParameters *params, bool debug) {
+void *copyImagesToDevice(void *imageVect, long unsigned int total_size, int numBytes, bool debug) {
     void *deviceVect = NULL;
-
-    long unsigned int total_size = sizeof(T) * numTimes * numPixels;
     if (debug) {
-        printf("Encoding image into %lu bytes/pixel for a total of %lu bytes.\n", sizeof(T), total_size);
+        printf("Copying images with %i bytes/pixel for a total of %lu bytes.\n", numBytes, total_size);
     }
 
-    // Do the encoding locally first.
-    T *encoded = (T *)malloc(total_size);
-    for (int t = 0; t < numTimes; ++t) {
-        float safe_max = params[t].maxVal - params[t].scale / 100.0;
-        for (int p = 0; p < numPixels; ++p) {
-            int index = t * numPixels + p;
-            float value = imageVect[index];
-            if (value == NO_DATA) {
-                encoded[index] = 0;
-            } else {
-                value = min(value, safe_max);
-                value = max(value, params[t].minVal);
-                value = (value - params[t].minVal) / params[t].scale + 1.0;
-                encoded[index] = static_cast<T>(value);
-            }
-        }
-    }
-
-    // Allocate the space on device and do a direct copy.
     checkCudaErrors(cudaMalloc((void **)&deviceVect, total_size));
-    checkCudaErrors(cudaMemcpy(deviceVect, encoded, total_size, cudaMemcpyHostToDevice));
-
-    // Free the local space.
-    free(encoded);
-
+    checkCudaErrors(cudaMemcpy(deviceVect, imageVect, total_size, cudaMemcpyHostToDevice));
     return deviceVect;
 }
 
-void *encodeImageFloat(float *imageVect, unsigned int vectLength, bool debug) {
-    void *deviceVect = NULL;
-    long unsigned int total_size = sizeof(float) * vectLength;
+extern "C" void deviceLoadSearchData(int imageCount, int width, int height, void *psiVect, void *phiVect,
+                                     perImageData img_data, searchParameters params,
+                                     deviceSearchData *data) {
+    // Check the hard coded maximum number of images against the imageCount.
+    if (imageCount > MAX_NUM_IMAGES) {
+        throw std::runtime_error("Number of images exceeds GPU maximum.");
+    }
 
-    if (debug) {
-        printf("Encoding image as float for a total of %lu bytes.\n", total_size);
+    data->numImages = imageCount;
+    data->width = width;
+    data->height = height;
+    data->psiNumBytes = -1;
+    data->phiNumBytes = -1;
+    data->encodeTileSize = params.encodeTileSize;
+    data->encodeHalf = params.encodeHalf;
+
+    if (params.debug) {
+        printf("Allocating %lu bytes for time data.\n", sizeof(float) * imageCount);
     }
+    checkCudaErrors(cudaMalloc((void **)&data->imageTimes, sizeof(float) * imageCount));
 
-    checkCudaErrors(cudaMalloc((void **)&deviceVect, total_size));
-    checkCudaErrors(cudaMemcpy(deviceVect, imageVect, total_size, cudaMemcpyHostToDevice));
-    return deviceVect;
+    // Copy image times
+    checkCudaErrors(cudaMemcpy(data->imageTimes, img_data.imageTimes, sizeof(float) * imageCount,
+                               cudaMemcpyHostToDevice));
+
+    // Copy the (already encoded) images. Also copy over the scaling parameters of
+    // each tile if needed.
+    const long unsigned int num_pixels = (long unsigned int)imageCount * width * height;
+    const int tile_edge = max(params.encodeTileSize, 1);
+    const int num_params =
+            imageCount * ((width + tile_edge - 1) / tile_edge) * ((height + tile_edge - 1) / tile_edge);
+    if ((params.psiNumBytes == 1 || params.psiNumBytes == 2) && (img_data.psiParams != nullptr)) {
+        data->psiNumBytes = params.psiNumBytes;
+        checkCudaErrors(cudaMalloc((void **)&data->psiParams, num_params * sizeof(scaleParameters)));
+        checkCudaErrors(cudaMemcpy(data->psiParams, img_data.psiParams, num_params * sizeof(scaleParameters),
+                                   cudaMemcpyHostToDevice));
+        data->psi = copyImagesToDevice(psiVect, num_pixels * params.psiNumBytes, params.psiNumBytes,
+                                       params.debug);
+    } else {
+        data->psi = copyImagesToDevice(psiVect, num_pixels * sizeof(float), sizeof(float), params.debug);
+    }
+    if ((params.phiNumBytes == 1 || params.phiNumBytes == 2) && (img_data.phiParams != nullptr)) {
+        data->phiNumBytes = params.phiNumBytes;
+        checkCudaErrors(cudaMalloc((void **)&data->phiParams, num_params * sizeof(scaleParameters)));
+        checkCudaErrors(cudaMemcpy(data->phiParams, img_data.phiParams, num_params * sizeof(scaleParameters),
+                                   cudaMemcpyHostToDevice));
+        data->phi = copyImagesToDevice(phiVect, num_pixels * params.phiNumBytes, params.phiNumBytes,
+                                       params.debug);
+    } else {
+        data->phi = copyImagesToDevice(phiVect, num_pixels * sizeof(float), sizeof(float), params.debug);
+    }
+}
+
+extern "C" void deviceFreeSearchData(deviceSearchData *data) {
+    if (data->phiParams != nullptr) checkCudaErrors(cudaFree(data->phiParams));
+    if (data->psiParams != nullptr) checkCudaErrors(cudaFree(data->psiParams));
+    if (data->phi != nullptr) checkCudaErrors(cudaFree(data->phi));
+    if (data->psi != nullptr) checkCudaErrors(cudaFree(data->psi));
+    if (data->imageTimes != nullptr) checkCudaErrors(cudaFree(data->imageTimes));
+    *data = deviceSearchData();
 }
 
-extern "C" void deviceSearchFilter(int imageCount, int width, int height, float *psiVect, float *phiVect,
-                                   perImageData img_data, searchParameters params, int trajCount,
-                                   trajectory *trajectoriesToSearch, int resultsCount,
-                                   trajectory *bestTrajects) {
+extern "C" void deviceSearchLoaded(deviceSearchData data, perImageData img_data, searchParameters params,
+                                   int trajCount, trajectory *trajectoriesToSearch, int resultsCount,
+                                   trajectory *bestTrajects, bool useActiveList, int activeCount,
+                                   int *activePixels) {
     // Allocate Device memory
     trajectory *deviceTests;
-    float *deviceImgTimes;
-    void *devicePsi;
-    void *devicePhi;
     trajectory *deviceSearchResults;
     baryCorrection *deviceBaryCorrs = nullptr;
-    scaleParameters *devicePsiParams = nullptr;
-    scaleParameters *devicePhiParams = nullptr;
 
-    // Check the hard coded maximum number of images against the imageCount.
-    if (imageCount > MAX_NUM_IMAGES) {
-        throw std::runtime_error("Number of images exceeds GPU maximum.");
-    }
+    // The encoding is fixed when the data is loaded.
+    params.psiNumBytes = data.psiNumBytes;
+    params.phiNumBytes = data.phiNumBytes;
+    params.encodeTileSize = data.encodeTileSize;
+    params.encodeHalf = data.encodeHalf;
 
     if (params.debug) {
         printf("Allocating %lu bytes for testing grid.\n", sizeof(trajectory) * trajCount);
     }
     checkCudaErrors(cudaMalloc((void **)&deviceTests, sizeof(trajectory) * trajCount));
 
-    if (params.debug) {
-        printf("Allocating %lu bytes for time data.\n", sizeof(float) * imageCount);
-    }
-    checkCudaErrors(cudaMalloc((void **)&deviceImgTimes, sizeof(float) * imageCount));
-
     if (params.debug) {
         printf("Allocating %lu bytes for testing grid.\n", sizeof(trajectory) * trajCount);
     }
@@ -326,48 +382,15 @@ extern "C" void deviceSearchFilter(int imageCount, int width, int height, float
     checkCudaErrors(cudaMemcpy(deviceTests, trajectoriesToSearch, sizeof(trajectory) * trajCount,
                                cudaMemcpyHostToDevice));
 
-    // Copy image times
-    checkCudaErrors(cudaMemcpy(deviceImgTimes, img_data.imageTimes, sizeof(float) * imageCount,
-                               cudaMemcpyHostToDevice));
-
-    // Copy (and encode) the images. Also copy over the scaling parameters if needed.
-    if ((params.psiNumBytes == 1 || params.psiNumBytes == 2) && (img_data.psiParams != nullptr)) {
-        checkCudaErrors(cudaMalloc((void **)&devicePsiParams, imageCount * sizeof(scaleParameters)));
-        checkCudaErrors(cudaMemcpy(devicePsiParams, img_data.psiParams, imageCount * sizeof(scaleParameters),
-                                   cudaMemcpyHostToDevice));
-        if (params.psiNumBytes == 1) {
-            devicePsi = encodeImage<uint8_t>(psiVect, imageCount, width * height, img_data.psiParams,
-                                             params.debug);
-        } else {
-            devicePsi = encodeImage<uint16_t>(psiVect, imageCount, width * height, img_data.psiParams,
-                                              params.debug);
-        }
-    } else {
-        devicePsi = encodeImageFloat(psiVect, imageCount * width * height, params.debug);
-    }
-    if ((params.phiNumBytes == 1 || params.phiNumBytes == 2) && (img_data.phiParams != nullptr)) {
-        checkCudaErrors(cudaMalloc((void **)&devicePhiParams, imageCount * sizeof(scaleParameters)));
-        checkCudaErrors(cudaMemcpy(devicePhiParams, img_data.phiParams, imageCount * sizeof(scaleParameters),
-                                   cudaMemcpyHostToDevice));
-        if (params.phiNumBytes == 1) {
-            devicePhi = encodeImage<uint8_t>(phiVect, imageCount, width * height, img_data.phiParams,
-                                             params.debug);
-        } else {
-            devicePhi = encodeImage<uint16_t>(phiVect, imageCount, width * height, img_data.phiParams,
-                                              params.debug);
-        }
-    } else {
-        devicePhi = encodeImageFloat(phiVect, imageCount * width * height, params.debug);
-    }
-
     // allocate memory for and copy barycentric corrections
     if (params.useCorr) {
+        const int num_corrs = data.numImages * img_data.numBaryCorrSets;
         if (params.debug) {
-            printf("Search is using barycentric corrections (%lu bytes).\n",
-                   sizeof(baryCorrection) * imageCount);
+            printf("Search is using %i sets of barycentric corrections (%lu bytes).\n",
+                   img_data.numBaryCorrSets, sizeof(baryCorrection) * num_corrs);
         }
-        checkCudaErrors(cudaMalloc((void **)&deviceBaryCorrs, sizeof(baryCorrection) * imageCount));
-        checkCudaErrors(cudaMemcpy(deviceBaryCorrs, img_data.baryCorrs, sizeof(baryCorrection) * imageCount,
+        checkCudaErrors(cudaMalloc((void **)&deviceBaryCorrs, sizeof(baryCorrection) * num_corrs));
+        checkCudaErrors(cudaMemcpy(deviceBaryCorrs, img_data.baryCorrs, sizeof(baryCorrection) * num_corrs,
                                    cudaMemcpyHostToDevice));
     }
 
@@ -375,24 +398,49 @@ extern "C" void deviceSearchFilter(int imageCount, int width, int height, float
     // during the function call, so we don't need to allocate memory for the
     // struct itself. We just set the pointers to the on device vectors.
     perImageData device_image_data;
-    device_image_data.numImages = imageCount;
-    device_image_data.imageTimes = deviceImgTimes;
+    device_image_data.numImages = data.numImages;
+    device_image_data.imageTimes = data.imageTimes;
+    device_image_data.numBaryCorrSets = img_data.numBaryCorrSets;
     device_image_data.baryCorrs = deviceBaryCorrs;
-    device_image_data.psiParams = devicePsiParams;
-    device_image_data.phiParams = devicePhiParams;
-
-    // Compute the range of starting pixels to use when setting the blocks and threads.
-    // We use the width and height of the search space (as opposed to the image width
-    // and height), meaning the blocks/threads will be indexed relative to the search space.
-    int search_width = params.x_start_max - params.x_start_min;
-    int search_height = params.y_start_max - params.y_start_min;
-    dim3 blocks(search_width / THREAD_DIM_X + 1, search_height / THREAD_DIM_Y + 1);
-    dim3 threads(THREAD_DIM_X, THREAD_DIM_Y);
-
-    // Launch Search
-    searchFilterImages<<<blocks, threads>>>(imageCount, width, height, devicePsi, devicePhi,
-                                            device_image_data, params, trajCount, deviceTests,
-                                            deviceSearchResults);
+    device_image_data.psiParams = data.psiParams;
+    device_image_data.phiParams = data.phiParams;
+
+    if (useActiveList) {
+        // Only the active pixels (possibly none) are searched, so the results for the
+        // skipped pixels come from the (prefilled) host vector.
+        int *deviceActivePixels = nullptr;
+        if (params.debug) {
+            printf("Allocating %lu bytes for %i active starting pixels.\n", sizeof(int) * activeCount,
+                   activeCount);
+        }
+        checkCudaErrors(cudaMemcpy(deviceSearchResults, bestTrajects, sizeof(trajectory) * resultsCount,
+                                   cudaMemcpyHostToDevice));
+        if (activeCount > 0) {
+            checkCudaErrors(cudaMalloc((void **)&deviceActivePixels, sizeof(int) * activeCount));
+            checkCudaErrors(cudaMemcpy(deviceActivePixels, activePixels, sizeof(int) * activeCount,
+                                       cudaMemcpyHostToDevice));
+
+            // Launch a 1D search over the list of active pixels.
+            const int threads_per_block = THREAD_DIM_X * THREAD_DIM_Y;
+            searchFilterImages<<<activeCount / threads_per_block + 1, threads_per_block>>>(
+                    data.numImages, data.width, data.height, data.psi, data.phi, device_image_data, params,
+                    trajCount, deviceTests, deviceSearchResults, activeCount, deviceActivePixels);
+            checkCudaErrors(cudaFree(deviceActivePixels));
+        }
+    } else {
+        // Compute the range of starting pixels to use when setting the blocks and threads.
+        // We use the width and height of the search space (as opposed to the image width
+        // and height), meaning the blocks/threads will be indexed relative to the search space.
+        int search_width = params.x_start_max - params.x_start_min;
+        int search_height = params.y_start_max - params.y_start_min;
+        dim3 blocks(search_width / THREAD_DIM_X + 1, search_height / THREAD_DIM_Y + 1);
+        dim3 threads(THREAD_DIM_X, THREAD_DIM_Y);
+
+        // Launch Search
+        searchFilterImages<<<blocks, threads>>>(data.numImages, data.width, data.height, data.psi, data.phi,
+                                                device_image_data, params, trajCount, deviceTests,
+                                                deviceSearchResults, 0, nullptr);
+    }
 
     // Read back results
     checkCudaErrors(cudaMemcpy(bestTrajects, deviceSearchResults, sizeof(trajectory) * resultsCount,
@@ -400,12 +448,7 @@ extern "C" void deviceSearchFilter(int imageCount, int width, int height, float
 
     // Free the on GPU memory.
     if (deviceBaryCorrs != nullptr) checkCudaErrors(cudaFree(deviceBaryCorrs));
-    if (devicePhiParams != nullptr) checkCudaErrors(cudaFree(devicePhiParams));
-    if (devicePsiParams != nullptr) checkCudaErrors(cudaFree(devicePsiParams));
-    checkCudaErrors(cudaFree(devicePhi));
-    checkCudaErrors(cudaFree(devicePsi));
     checkCudaErrors(cudaFree(deviceSearchResults));
-    checkCudaErrors(cudaFree(deviceImgTimes));
     checkCudaErrors(cudaFree(deviceTests));
 }
 
@@ -0,0 +1,279 @@
+"""
+This is a manually run benchmark that times each stage of the KBMOD pipeline
+on synthetic image stacks created with FakeDataSet. The benchmark can be run
+over multiple configurations (image size, number of epochs, search grid size,
+and number of candidates) and writes the timings to a JSON or CSV file, so
+that performance regressions in any stage can be caught by comparing runs.
+
+Example:
+    python benchmark_test.py --width 256 512 --num_times 10 20 --output timings.json
+"""
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+
+from kbmod.analysis_utils import Interface, PostProcess
+from kbmod.configuration import KBMODConfig
+from kbmod.fake_data_creator import FakeDataSet
+from kbmod.result_list import ResultList, ResultRow
+from kbmod.search import *
+
+# The stages in the order they are run.
+STAGES = [
+    "ingestion",
+    "masking",
+    "psi_phi",
+    "search",
+    "retrieval",
+    "sigmaG",
+    "stamp_filter",
+    "clustering",
+    "saving",
+]
+
+
+class StageTimer:
+    """Record the wall clock time of named stages.
+
+    Parameters
+    ----------
+    verbose : bool
+        Show the output of the pipeline functions. Otherwise it is suppressed
+        so it does not interfere with the timings.
+    """
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.timings = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time the code run inside the context as the stage ``name``."""
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            start = time.perf_counter()
+            yield
+            self.timings[name] = time.perf_counter() - start
+
+
+def make_data(data_dir, width, height, num_times, num_objects, flux):
+    """Create a fake data set with random objects and save it to files.
+
+    Parameters
+    ----------
+    data_dir : str
+        The directory in which to save the images.
+    width : int
+        The width of the images in pixels.
+    height : int
+        The height of the images in pixels.
+    num_times : int
+        The number of images.
+    num_objects : int
+        The number of fake objects to insert.
+    flux : float
+        The flux of the fake objects.
+
+    Returns
+    -------
+    time_file : str
+        The name of the file with the image times.
+    """
+    ds = FakeDataSet(width, height, num_times, use_seed=True)
+    for i in range(num_objects):
+        ds.insert_random_object(flux)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ds.save_fake_data(data_dir)
+    time_file = os.path.join(data_dir, "times.dat")
+    ds.save_time_file(time_file)
+    return time_file
+
+
+def run_pipeline(data_dir, time_file, res_dir, params, verbose=False):
+    """Run and time each stage of the pipeline for one configuration.
+
+    Parameters
+    ----------
+    data_dir : str
+        The directory with the images.
+    time_file : str
+        The name of the file with the image times.
+    res_dir : str
+        The directory in which to save the results.
+    params : dict
+        The benchmark parameters.
+    verbose : bool
+        Show the output of the pipeline functions.
+
+    Returns
+    -------
+    timings : dict
+        A dictionary mapping each stage to its run time in seconds.
+    counts : dict
+        A dictionary with the number of results after each filtering stage.
+    """
+    config = KBMODConfig()
+    timer = StageTimer(verbose)
+    counts = {}
+
+    with timer.stage("ingestion"):
+        stack, img_info = Interface().load_images(data_dir, time_file, None, None, psf(config["psf_val"]))
+    mjds = img_info.get_all_mjd()
+    post_process = PostProcess(config, mjds)
+
+    with timer.stage("masking"):
+        stack = post_process.apply_mask(
+            stack,
+            mask_num_images=config["mask_num_images"],
+            mask_threshold=config["mask_threshold"],
+            mask_grow=config["mask_grow"],
+        )
+
+    search = stack_search(stack)
+    with timer.stage("psi_phi"):
+        search.prepare_psi_phi()
+
+    # Search all directions with velocities that can cross the image.
+    max_vel = math.hypot(params["width"], params["height"]) / (mjds[-1] - mjds[0])
+    with timer.stage("search"):
+        search.search(
+            params["grid_size"],
+            params["grid_size"],
+            -math.pi,
+            math.pi,
+            0.0,
+            max_vel,
+            max(params["num_times"] // 2, 1),
+        )
+
+    with timer.stage("retrieval"):
+        keep = ResultList(mjds)
+        for trj in search.get_results(0, params["num_candidates"]):
+            row = ResultRow(trj, len(mjds))
+            row.set_psi_phi(np.array(search.psi_curves(trj)), np.array(search.phi_curves(trj)))
+            keep.append_result(row)
+    counts["retrieval"] = keep.num_results()
+
+    with timer.stage("sigmaG"):
+        post_process.apply_clipped_sigmaG(keep)
+    counts["sigmaG"] = keep.num_results()
+
+    with timer.stage("stamp_filter"):
+        post_process.apply_stamp_filter(
+            keep,
+            search,
+            center_thresh=config["center_thresh"],
+            peak_offset=config["peak_offset"],
+            mom_lims=config["mom_lims"],
+            stamp_type=config["stamp_type"],
+            stamp_radius=config["stamp_radius"],
+        )
+    counts["stamp_filter"] = keep.num_results()
+
+    with timer.stage("clustering"):
+        cluster_params = {
+            "x_size": img_info.get_x_size(),
+            "y_size": img_info.get_y_size(),
+            "vel_lims": [0.0, max_vel],
+            "ang_lims": [-math.pi, math.pi],
+            "mjd": np.array(mjds),
+        }
+        post_process.apply_clustering(keep, cluster_params)
+    counts["clustering"] = keep.num_results()
+
+    with timer.stage("saving"):
+        keep.save_to_files(res_dir, "benchmark")
+
+    return timer.timings, counts
+
+
+def write_results(rows, filename):
+    """Write the benchmark rows to a JSON or CSV file (based on the extension).
+
+    Parameters
+    ----------
+    rows : list of dict
+        The benchmark results, one dictionary per configuration, repeat, and stage.
+    filename : str
+        The name of the output file.
+    """
+    if filename.endswith(".csv"):
+        with open(filename, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        info = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "node": platform.node(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with open(filename, "w") as f:
+            json.dump({"info": info, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    # Parse the command line arguments. Each of the size parameters accepts
+    # multiple values and the benchmark runs every combination.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, nargs="+", default=[256], help="The image width(s).")
+    parser.add_argument("--height", type=int, nargs="+", default=[256], help="The image height(s).")
+    parser.add_argument("--num_times", type=int, nargs="+", default=[20], help="The number(s) of epochs.")
+    parser.add_argument(
+        "--grid_size", type=int, nargs="+", default=[64], help="The number(s) of angle and velocity steps."
+    )
+    parser.add_argument(
+        "--num_candidates", type=int, nargs="+", default=[1000], help="The number(s) of results to filter."
+    )
+    parser.add_argument("--num_objects", type=int, default=10, help="The number of fake objects.")
+    parser.add_argument("--flux", type=float, default=250.0, help="The flux of the fake objects.")
+    parser.add_argument(
+        "--repeats", type=int, default=1, help="The number of times to run each configuration."
+    )
+    parser.add_argument("--output", default="benchmark.json", help="The output file (.json or .csv).")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the pipeline.")
+    args = parser.parse_args()
+
+    rows = []
+    for width, height, num_times, grid_size, num_candidates in itertools.product(
+        args.width, args.height, args.num_times, args.grid_size, args.num_candidates
+    ):
+        params = {
+            "width": width,
+            "height": height,
+            "num_times": num_times,
+            "grid_size": grid_size,
+            "num_candidates": num_candidates,
+        }
+        with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryDirectory() as res_dir:
+            time_file = make_data(data_dir, width, height, num_times, args.num_objects, args.flux)
+            for repeat in range(args.repeats):
+                timings, counts = run_pipeline(data_dir, time_file, res_dir, params, args.verbose)
+                for stage in STAGES:
+                    rows.append(
+                        {
+                            **params,
+                            "repeat": repeat,
+                            "stage": stage,
+                            "seconds": timings[stage],
+                            "num_results": counts.get(stage, ""),
+                        }
+                    )
+
+                summary = ", ".join(f"{stage}={timings[stage]:.3f}s" for stage in STAGES)
+                print(f"{params} repeat={repeat}: {summary}", flush=True)
+
+    write_results(rows, args.output)
+    print(f"Wrote {len(rows)} timings to {args.output}")
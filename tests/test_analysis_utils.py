@@ -487,6 +487,28 @@ class test_analysis_utils(unittest.TestCase):
         self.assertEqual(results.results[0].trajectory.y, 30)
         self.assertEqual(results.results[1].trajectory.y, 40)
 
+    def test_load_and_filter_results_all_above_lh(self):
+        # All the results are above the minimum likelihood (as when they are restored
+        # from a search checkpoint), so the retrieval stops at the end of the results.
+        trjs = [self._make_trajectory(20 + 10 * i, 20 + 10 * i, 0, 0, 100.0 - i) for i in range(4)]
+        imlist = []
+        for i in range(self.img_count):
+            im = layered_image(
+                str(i), 100, 100, self.noise_level, self.variance, self.time_list[i], self.p, i
+            )
+            for trj in trjs:
+                im.add_object(trj.x, trj.y, 100.0)
+            imlist.append(im)
+        search = stack_search(image_stack(imlist))
+        search.set_results(trjs)
+
+        kb_post_process = PostProcess(self.config, self.time_list)
+        for chunk_size in [2, 3, 10]:
+            results = kb_post_process.load_and_filter_results(
+                search, 10.0, chunk_size=chunk_size, max_lh=1000.0
+            )
+            self.assertEqual(results.num_results(), 4)
+
     def test_file_load_basic(self):
         loader = Interface()
         stack, img_info = loader.load_images(
@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from kbmod.batch_runner import *
+from kbmod.configuration import KBMODConfig
+
+
+# The work functions need to be defined at the module level so the worker processes can load them.
+def _fake_work(params):
+    return {"num_results": params["num_obs"], "timings": {"load_images": 0.5, "search": 1.0}}
+
+
+def _fail_once(params):
+    marker = os.path.join(params["res_filepath"], f"{params['output_suffix']}.marker")
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        raise ValueError("First attempt")
+    return {"num_results": 1}
+
+
+def _crash(params):
+    os._exit(3)
+
+
+def _sleep(params):
+    time.sleep(60.0)
+
+
+class test_batch_runner(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.manifest = make_patch_manifest(
+            os.path.join(self.dir.name, "{}_{}"), self.dir.name, [(1, 2), (1, 3), (4, 5)]
+        )
+        self.record_file = os.path.join(self.dir.name, "records.jsonl")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_make_manifest(self):
+        self.assertEqual(len(self.manifest), 3)
+        self.assertEqual(self.manifest[1]["name"], "pg001_ccd03")
+        self.assertEqual(self.manifest[1]["output_suffix"], "pg001_ccd03")
+        self.assertEqual(self.manifest[2]["im_filepath"], os.path.join(self.dir.name, "4_5"))
+
+        filename = os.path.join(self.dir.name, "manifest.jsonl")
+        save_manifest(self.manifest, filename)
+        self.assertEqual(load_manifest(filename), self.manifest)
+
+    def test_run(self):
+        self.manifest[2]["num_obs"] = 4
+        runner = BatchRunner(
+            KBMODConfig(), num_workers=2, record_file=self.record_file, work_function=_fake_work
+        )
+        records = runner.run(self.manifest)
+
+        self.assertEqual([r["name"] for r in records], ["pg001_ccd02", "pg001_ccd03", "pg004_ccd05"])
+        self.assertEqual([r["status"] for r in records], ["success"] * 3)
+        self.assertEqual([r["num_results"] for r in records], [10, 10, 4])
+
+        with open(self.record_file) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        summary = summarize_timings(records)
+        self.assertEqual(summary["search"]["count"], 3)
+        self.assertAlmostEqual(summary["search"]["total"], 3.0)
+        self.assertAlmostEqual(summary["load_images"]["mean"], 0.5)
+        self.assertIn("total", summary)
+
+        # Rerunning skips the completed patches.
+        self.assertEqual(runner.run(self.manifest), [])
+        self.assertEqual(len(runner.run(self.manifest, skip_completed=False)), 3)
+
+    def test_retry(self):
+        runner = BatchRunner({}, max_retries=1, record_file=self.record_file, work_function=_fail_once)
+        records = runner.run(self.manifest[0:2])
+        self.assertEqual([r["status"] for r in records], ["success", "success"])
+        self.assertEqual([r["attempt"] for r in records], [2, 2])
+
+        with open(self.record_file) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0]["status"], "failed")
+        self.assertEqual(lines[0]["error"], "ValueError: First attempt")
+
+    def test_crash(self):
+        runner = BatchRunner({}, max_retries=1, work_function=_crash)
+        records = runner.run(self.manifest[0:1])
+        self.assertEqual(records[0]["status"], "failed")
+        self.assertEqual(records[0]["attempt"], 2)
+        self.assertEqual(records[0]["error"], "Worker exited with code 3.")
+        self.assertEqual(len(runner.records), 2)
+
+    def test_timeout(self):
+        runner = BatchRunner({}, max_retries=0, timeout=0.5, work_function=_sleep)
+        records = runner.run(self.manifest[0:1])
+        self.assertEqual(records[0]["status"], "failed")
+        self.assertLess(records[0]["seconds"], 30.0)
+
+    def test_missing_images(self):
+        # The image directories do not exist, so the search fails while loading.
+        runner = BatchRunner(KBMODConfig(), max_retries=0, max_memory_mb=4096)
+        records = runner.run(self.manifest[0:1])
+        self.assertEqual(records[0]["status"], "failed")
+        self.assertIn("traceback", records[0])
+
+    def test_pipelined_missing_images(self):
+        records = run_pipelined(KBMODConfig(), self.manifest, record_file=self.record_file)
+        self.assertEqual([r["name"] for r in records], ["pg001_ccd02", "pg001_ccd03", "pg004_ccd05"])
+        self.assertEqual([r["status"] for r in records], ["failed"] * 3)
+        with open(self.record_file) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+        self.assertRaises(ValueError, run_pipelined, {}, self.manifest, prefetch=0)
+        self.assertRaises(ValueError, run_pipelined, {}, [{"name": "a"}, {"name": "a"}])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, BatchRunner, {}, num_workers=0)
+        self.assertRaises(ValueError, BatchRunner, {}, max_retries=-1)
+
+        runner = BatchRunner({}, work_function=_fake_work)
+        self.assertRaises(ValueError, runner.run, [{"name": "a"}, {"name": "a"}])
+        self.assertRaises(ValueError, runner.run, [{"im_filepath": "a"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
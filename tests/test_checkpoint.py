@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+
+from kbmod.checkpoint import *
+from kbmod.configuration import KBMODConfig
+from kbmod.result_list import ResultList, ResultRow
+from kbmod.search import *
+
+
+class test_checkpoint(unittest.TestCase):
+    def setUp(self):
+        self.config = KBMODConfig()
+        self.dir = tempfile.TemporaryDirectory()
+        self.config.set("res_filepath", self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _make_checkpoints(self):
+        return PipelineCheckpoints(self.config, self.dir.name, "test")
+
+    def test_trajectory_array(self):
+        trjs = []
+        for i in range(5):
+            trj = trajectory()
+            trj.x = i
+            trj.y = 10 - i
+            trj.x_v = 1.5 * i
+            trj.y_v = -0.5
+            trj.lh = 20.0 - i
+            trj.flux = 100.0 + i
+            trj.obs_count = 8
+            trj.bary_index = i % 2
+            trjs.append(trj)
+
+        arr = trajectories_to_array(trjs)
+        self.assertEqual(len(arr), 5)
+        self.assertEqual(arr["x"][3], 3)
+
+        trjs2 = array_to_trajectories(arr)
+        self.assertEqual(len(trjs2), 5)
+        for trj, trj2 in zip(trjs, trjs2):
+            for name in ["x", "y", "x_v", "y_v", "lh", "flux", "obs_count", "bary_index"]:
+                self.assertAlmostEqual(getattr(trj, name), getattr(trj2, name), places=5)
+
+        self.assertEqual(len(array_to_trajectories(trajectories_to_array([]))), 0)
+
+    def test_save_load(self):
+        checkpoints = self._make_checkpoints()
+        self.assertEqual(checkpoints.find_resume_point(), (None, None))
+        self.assertFalse(checkpoints.completed("search"))
+
+        keep = ResultList([0.0, 1.0, 2.0])
+        keep.append_result(ResultRow(trajectory(), 3))
+        checkpoints.save("search", {"trajectories": [1, 2, 3]})
+        checkpoints.save("retrieve", {"results": keep})
+        self.assertTrue(os.path.exists(checkpoints.filename("retrieve")))
+
+        checkpoints = self._make_checkpoints()
+        stage, data = checkpoints.find_resume_point()
+        self.assertEqual(stage, "retrieve")
+        self.assertEqual(data["results"].num_results(), 1)
+        self.assertTrue(checkpoints.completed("search"))
+        self.assertTrue(checkpoints.completed("retrieve"))
+        self.assertFalse(checkpoints.completed("filter"))
+        self.assertEqual(checkpoints.load("search"), {"trajectories": [1, 2, 3]})
+        self.assertIsNone(checkpoints.load("cluster"))
+
+    def test_invalidation(self):
+        checkpoints = self._make_checkpoints()
+        for stage in CHECKPOINT_STAGES:
+            checkpoints.save(stage, stage)
+
+        # Parameters that do not change the results keep all the checkpoints.
+        self.config.set("debug", True)
+        self.assertEqual(self._make_checkpoints().find_resume_point()[0], "stamps")
+
+        # A clustering parameter invalidates the clustering and later stages.
+        self.config.set("eps", 0.1)
+        checkpoints = self._make_checkpoints()
+        self.assertEqual(checkpoints.find_resume_point()[0], "filter")
+        self.assertIsNone(checkpoints.load("stamps"))
+
+        # A search parameter invalidates everything.
+        self.config.set("eps", 0.03)
+        self.config.set("num_obs", 5)
+        self.assertEqual(self._make_checkpoints().find_resume_point(), (None, None))
+
+    def test_corrupt_checkpoint(self):
+        checkpoints = self._make_checkpoints()
+        checkpoints.save("search", "data")
+        with open(checkpoints.filename("retrieve"), "wb") as f:
+            f.write(b"")
+        self.assertEqual(self._make_checkpoints().find_resume_point(), ("search", "data"))
+
+    def test_disabled(self):
+        checkpoints = PipelineCheckpoints(self.config, None, "test")
+        self.assertFalse(checkpoints.enabled)
+        checkpoints.save("search", "data")
+        self.assertEqual(len(os.listdir(self.dir.name)), 0)
+        self.assertEqual(checkpoints.find_resume_point(), (None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+
+from kbmod.completeness import *
+from kbmod.search import *
+
+
+class test_completeness(unittest.TestCase):
+    def _make_trj(self, x, y, x_v, y_v):
+        trj = trajectory()
+        trj.x = x
+        trj.y = y
+        trj.x_v = x_v
+        trj.y_v = y_v
+        return trj
+
+    def test_make_injection_grid(self):
+        bins = make_injection_grid([100.0, 200.0], [10.0], [0.0, 0.5, 1.0])
+        self.assertEqual(len(bins), 6)
+        self.assertEqual(bins[0], {"flux": 100.0, "velocity": 10.0, "angle": 0.0})
+        self.assertEqual(bins[5], {"flux": 200.0, "velocity": 10.0, "angle": 1.0})
+
+        # Magnitudes are converted to fluxes with the zero point.
+        bins = make_injection_grid([20.0, 22.5], [10.0], [0.0], zero_point=25.0)
+        self.assertEqual(bins[0]["magnitude"], 20.0)
+        self.assertAlmostEqual(bins[0]["flux"], 100.0)
+        self.assertAlmostEqual(bins[1]["flux"], 10.0)
+
+    def test_make_fake_trajectories(self):
+        rng = np.random.default_rng(101)
+        trjs = make_fake_trajectories(200, 150.0, 20.0, 2.5, 100, 80, 2.0, margin=5, rng=rng)
+        self.assertEqual(len(trjs), 200)
+        for trj in trjs:
+            self.assertAlmostEqual(trj.x_v, 20.0 * np.cos(2.5), delta=1e-4)
+            self.assertAlmostEqual(trj.y_v, 20.0 * np.sin(2.5), delta=1e-4)
+            self.assertEqual(trj.flux, 150.0)
+
+            # The start and end points are within the margins.
+            for t in [0.0, 2.0]:
+                self.assertTrue(5 <= trj.x + t * trj.x_v <= 95)
+                self.assertTrue(5 <= trj.y + t * trj.y_v <= 75)
+
+        # The objects cannot stay within the images.
+        self.assertRaises(ValueError, make_fake_trajectories, 1, 100.0, 100.0, 0.0, 100, 80, 2.0)
+
+    def test_match_trajectories(self):
+        times = np.array([0.0, 0.5, 1.0])
+        injected = [
+            self._make_trj(10, 10, 5.0, 0.0),
+            self._make_trj(50, 50, 0.0, -5.0),
+            self._make_trj(80, 20, 2.0, 2.0),
+        ]
+        found = [
+            self._make_trj(50, 51, 0.0, -5.0),
+            self._make_trj(11, 10, 4.0, 0.0),
+            self._make_trj(80, 20, -10.0, -10.0),
+        ]
+
+        matched, dists = match_trajectories(injected, found, times, threshold=2.0, chunk_size=2)
+        self.assertEqual(list(matched), [1, 0, -1])
+        self.assertAlmostEqual(dists[0], 0.5)
+        self.assertAlmostEqual(dists[1], 1.0)
+        self.assertAlmostEqual(dists[2], 12.0 * np.sqrt(2.0) / 2.0)
+
+        # No found trajectories.
+        matched, dists = match_trajectories(injected, [], times)
+        self.assertEqual(list(matched), [-1, -1, -1])
+        self.assertTrue(np.all(np.isinf(dists)))
+
+    def test_invalid_num_per_bin(self):
+        self.assertRaises(ValueError, InjectionRecovery, {}, num_per_bin=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
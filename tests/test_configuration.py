@@ -19,6 +19,12 @@ class test_configuration(unittest.TestCase):
         except ValueError:
             self.fail("validate() raised ValueError.")
 
+        # An unknown timing format is rejected before any search is run.
+        config.set("timing_format", "csv")
+        config.validate()
+        config.set("timing_format", "jsn")
+        self.assertRaises(ValueError, config.validate)
+
     def test_setting(self):
         config = KBMODConfig()
         self.assertIsNone(config["im_filepath"])
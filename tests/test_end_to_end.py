@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 
 import numpy as np
@@ -72,6 +74,116 @@ class test_end_to_end(unittest.TestCase):
         for s in keep.results[0].all_stamps:
             self.assertEqual(s.size, 961)
 
+    def test_demo_sweep(self):
+        rs = run_search(self.input_parameters)
+        results = rs.run_search_sweep(
+            [
+                {},
+                {"num_obs": 8},
+                {"v_arr": [0, 5, 6]},
+            ]
+        )
+        self.assertEqual(len(results), 3)
+
+        # The first search matches a single search with the same parameters.
+        keep = run_search(self.input_parameters).run_search()
+        self.assertEqual(results[0].num_results(), keep.num_results())
+        for i in range(keep.num_results()):
+            self.assertEqual(results[0].results[i].trajectory.x, keep.results[i].trajectory.x)
+            self.assertEqual(results[0].results[i].trajectory.y, keep.results[i].trajectory.y)
+
+        # The object (x_v=10) is found with a higher threshold, but not when
+        # the maximum velocity is too low.
+        self.assertGreaterEqual(results[1].num_results(), 1)
+        for row in results[2].results:
+            self.assertLessEqual(row.trajectory.x_v, 5.0 + 1e-5)
+
+        # The configuration is restored after the sweep.
+        self.assertEqual(rs.config["num_obs"], 7)
+        self.assertEqual(rs.config["v_arr"], [0, 20, 21])
+
+    def test_demo_checkpoint(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            self.input_parameters["res_filepath"] = dir_name
+            self.input_parameters["checkpoint"] = True
+            run_search(self.input_parameters).run_search()
+            for stage in ["search", "retrieve", "filter", "cluster", "stamps"]:
+                self.assertTrue(os.path.exists(os.path.join(dir_name, f"checkpoint_{stage}_DEMO.pkl")))
+
+            # Changing the clustering only reruns the stages from the clustering on.
+            self.input_parameters["eps"] = 0.04
+            rs = run_search(self.input_parameters)
+            keep2 = rs.run_search()
+            self.assertNotIn("search", [s.name for s in rs.instrumentation.spans])
+            self.assertIn("clustering", [s.name for s in rs.instrumentation.spans])
+
+            # Rerunning with the same parameters loads the final results.
+            rs = run_search(self.input_parameters)
+            keep3 = rs.run_search()
+            self.assertNotIn("clustering", [s.name for s in rs.instrumentation.spans])
+
+            self.assertEqual(keep3.num_results(), keep2.num_results())
+            for i in range(keep2.num_results()):
+                self.assertEqual(keep3.results[i].trajectory.x, keep2.results[i].trajectory.x)
+                self.assertTrue(np.allclose(keep3.results[i].stamp, keep2.results[i].stamp))
+
+    def test_demo_checkpoint_resume_search(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            self.input_parameters["res_filepath"] = dir_name
+            self.input_parameters["checkpoint"] = True
+            keep1 = run_search(self.input_parameters).run_search()
+
+            # Changing a retrieval parameter resumes from the saved search results.
+            self.input_parameters["chunk_size"] = 500
+            rs = run_search(self.input_parameters)
+            keep2 = rs.run_search()
+            span_names = [s.name for s in rs.instrumentation.spans]
+            self.assertNotIn("search", span_names)
+            self.assertIn("load_and_filter", span_names)
+
+            self.assertEqual(keep2.num_results(), keep1.num_results())
+            for i in range(keep1.num_results()):
+                self.assertEqual(keep2.results[i].trajectory.x, keep1.results[i].trajectory.x)
+                self.assertEqual(keep2.results[i].trajectory.y, keep1.results[i].trajectory.y)
+
+    def test_demo_pipelined(self):
+        from kbmod.batch_runner import run_pipelined
+
+        with tempfile.TemporaryDirectory() as dir_name:
+            self.input_parameters["res_filepath"] = dir_name
+            manifest = [{"name": f"patch{i}", "output_suffix": f"patch{i}"} for i in range(3)]
+            records = run_pipelined(self.input_parameters, manifest, prepare_psi_phi=True)
+            self.assertEqual([r["status"] for r in records], ["success"] * 3)
+
+            keep = run_search(self.input_parameters).run_search(save=False)
+            for i in range(3):
+                self.assertEqual(records[i]["num_results"], keep.num_results())
+                self.assertTrue(os.path.exists(os.path.join(dir_name, f"results_patch{i}.txt")))
+
+    def test_demo_search_region(self):
+        self.input_parameters["x_pixel_bounds"] = [90, 120]
+        self.input_parameters["y_pixel_bounds"] = [30, 60]
+        keep = run_search(self.input_parameters).run_search()
+
+        # Only reading the reachable region gives the same results in the
+        # coordinates of the full images.
+        self.input_parameters["load_search_region"] = True
+        rs = run_search(self.input_parameters)
+        keep2 = rs.run_search()
+        self.assertGreater(rs.pixel_offset[0], 0)
+        self.assertGreater(rs.pixel_offset[1], 0)
+
+        self.assertGreaterEqual(keep2.num_results(), 1)
+        self.assertEqual(keep2.num_results(), keep.num_results())
+        for i in range(keep.num_results()):
+            self.assertEqual(keep2.results[i].trajectory.x, keep.results[i].trajectory.x)
+            self.assertEqual(keep2.results[i].trajectory.y, keep.results[i].trajectory.y)
+            self.assertAlmostEqual(keep2.results[i].trajectory.lh, keep.results[i].trajectory.lh, delta=1e-3)
+
+    def test_sweep_invalid_param(self):
+        rs = run_search(self.input_parameters)
+        self.assertRaises(ValueError, rs.run_search_sweep, [{"num_obs": 8}, {"do_mask": False}])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+
+import astropy.units as u
+import numpy as np
+
+from kbmod.analysis.ephemeris import *
+from kbmod.analysis.ephemeris import _C_AU_YR, _GM_BARY, _OBLIQUITY
+
+
+class test_ephemeris(unittest.TestCase):
+    def setUp(self):
+        # A circular orbit in the ecliptic plane starting on the x axis.
+        self.radius = 40.0
+        self.mean_motion = np.sqrt(_GM_BARY / self.radius**3)
+        self.state = np.array([self.radius, 0.0, 0.0, 0.0, self.radius * self.mean_motion, 0.0])
+
+    def test_propagate_circular(self):
+        dt = np.array([-10.0, -0.5, 0.0, 0.25, 3.0, 100.0])
+        pos = propagate_orbits(self.state, dt)
+        self.assertEqual(pos.shape, (len(dt), 3))
+
+        angle = self.mean_motion * dt
+        expected = self.radius * np.stack([np.cos(angle), np.sin(angle), np.zeros(len(dt))], axis=1)
+        self.assertTrue(np.allclose(pos, expected, atol=1e-9))
+
+    def test_propagate_many_orbits(self):
+        # An eccentric and a hyperbolic orbit propagated together keep their
+        # energy and angular momentum.
+        states = np.array([[30.0, 5.0, 1.0, 0.1, 0.9, 0.05], [2.0, 0.0, 0.0, 0.0, 8.0, 1.0]])
+        dt = np.linspace(-2.0, 2.0, 5)
+        pos = propagate_orbits(states[:, None, :], dt)
+        self.assertEqual(pos.shape, (2, 5, 3))
+
+        # Recover the velocities by a central difference.
+        eps = 1e-5
+        vel = (
+            propagate_orbits(states[:, None, :], dt + eps) - propagate_orbits(states[:, None, :], dt - eps)
+        ) / (2.0 * eps)
+        for i in range(2):
+            r0 = states[i, 0:3]
+            v0 = states[i, 3:6]
+            energy = 0.5 * np.dot(v0, v0) - _GM_BARY / np.linalg.norm(r0)
+            momentum = np.cross(r0, v0)
+            for t in range(len(dt)):
+                r = pos[i, t]
+                v = vel[i, t]
+                self.assertAlmostEqual(0.5 * np.dot(v, v) - _GM_BARY / np.linalg.norm(r), energy, delta=1e-4)
+                self.assertTrue(np.allclose(np.cross(r, v), momentum, atol=1e-4))
+
+        # The middle time step is the starting position.
+        self.assertTrue(np.allclose(pos[:, 2, :], states[:, 0:3], atol=1e-12))
+
+    def test_predict_radec_light_time(self):
+        jd0 = 2460000.5
+        dates = jd0 - 2400000.5 + np.array([0.0, 30.0, 200.0])
+        obs_pos = np.zeros((len(dates), 3))
+        ra, dec = predict_radec(self.state, jd0, dates, obs_pos)
+        self.assertEqual(ra.shape, (len(dates),))
+
+        # The object is seen where it was one light travel time earlier.
+        dt = (dates + 2400000.5 - jd0) / 365.25
+        angle = self.mean_motion * (dt - self.radius / _C_AU_YR)
+        x = np.cos(angle)
+        y = np.sin(angle) * np.cos(_OBLIQUITY)
+        z = np.sin(angle) * np.sin(_OBLIQUITY)
+        expected_ra = np.degrees(np.arctan2(y, x)) % 360.0
+        expected_dec = np.degrees(np.arctan2(z, np.sqrt(x * x + y * y)))
+        self.assertTrue(np.allclose(ra, expected_ra, atol=1e-3 / 3600.0))
+        self.assertTrue(np.allclose(dec, expected_dec, atol=1e-3 / 3600.0))
+
+        # The light travel time moves the object by a few arcseconds.
+        ra_no_lt = np.degrees(
+            np.arctan2(np.sin(self.mean_motion * dt) * np.cos(_OBLIQUITY), np.cos(self.mean_motion * dt))
+        )
+        self.assertGreater(np.abs(ra_no_lt[0] - ra[0]) * 3600.0, 1.0)
+
+        # Many orbits at once.
+        ra2, dec2 = predict_radec(np.stack([self.state, self.state]), jd0, dates, obs_pos)
+        self.assertEqual(ra2.shape, (2, len(dates)))
+        self.assertTrue(np.allclose(ra2[1], ra))
+
+    def test_observer_positions(self):
+        clear_observer_cache()
+        dates = np.array([60000.0, 60010.0, 60020.0])
+        geo = observer_positions(dates)
+        self.assertEqual(geo.shape, (3, 3))
+        self.assertTrue(np.all(np.abs(np.linalg.norm(geo, axis=1) - 1.0) < 0.03))
+
+        # The positions are cached.
+        self.assertIs(observer_positions(dates), geo)
+        self.assertFalse(geo.flags.writeable)
+
+        # A site on the Earth is offset from the geocenter by about one Earth radius.
+        ctio = mpc_observatory_location("807")
+        topo = observer_positions(dates, ctio)
+        offset = np.linalg.norm(topo - geo, axis=1) * u.au.to(u.km)
+        self.assertTrue(np.all(np.abs(offset - 6375.0) < 30.0))
+
+        clear_observer_cache()
+        self.assertIsNot(observer_positions(dates), geo)
+
+    def test_mpc_observatory_location(self):
+        ctio = mpc_observatory_location("807")
+        self.assertAlmostEqual(ctio.lon.deg, -70.806, delta=0.01)
+        self.assertAlmostEqual(ctio.lat.deg, -30.17, delta=0.05)
+        self.assertIsNone(mpc_observatory_location("500"))
+        self.assertRaises(ValueError, mpc_observatory_location, "XXX")
+
+
+if __name__ == "__main__":
+    unittest.main()
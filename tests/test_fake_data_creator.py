@@ -1,6 +1,8 @@
 import tempfile
 import unittest
 
+import numpy as np
+
 from kbmod.fake_data_creator import *
 from kbmod.file_utils import *
 from kbmod.search import *
@@ -47,6 +49,59 @@ class test_fake_image_creator(unittest.TestCase):
             pix_val = ds.stack.get_single_image(i).get_science().get_pixel(px, py)
             self.assertGreaterEqual(pix_val, 50.0)
 
+    def test_insert_objects(self):
+        ds = FakeDataSet(64, 64, 6, use_seed=True)
+        ds2 = FakeDataSet(64, 64, 6, use_seed=True)
+
+        trjs = []
+        for i in range(20):
+            trj = trajectory()
+            trj.x = 5 + 2 * i
+            trj.y = 10 + i
+            trj.x_v = 1.5
+            trj.y_v = -0.5 * (i % 3)
+            trj.flux = 100.0 + i
+            trjs.append(trj)
+        ds.insert_objects(trjs)
+        self.assertEqual(len(ds.trajectories), 20)
+
+        # The bulk insertion matches adding the objects to each image one at a time.
+        times = ds2.stack.get_times()
+        for i in range(ds2.stack.img_count()):
+            img = ds2.stack.get_single_image(i)
+            for trj in trjs:
+                img.add_object(trj.x + times[i] * trj.x_v + 0.5, trj.y + times[i] * trj.y_v + 0.5, trj.flux)
+            self.assertTrue(
+                np.allclose(
+                    np.array(ds.stack.get_single_image(i).get_science()),
+                    np.array(img.get_science()),
+                    atol=1e-3,
+                )
+            )
+
+        # Barycentric corrections shift the objects.
+        ds3 = FakeDataSet(64, 64, 6, use_seed=True)
+        corrs = []
+        for i in range(ds3.stack.img_count()):
+            bc = baryCorrection()
+            bc.dx = 2.0
+            bc.dxdx = 0.0
+            bc.dxdy = 0.0
+            bc.dy = 3.0
+            bc.dydx = 0.0
+            bc.dydy = 0.0
+            corrs.append(bc)
+        ds3.insert_objects([trjs[0]], corrs)
+        for i in range(ds3.stack.img_count()):
+            px = int(trjs[0].x + times[i] * trjs[0].x_v + 2.5)
+            py = int(trjs[0].y + times[i] * trjs[0].y_v + 3.5)
+            self.assertGreater(ds3.stack.get_single_image(i).get_science().get_pixel(px, py), 20.0)
+
+        # The barycentric index must be valid.
+        trjs[0].bary_index = 1
+        self.assertRaises(RuntimeError, ds3.insert_objects, [trjs[0]], corrs)
+        self.assertRaises(RuntimeError, ds3.insert_objects, [trjs[1]], corrs[0:5])
+
     def test_save_and_clean(self):
         num_images = 7
         ds = FakeDataSet(64, 64, num_images)
@@ -3,6 +3,7 @@ import tempfile
 import unittest
 
 import astropy.units as u
+import numpy as np
 from astropy.coordinates import *
 from astropy.time import Time
 
@@ -135,12 +136,25 @@ class test_file_utils(unittest.TestCase):
         self.assertAlmostEqual(trj_results[1].flux, 500.0, delta=1e-6)
         self.assertEqual(trj_results[1].obs_count, 9)
 
+    def test_load_results_array(self):
+        results = FileUtils.load_results_file_as_array("./data/fake_results.txt")
+        self.assertEqual(results.dtype, trajectory_dtype)
+        self.assertEqual(list(results["x"]), [106, 55])
+        self.assertEqual(list(results["y"]), [44, 60])
+        self.assertEqual(list(results["obs_count"]), [10, 9])
+        self.assertTrue(np.allclose(results["x_v"], [9.52, 10.5]))
+        self.assertTrue(np.allclose(results["lh"], [300.0, 250.0]))
+
+        # The file predates the bary_index column.
+        self.assertEqual(list(results["bary_index"]), [0, 0])
+
     def test_save_and_load_single_result(self):
         trj = trajectory()
         trj.x = 1
         trj.y = 2
         trj.x_v = 3.0
         trj.y_v = 4.0
+        trj.bary_index = 2
 
         with tempfile.TemporaryDirectory() as dir_name:
             filename = f"{dir_name}/results_tmp.txt"
@@ -152,6 +166,7 @@ class test_file_utils(unittest.TestCase):
             self.assertEqual(loaded_trjs[0].y, trj.y)
             self.assertEqual(loaded_trjs[0].x_v, trj.x_v)
             self.assertEqual(loaded_trjs[0].y_v, trj.y_v)
+            self.assertEqual(loaded_trjs[0].bary_index, 2)
 
     def test_load_mpc(self):
         coords, obs_times = FileUtils.mpc_reader("./data/mpcs.txt")
@@ -224,6 +239,42 @@ class test_file_utils(unittest.TestCase):
                 self.assertAlmostEqual(coords[i].dec.degree, res2[i].dec.degree, delta=1e-4)
                 self.assertAlmostEqual(times[i].mjd, times2[i].mjd, delta=1e-4)
 
+    def test_format_mpc_batch(self):
+        ra = [281.4485, 352.42725, 26.305, 14.99999999, 359.9999999]
+        dec = [-24.45564, -0.45564, 8.122611, 10.99999999, -0.0000001]
+        mjd = [52034.035, 49737.700, 53653.280, 52000.999999999, 52000.0]
+        res = FileUtils.format_results_mpc(ra, dec, mjd)
+        expected = [
+            "     c111112  c2001 05 05.03500 18 45 47.640-24 27 20.30                     X05",
+            "     c111112  c1995 01 20.70000 23 29 42.540-00 27 20.30                     X05",
+            "     c111112  c2005 10 10.28000 01 45 13.200+08 07 21.40                     X05",
+            # The time, RA, and Dec round up into the next day, hour, and degree.
+            "     c111112  c2001 04 02.00000 01 00 00.000+11 00 00.00                     X05",
+            "     c111112  c2001 04 01.00000 00 00 00.000-00 00 00.00                     X05",
+        ]
+        self.assertEqual(res, expected)
+
+        res = FileUtils.format_results_mpc(ra[0:1], dec[0:1], mjd[0:1], observatory="001")
+        self.assertEqual(res, [expected[0][:-3] + "001"])
+        self.assertRaises(ValueError, FileUtils.format_results_mpc, ra, dec, mjd[0:3])
+
+    def test_save_radec_mpc(self):
+        # Three objects observed at four shared times.
+        mjd = np.array([57130.2, 57130.3, 57131.25, 57133.0])
+        ra = np.array([[10.0, 10.01, 10.02, 10.03], [200.5, 200.4, 200.3, 200.2], [359.99, 0.0, 0.01, 0.02]])
+        dec = np.array([[-0.01, 0.0, 0.01, 0.02], [45.0, 45.1, 45.2, 45.3], [-30.0, -30.1, -30.2, -30.3]])
+
+        with tempfile.TemporaryDirectory() as dir_name:
+            file_out = os.path.join(dir_name, "fake_mpc.txt")
+            FileUtils.save_radec_mpc(file_out, ra, dec, mjd, chunk_size=5)
+
+            coords, times = FileUtils.mpc_reader(file_out)
+            self.assertEqual(len(coords), 12)
+            self.assertTrue(np.allclose(coords.dec.degree, dec.ravel(), atol=1e-4))
+            ra_diff = np.mod(coords.ra.degree - ra.ravel() + 180.0, 360.0) - 180.0
+            self.assertTrue(np.allclose(ra_diff, 0.0, atol=1e-4))
+            self.assertTrue(np.allclose(times.mjd, np.tile(mjd, 3), atol=1e-4))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -153,6 +153,53 @@ class test_image_info(unittest.TestCase):
             self.assertAlmostEqual(sky_pos_mult[1].ra.degree, 201.624)
             self.assertAlmostEqual(sky_pos_mult[1].dec.degree, -10.768)
 
+    def test_trajectories_to_radec(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            fnames = ["%s/tmp%i.fits" % (dir_name, i) for i in range(3)]
+            for i, fname in enumerate(fnames):
+                create_fake_fits_file(fname, 20, 30, id_str=str(i))
+            img_info = ImageInfoSet()
+            img_info.load_image_info_from_files(fnames)
+            img_info.set_times_mjd([59805.25, 59806.25, 59807.75])
+
+            trjs = []
+            for i in range(4):
+                trj = trajectory()
+                trj.x = i
+                trj.y = 2 * i
+                trj.x_v = 1.5 * i
+                trj.y_v = -0.5
+                trjs.append(trj)
+
+            # The batch computation matches the per-trajectory one.
+            ra, dec = img_info.trajectories_to_radec(trjs)
+            self.assertEqual(ra.shape, (4, 3))
+            for i, trj in enumerate(trjs):
+                coords = img_info.trajectory_to_skycoords(trj)
+                for j in range(3):
+                    self.assertAlmostEqual(ra[i, j], coords[j].ra.degree)
+                    self.assertAlmostEqual(dec[i, j], coords[j].dec.degree)
+
+            # The positions include the barycentric correction selected by bary_index.
+            bary_corr = np.zeros((2, 3, 6))
+            bary_corr[1, :, 0] = [0.0, 1.0, 2.0]
+            bary_corr[1, :, 4] = 0.5
+            trjs[2].bary_index = 1
+            x, y = img_info.trajectories_to_pixels(trjs, bary_corr.flatten())
+            self.assertTrue(np.allclose(x[2], [2.0, 6.0, 11.5]))
+            self.assertTrue(np.allclose(y[2], [5.0, 4.5, 3.75]))
+            self.assertTrue(np.allclose(x[1], [1.0, 2.5, 4.75]))
+
+            # Structured arrays can be used instead of trajectory objects.
+            arr = np.zeros(
+                4, dtype=[("x", int), ("y", int), ("x_v", float), ("y_v", float), ("bary_index", int)]
+            )
+            for name in ["x", "y", "x_v", "y_v", "bary_index"]:
+                arr[name] = [getattr(t, name) for t in trjs]
+            x2, y2 = img_info.trajectories_to_pixels(arr, bary_corr.flatten())
+            self.assertTrue(np.allclose(x, x2))
+            self.assertTrue(np.allclose(y, y2))
+
     def test_load_files_with_time(self):
         with tempfile.TemporaryDirectory() as dir_name:
             os.mkdir(f"{dir_name}/data")
@@ -195,6 +195,22 @@ class test_image_stack(unittest.TestCase):
             self.assertGreater(pix_val, last_val)
             last_val = pix_val
 
+    def test_add_objects_masked(self):
+        self.im_stack.apply_mask_flags(1, [])
+        sci = self.im_stack.get_single_image(2).get_science()
+        self.assertEqual(sci.get_pixel(10, 12), KB_NO_DATA)
+
+        # Inject a stationary object over the masked pixel at time step 2.
+        trj = trajectory()
+        trj.x = 10
+        trj.y = 12
+        trj.flux = 500.0
+        self.im_stack.add_objects([trj])
+
+        sci = self.im_stack.get_single_image(2).get_science()
+        self.assertEqual(sci.get_pixel(10, 12), KB_NO_DATA)
+        self.assertGreater(sci.get_pixel(11, 12), 0.0)
+
     def test_simple_shift_and_stack(self):
         width = 30
         height = 40
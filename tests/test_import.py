@@ -0,0 +1,56 @@
+import subprocess
+import sys
+import unittest
+
+# Large libraries that should only be loaded when the code using them runs.
+HEAVY_MODULES = ["koffi", "matplotlib", "pandas", "scipy", "sklearn"]
+
+
+def _loaded_modules(statement):
+    """Run an import statement in a fresh interpreter and return the top-level
+    names of all the modules that it loaded.
+
+    Parameters
+    ----------
+    statement : str
+        The import statement to run.
+
+    Returns
+    -------
+    modules : set
+        The top-level module names.
+    """
+    code = f"import sys\n{statement}\nprint(' '.join(sorted(set(m.split('.')[0] for m in sys.modules))))"
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True, check=True
+    )
+    return set(output.stdout.split())
+
+
+class test_import(unittest.TestCase):
+    def test_import_kbmod(self):
+        loaded = _loaded_modules("import kbmod")
+        for name in HEAVY_MODULES + ["astropy"]:
+            self.assertNotIn(name, loaded)
+
+    def test_import_search(self):
+        loaded = _loaded_modules("import kbmod.search")
+        for name in HEAVY_MODULES + ["astropy"]:
+            self.assertNotIn(name, loaded)
+
+    def test_import_pipeline(self):
+        loaded = _loaded_modules("import kbmod.run_search")
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, loaded)
+
+    def test_lazy_submodules(self):
+        import kbmod
+
+        self.assertTrue(hasattr(kbmod.result_list, "ResultList"))
+        self.assertTrue(hasattr(kbmod.filters, "stats_filters"))
+        self.assertIn("run_search", dir(kbmod))
+        self.assertRaises(AttributeError, getattr, kbmod, "not_a_module")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+
+from kbmod.instrumentation import *
+
+
+class FakeSearch:
+    """A stand in for the C++ search object's timing functions."""
+
+    def __init__(self, timings):
+        self.timings = timings
+
+    def get_timings(self):
+        return self.timings
+
+    def clear_timings(self):
+        self.timings = []
+
+
+class test_instrumentation(unittest.TestCase):
+    def test_nested_spans(self):
+        inst = Instrumentation()
+        with inst.span("outer", num_images=5) as outer:
+            with inst.span("inner") as inner:
+                inner.set_count("in", 10)
+                inner.set_count("out", 4)
+        with inst.span("last"):
+            pass
+
+        self.assertEqual([s.name for s in inst.spans], ["outer", "inner", "last"])
+        self.assertEqual([s.path for s in inst.spans], ["outer", "outer/inner", "last"])
+        self.assertEqual([s.depth for s in inst.spans], [0, 1, 0])
+        self.assertEqual(outer.counts, {"num_images": 5})
+        self.assertEqual(inner.counts, {"in": 10, "out": 4})
+
+        for s in inst.spans:
+            self.assertGreaterEqual(s.duration, 0.0)
+            self.assertGreater(s.peak_rss_mb, 0.0)
+            self.assertGreaterEqual(s.peak_rss_increase_mb, 0.0)
+        self.assertLessEqual(inner.start + inner.duration, outer.start + outer.duration)
+        self.assertGreaterEqual(inst.spans[2].start, outer.start + outer.duration)
+
+    def test_span_exception(self):
+        inst = Instrumentation()
+        with self.assertRaises(RuntimeError):
+            with inst.span("fails"):
+                raise RuntimeError("error")
+
+        # The span is closed and the next span is at the top level.
+        self.assertIsNotNone(inst.spans[0].duration)
+        with inst.span("next"):
+            pass
+        self.assertEqual(inst.spans[1].depth, 0)
+
+    def test_callback(self):
+        finished = []
+        inst = Instrumentation(callback=lambda s: finished.append(s.path))
+        with inst.span("a"):
+            with inst.span("b"):
+                pass
+        self.assertEqual(finished, ["a/b", "a"])
+
+    def test_search_timings(self):
+        search = FakeSearch([("Creating psi/phi", 0.5), ("Searching", 2.0)])
+        inst = Instrumentation()
+        with inst.span("search"):
+            inst.add_search_timings(search)
+
+        self.assertEqual(len(inst.spans), 3)
+        self.assertEqual(inst.spans[1].path, "search/Creating psi/phi")
+        self.assertEqual(inst.spans[1].source, "c++")
+        self.assertEqual(inst.spans[1].depth, 1)
+        self.assertEqual(inst.spans[2].duration, 2.0)
+        self.assertEqual(search.get_timings(), [])
+
+    def test_save(self):
+        inst = Instrumentation()
+        with inst.span("load"):
+            pass
+        with inst.span("filter", **{"in": 10}) as span:
+            span.set_count("out", 3)
+
+        with tempfile.TemporaryDirectory() as dir_name:
+            filename = os.path.join(dir_name, "timing.json")
+            inst.save(filename)
+            with open(filename) as f:
+                records = json.load(f)
+            self.assertEqual(records, inst.to_records())
+            self.assertEqual(records[1]["counts"], {"in": 10, "out": 3})
+
+            filename = os.path.join(dir_name, "timing.csv")
+            inst.save(filename)
+            with open(filename, newline="") as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual(len(rows), 2)
+            self.assertEqual(rows[0]["name"], "load")
+            self.assertEqual(rows[0]["count_in"], "")
+            self.assertEqual(rows[1]["count_in"], "10")
+            self.assertEqual(rows[1]["count_out"], "3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+
+import numpy as np
+
+from kbmod.jointfit_functions import JointFit, _fit_inputs, fit_result_list
+from kbmod.result_list import ResultList, ResultRow
+from kbmod.search import trajectory
+
+
+class test_jointfit_functions(unittest.TestCase):
+    def setUp(self):
+        self.num_times = 8
+        self.width = 21
+        ys, xs = np.mgrid[0 : self.width, 0 : self.width]
+
+        def gaussian(cx, cy):
+            """A normalized Gaussian PSF centered at (cx, cy)."""
+            psf = np.exp(-((xs - cx) ** 2 + (ys - cy) ** 2) / 4.5)
+            return psf / np.sum(psf)
+
+        # An object that moves across the stamps, which are centered near its path.
+        self.dates = np.linspace(57000.0, 57000.5, self.num_times)
+        self.stamp_pos = np.stack(
+            [100.0 + 0.3 * np.arange(self.num_times), 200.0 - 0.2 * np.arange(self.num_times)], 1
+        )
+        self.true_traj = self.stamp_pos + [0.4, -0.3]
+
+        rng = np.random.default_rng(100)
+        stamps = np.array([500.0 * gaussian(10.4, 9.7) for i in range(self.num_times)])
+        stamps += rng.normal(0.0, 0.3, stamps.shape)
+        psfs = np.array([gaussian(10.0, 10.0) for i in range(self.num_times)])
+        variances = np.full(stamps.shape, 0.09)
+
+        self.psfs = psfs
+        self.gaussian = gaussian
+        self.fit = JointFit(
+            stamps, variances, self.dates, None, self.stamp_pos, psfs, None, ephemeris=([], [])
+        )
+
+    def test_model_images_fft(self):
+        traj = self.true_traj + 0.1
+        self.assertTrue(np.allclose(self.fit.model_images_fft(traj), self.fit.model_images(traj), atol=1e-3))
+        self.assertTrue(
+            np.allclose(
+                self.fit.model_images_fft(traj, True), self.fit.model_images_streaked(traj), atol=1e-3
+            )
+        )
+
+    def test_negloglike_gradient(self):
+        traj = self.true_traj + 0.1
+        step = 1e-5
+        for streaked in [False, True]:
+            logL, grad = self.fit.negloglike_traj(traj, streaked)
+            self.assertEqual(grad.shape, (self.num_times, 2))
+            for i in range(self.num_times):
+                for d in range(2):
+                    traj_p = np.copy(traj)
+                    traj_p[i, d] += step
+                    traj_m = np.copy(traj)
+                    traj_m[i, d] -= step
+                    diff = (
+                        self.fit.negloglike_traj(traj_p, streaked)[0]
+                        - self.fit.negloglike_traj(traj_m, streaked)[0]
+                    )
+                    self.assertAlmostEqual(
+                        grad[i, d], diff / (2 * step), delta=1e-3 * (1.0 + abs(grad[i, d]))
+                    )
+
+    def test_fit_topo_start_end(self):
+        from scipy.optimize import minimize
+
+        x0 = np.concatenate([self.true_traj[0] + 0.2, self.true_traj[-1] - 0.2])
+        logL, grad = self.fit.negloglike_topo_start_end_grad(x0)
+        self.assertEqual(grad.shape, (4,))
+        self.assertAlmostEqual(logL, self.fit.negloglike_topo_start_end(x0), delta=0.01 * logL)
+
+        res = minimize(self.fit.negloglike_topo_start_end_grad, x0, jac=True)
+        expected = np.concatenate([self.true_traj[0], self.true_traj[-1]])
+        self.assertTrue(np.allclose(res.x, expected, atol=0.05))
+
+    def test_fit_result_list(self):
+        rng = np.random.default_rng(101)
+        results = ResultList(self.dates)
+        offsets = rng.uniform(-0.5, 0.5, (6, 2))
+        for i in range(6):
+            trj = trajectory()
+            trj.x = 100 + 10 * i
+            trj.y = 50
+            trj.x_v = 2.0
+            trj.y_v = -1.0
+            row = ResultRow(trj, self.num_times)
+            row.all_stamps = np.array(
+                [300.0 * self.gaussian(10.0 + offsets[i, 0], 10.0 + offsets[i, 1])] * self.num_times
+            )
+            row.all_stamps += rng.normal(0.0, 0.3, row.all_stamps.shape)
+            results.append_result(row)
+
+        variances = np.full((self.num_times, 1, 1), 0.09)
+        serial = fit_result_list(results, self.psfs, variances, chunk_size=4)
+        self.assertEqual(len(serial), 6)
+        self.assertEqual(list(serial["index"]), list(range(6)))
+        self.assertTrue(np.allclose(serial["x1"], 100 + 10 * np.arange(6) + offsets[:, 0], atol=0.05))
+        self.assertTrue(np.allclose(serial["y2"], 49.5 + offsets[:, 1], atol=0.05))
+
+        # The serial fit does not keep its inputs after it finishes.
+        self.assertEqual(len(_fit_inputs), 0)
+
+        parallel = fit_result_list(results, self.psfs, variances, num_workers=2, chunk_size=4)
+        self.assertTrue(np.allclose(parallel["negloglike"], serial["negloglike"]))
+
+        self.assertRaises(ValueError, fit_result_list, results, self.psfs, variances, model="bad")
+        self.assertRaises(ValueError, fit_result_list, results, self.psfs, variances, model="from_obs")
+        results.results[0].all_stamps = None
+        self.assertRaises(ValueError, fit_result_list, results, self.psfs, variances)
+
+
+if __name__ == "__main__":
+    unittest.main()
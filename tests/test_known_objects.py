@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from kbmod.known_objects import *
+
+
+class test_known_objects(unittest.TestCase):
+    def setUp(self):
+        self.times = np.array([57130.2, 57130.3, 57131.25, 57132.0])
+
+        # Object "a" moves slowly in RA, "b" sits near the RA=0 wrap, and "c" is only
+        # given at two of the times. The last entry does not match any image time.
+        self.names = ["a"] * 4 + ["b"] * 4 + ["c"] * 2 + ["a"]
+        self.mjd = np.concatenate([self.times, self.times, self.times[0:2], [57200.0]])
+        self.ra = np.concatenate(
+            [10.0 + 0.01 * np.arange(4), [359.9999, 0.0, 0.0001, 0.0002], [50.0, 50.0], [10.0]]
+        )
+        self.dec = np.concatenate([np.full(4, -5.0), np.full(4, 1.0), [20.0, 20.0], [-5.0]])
+
+    def test_match(self):
+        index = KnownObjectIndex(self.names, self.mjd, self.ra, self.dec, self.times)
+        self.assertEqual(index.num_times, 4)
+        self.assertEqual(list(index.object_names), ["a", "b", "c"])
+
+        # Result 0 follows "a" (offset by ~1 arcsec), result 1 follows "b" across the wrap,
+        # result 2 follows "c", and result 3 matches "a" at only the first two times.
+        ra = np.array(
+            [
+                10.0 + 0.01 * np.arange(4) + 0.0003,
+                [0.0001, 359.9999, 0.0, 0.0002],
+                np.full(4, 50.0),
+                [10.0, 10.01, 30.0, 30.0],
+            ]
+        )
+        dec = np.array([np.full(4, -5.0), np.full(4, 1.0), np.full(4, 20.0), np.full(4, -5.0)])
+
+        matches = index.match(ra, dec, 2.0, 3)
+        self.assertEqual(matches, {0: ["a"], 1: ["b"], 2: [], 3: []})
+
+        matches = index.match(ra, dec, 2.0, 2)
+        self.assertEqual(matches, {0: ["a"], 1: ["b"], 2: ["c"], 3: ["a"]})
+
+        # A smaller threshold drops the offset result.
+        matches = index.match(ra, dec, 0.5, 3)
+        self.assertEqual(matches[0], [])
+
+        self.assertRaises(ValueError, index.match, ra[:, 0:3], dec[:, 0:3], 2.0, 3)
+
+    def test_match_duplicate_entries(self):
+        # Object "a" has three entries (within the time tolerance) at each of the first two times.
+        names = ["a"] * 6
+        mjd = np.repeat(self.times[0:2], 3) + np.tile([0.0, 0.0001, -0.0001], 2)
+        ra = np.repeat([10.0, 10.01], 3)
+        dec = np.full(6, -5.0)
+        index = KnownObjectIndex(names, mjd, ra, dec, self.times)
+
+        ra_res = np.array([[10.0, 10.01, 30.0, 30.0]])
+        dec_res = np.full((1, 4), -5.0)
+        self.assertEqual(index.match(ra_res, dec_res, 2.0, 2), {0: ["a"]})
+        self.assertEqual(index.match(ra_res, dec_res, 2.0, 3), {0: []})
+
+    def test_from_file(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            filename = os.path.join(dir_name, "ephem.csv")
+            with open(filename, "w") as f:
+                f.write("name,mjd,ra,dec\n")
+                for row in zip(self.names, self.mjd, self.ra, self.dec):
+                    f.write("%s,%f,%f,%f\n" % row)
+
+            index = KnownObjectIndex.from_file(filename, self.times)
+            matches = index.match(self.ra[0:4].reshape(1, 4), self.dec[0:4].reshape(1, 4), 1.0, 4)
+            self.assertEqual(matches, {0: ["a"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
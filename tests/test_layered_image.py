@@ -1,6 +1,7 @@
 import tempfile
 import unittest
 
+import numpy as np
 from astropy.io import fits
 
 from kbmod.search import *
@@ -43,6 +44,23 @@ class test_layered_image(unittest.TestCase):
                 self.assertGreaterEqual(science.get_pixel(x, y), -100.0)
                 self.assertLessEqual(science.get_pixel(x, y), 100.0)
 
+    def test_create_from_layers(self):
+        sci = raw_image(np.full((60, 80), 1.0, dtype=np.single))
+        var = raw_image(np.full((60, 80), 2.0, dtype=np.single))
+        msk = raw_image(np.zeros((60, 80), dtype=np.single))
+        img = layered_image("from_layers", sci, var, msk, 5.0, self.p)
+        self.assertEqual(img.get_width(), 80)
+        self.assertEqual(img.get_height(), 60)
+        self.assertEqual(img.get_time(), 5.0)
+        self.assertEqual(img.get_name(), "from_layers")
+        self.assertEqual(img.get_science().get_pixel(10, 20), 1.0)
+        self.assertEqual(img.get_variance().get_pixel(10, 20), 2.0)
+        self.assertEqual(img.get_mask().get_pixel(10, 20), 0.0)
+
+        # The layers must have the same size.
+        bad = raw_image(np.zeros((60, 81), dtype=np.single))
+        self.assertRaises(RuntimeError, layered_image, "bad", sci, var, bad, 5.0, self.p)
+
     def test_set_time(self):
         self.assertIsNotNone(self.image)
         self.assertEqual(self.image.get_time(), 10.0)
@@ -308,6 +326,86 @@ class test_layered_image(unittest.TestCase):
                     self.assertEqual(var1.get_pixel(x, y), var2.get_pixel(x, y))
                     self.assertEqual(mask1.get_pixel(x, y), mask2.get_pixel(x, y))
 
+    def test_lazy_load(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            file_name = "tmp_layered_test_data3"
+            full_path = "%s/%s.fits" % (dir_name, file_name)
+            im1 = layered_image(file_name, 15, 20, 2.0, 4.0, 10.0, self.p)
+            im1.save_layers(dir_name + "/")
+
+            # Only the header is read when the image is created.
+            im2 = layered_image(full_path, self.p, True)
+            self.assertFalse(im2.is_loaded())
+            self.assertEqual(im2.get_width(), 15)
+            self.assertEqual(im2.get_height(), 20)
+            self.assertEqual(im2.get_time(), 10.0)
+
+            # The layers are read on first access.
+            self.assertTrue(np.array_equal(np.array(im2.get_variance()), np.array(im1.get_variance())))
+            self.assertTrue(im2.is_loaded())
+            self.assertTrue(np.array_equal(np.array(im2.get_science()), np.array(im1.get_science())))
+
+            # An image that is never loaded only reads the layers that are not released.
+            im3 = layered_image(full_path, self.p, True)
+            im3.release_layers(True)
+            self.assertTrue(np.array_equal(np.array(im3.get_science()), np.array(im1.get_science())))
+            self.assertRaises(RuntimeError, im3.get_variance)
+
+            # Setting a layer does not read it from the file and restores a released layer.
+            im4 = layered_image(full_path, self.p, True)
+            sci = raw_image(15, 20)
+            sci.set_all(7.0)
+            im4.set_science(sci)
+            self.assertFalse(im4.is_loaded())
+            self.assertTrue(np.array_equal(np.array(im4.get_mask()), np.array(im1.get_mask())))
+            self.assertTrue(im4.is_loaded())
+            self.assertTrue(np.all(np.array(im4.get_science()) == 7.0))
+
+            im4.release_layers(False)
+            im4.set_variance(sci)
+            self.assertTrue(np.all(np.array(im4.get_variance()) == 7.0))
+            self.assertRaises(RuntimeError, im4.get_mask)
+
+    def test_read_region(self):
+        with tempfile.TemporaryDirectory() as dir_name:
+            file_name = "tmp_layered_test_data4"
+            full_path = "%s/%s.fits" % (dir_name, file_name)
+            im1 = layered_image(file_name, 15, 20, 2.0, 4.0, 10.0, self.p)
+            im1.save_layers(dir_name + "/")
+
+            # Only the region [2, 10) x [5, 12) is read.
+            im2 = layered_image(full_path, self.p, True)
+            im2.set_region(2, 10, 5, 12)
+            self.assertEqual(im2.get_width(), 8)
+            self.assertEqual(im2.get_height(), 7)
+            self.assertEqual(im2.get_x_offset(), 2)
+            self.assertEqual(im2.get_y_offset(), 5)
+            sci1 = np.array(im1.get_science())
+            self.assertTrue(np.array_equal(np.array(im2.get_science()), sci1[5:12, 2:10]))
+            self.assertTrue(
+                np.array_equal(np.array(im2.get_variance()), np.array(im1.get_variance())[5:12, 2:10])
+            )
+
+            # The region can only be set before the layers are read.
+            self.assertRaises(RuntimeError, im2.set_region, 0, 5, 0, 5)
+            im3 = layered_image(full_path, self.p, True)
+            self.assertRaises(RuntimeError, im3.set_region, 0, 16, 0, 5)
+            self.assertRaises(RuntimeError, im3.set_region, 5, 5, 0, 5)
+
+    def test_release_layers(self):
+        self.assertTrue(self.image.is_loaded())
+        self.image.release_layers(True)
+        self.assertEqual(self.image.get_science().get_width(), 80)
+        self.assertRaises(RuntimeError, self.image.get_mask)
+        self.assertRaises(RuntimeError, self.image.get_variance)
+        self.assertRaises(RuntimeError, self.image.generate_phi_image)
+
+        # The size of the image does not change.
+        self.image.release_layers(False)
+        self.assertRaises(RuntimeError, self.image.get_science)
+        self.assertEqual(self.image.get_width(), 80)
+        self.assertEqual(self.image.get_height(), 60)
+
     def test_overwrite_files(self):
         with tempfile.TemporaryDirectory() as dir_name:
             file_name = "tmp_layered_test_data2"
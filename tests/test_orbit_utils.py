@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+
+from kbmod.file_utils import FileUtils
+from kbmod.search import trajectory
+
+try:
+    from kbmod.analysis.orbit_utils import KbmodInfo
+
+    HAS_ORBIT_UTILS = True
+except ImportError:
+    HAS_ORBIT_UTILS = False
+
+
+@unittest.skipUnless(HAS_ORBIT_UTILS, "orbit_utils requires pyOrbfit and ephem")
+class test_orbit_utils(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        # An image file with a simple WCS in its first extension.
+        wcs = WCS(naxis=2)
+        wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+        wcs.wcs.crval = [200.0, -10.0]
+        wcs.wcs.crpix = [50.0, 50.0]
+        wcs.wcs.cdelt = [-0.0001, 0.0001]
+        self.image_file = os.path.join(self.tmp_dir.name, "image.fits")
+        hdul = fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(np.zeros((10, 10)), header=wcs.to_header())])
+        hdul.writeto(self.image_file)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_results(self):
+        trjs = []
+        for i in range(2):
+            trj = trajectory()
+            trj.x = 10 + i
+            trj.y = 20
+            trj.x_v = 1.5
+            trj.y_v = -0.5
+            trj.lh = 30.0 - i
+            trj.obs_count = 5
+            trj.bary_index = i
+            trjs.append(trj)
+
+        # Both the current format (with bary_index) and the old data file can be read.
+        results_file = os.path.join(self.tmp_dir.name, "results_tmp.txt")
+        FileUtils.save_results_file(results_file, trjs)
+        for filename, x0 in [(results_file, [10, 11]), ("./data/fake_results.txt", [106, 55])]:
+            info = KbmodInfo(filename, self.image_file, [1, 2], [57130.2, 57130.3], [1, 2], "807")
+            self.assertEqual(
+                list(info.results_df.columns), ["lh", "flux", "x0", "y0", "x_v", "y_v", "obs_count"]
+            )
+            self.assertEqual(list(info.results_df["x0"]), x0)
+            self.assertEqual(info.mjd_0, 57130.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
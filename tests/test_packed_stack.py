@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from kbmod.analysis_utils import Interface
+from kbmod.packed_stack import *
+from kbmod.search import *
+
+
+class test_packed_stack(unittest.TestCase):
+    def setUp(self):
+        self.stack, self.img_info = Interface().load_images("../data/demo", None, None, None, psf(1.4))
+        self.dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.dir.name, "demo.kbpack")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        self.assertFalse(is_packed_stack(self.filename))
+        save_packed_stack(self.stack, self.img_info, self.filename)
+        self.assertTrue(is_packed_stack(self.filename))
+        self.assertFalse(is_packed_stack("../data/demo"))
+
+        stack, img_info = load_packed_stack(self.filename)
+        self.assertEqual(stack.img_count(), self.stack.img_count())
+        self.assertEqual(stack.get_width(), self.stack.get_width())
+        self.assertEqual(stack.get_height(), self.stack.get_height())
+        self.assertTrue(np.allclose(stack.get_times(), self.stack.get_times()))
+
+        for img, img2 in zip(self.stack.get_images(), stack.get_images()):
+            self.assertEqual(img.get_name(), img2.get_name())
+            self.assertEqual(img.get_time(), img2.get_time())
+            self.assertTrue(np.array_equal(np.array(img.get_science()), np.array(img2.get_science())))
+            self.assertTrue(np.array_equal(np.array(img.get_variance()), np.array(img2.get_variance())))
+            self.assertTrue(np.array_equal(np.array(img.get_mask()), np.array(img2.get_mask())))
+            self.assertTrue(np.allclose(np.array(img.get_psf()), np.array(img2.get_psf())))
+
+        self.assertEqual(img_info.num_images, self.img_info.num_images)
+        self.assertTrue(np.allclose(img_info.get_all_mjd(), self.img_info.get_all_mjd()))
+        self.assertEqual(img_info.get_x_size(), self.img_info.get_x_size())
+        for info, info2 in zip(self.img_info.stats, img_info.stats):
+            self.assertEqual(info.visit_id, info2.visit_id)
+            self.assertEqual(info.filename, info2.filename)
+            self.assertAlmostEqual(info.center.ra.deg, info2.center.ra.deg)
+            self.assertAlmostEqual(info.center.dec.deg, info2.center.dec.deg)
+            pos = info2.wcs.pixel_to_world(10.0, 20.0)
+            self.assertAlmostEqual(info.wcs.pixel_to_world(10.0, 20.0).separation(pos).deg, 0.0)
+
+    def test_memory_map(self):
+        save_packed_stack(self.stack, self.img_info, self.filename)
+        packed = PackedStack(self.filename)
+        self.assertEqual(packed.num_images, self.stack.img_count())
+        self.assertIsInstance(packed.science, np.memmap)
+        self.assertEqual(packed.science.shape, (packed.num_images, packed.height, packed.width))
+
+        img = self.stack.get_single_image(3)
+        self.assertTrue(np.array_equal(packed.science[3], np.array(img.get_science())))
+        self.assertEqual(packed.get_layered_image(3).get_time(), img.get_time())
+
+        # A region of an image uses the matching part of the cubes.
+        cutout = packed.get_layered_image(3, (10, 50, 20, 40))
+        self.assertEqual(cutout.get_width(), 40)
+        self.assertEqual(cutout.get_height(), 20)
+        self.assertTrue(np.array_equal(packed.variance[3, 20:40, 10:50], np.array(cutout.get_variance())))
+        self.assertRaises(ValueError, packed.get_layered_image, 3, (10, 50, 20, 400))
+
+    def test_interface_mjd_lims(self):
+        convert_to_packed_stack("../data/demo", None, None, psf(1.4), self.filename)
+        mjds = self.img_info.get_all_mjd()
+
+        stack, img_info = Interface().load_images(self.filename, None, None, [mjds[2], mjds[5]], psf(1.4))
+        self.assertEqual(stack.img_count(), 4)
+        self.assertTrue(np.allclose(img_info.get_all_mjd(), mjds[2:6]))
+        self.assertAlmostEqual(stack.get_times()[0], 0.0)
+
+    def test_invalid(self):
+        with open(self.filename, "wb") as f:
+            f.write(b"not a packed stack")
+        self.assertFalse(is_packed_stack(self.filename))
+        self.assertRaises(ValueError, PackedStack, self.filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
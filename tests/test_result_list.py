@@ -195,6 +195,21 @@ class test_result_list(unittest.TestCase):
         f_all = rs.get_filtered()
         self.assertEqual(len(f_all), 5)
 
+    def test_offset_positions(self):
+        rs = ResultList(self.times, track_filtered=True)
+        for i in range(4):
+            t = trajectory()
+            t.x = i
+            t.y = 2 * i
+            rs.append_result(ResultRow(t, self.num_times))
+        rs.filter_results([0, 1, 3], label="1")
+
+        rs.offset_positions(10, 20)
+        self.assertEqual([row.trajectory.x for row in rs.results], [10, 11, 13])
+        self.assertEqual([row.trajectory.y for row in rs.results], [20, 22, 26])
+        self.assertEqual(rs.get_filtered("1")[0].trajectory.x, 12)
+        self.assertEqual(rs.get_filtered("1")[0].trajectory.y, 24)
+
     def test_save_results(self):
         times = [0.0, 1.0, 2.0]
 
@@ -270,7 +285,9 @@ class test_result_list(unittest.TestCase):
         # Fill the ResultList with 3 fake rows.
         rs = ResultList(times)
         for i in range(3):
-            row = ResultRow(trajectory(), num_times)
+            trj = trajectory()
+            trj.bary_index = i
+            row = ResultRow(trj, num_times)
             row.set_psi_phi([0.1, 0.6, 0.2, float(i)], [2.0, 0.5, float(i), 1.0])
             row.filter_indices([t for t in range(num_times - i)])
             row.stamp = np.array([[float(i), float(i) / 3.0], [1.0, 0.5]])
@@ -291,6 +308,7 @@ class test_result_list(unittest.TestCase):
                 self.assertEqual(row1.num_times, row2.num_times)
                 self.assertEqual(row1.valid_indices, row2.valid_indices)
                 self.assertAlmostEqual(row1.final_likelihood, row2.final_likelihood)
+                self.assertEqual(row2.trajectory.bary_index, i)
 
                 # Check psi, phi, and lc.
                 row1_lc = row1.light_curve
@@ -0,0 +1,124 @@
+import os
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+
+from kbmod.result_list import *
+from kbmod.result_table import *
+from kbmod.search import *
+
+
+class test_result_table(unittest.TestCase):
+    def _save_patch(self, dir_name, num_res, num_times):
+        """Save a ResultList with fake results to a directory."""
+        os.makedirs(dir_name, exist_ok=True)
+        rs = ResultList([float(t) for t in range(num_times)])
+        for i in range(num_res):
+            trj = trajectory()
+            trj.x = 10 + i
+            trj.y = 20 + num_times
+            trj.x_v = 1.5
+            trj.y_v = -0.5
+            trj.bary_index = i
+            row = ResultRow(trj, num_times)
+            row.set_psi_phi([float(i + t) for t in range(num_times)], [1.0] * num_times)
+            row.filter_indices([t for t in range(num_times - i)])
+            row.stamp = np.full((3, 3), float(i))
+            row.all_stamps = np.zeros((num_times, 3, 3))
+            rs.append_result(row)
+        rs.save_to_files(dir_name, "tmp")
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dirs = {
+            "pg001_ccd01": os.path.join(self.tmp_dir.name, "pg001_ccd01"),
+            "pg002_ccd05": os.path.join(self.tmp_dir.name, "pg002_ccd05"),
+        }
+        self._save_patch(self.dirs["pg001_ccd01"], 3, 4)
+        self._save_patch(self.dirs["pg002_ccd05"], 2, 5)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_directory(self):
+        columns, times = load_result_directory(self.dirs["pg001_ccd01"], "tmp", load_all_stamps=True)
+        self.assertEqual(times.tolist(), [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(columns["x"].tolist(), [10, 11, 12])
+        self.assertEqual(columns["y"].tolist(), [24, 24, 24])
+        self.assertEqual(columns["vx"].tolist(), [1.5, 1.5, 1.5])
+        self.assertEqual(columns["num_obs"].tolist(), [4, 3, 2])
+        self.assertEqual(columns["bary_index"].tolist(), [0, 1, 2])
+        self.assertEqual(columns["psi"][1].tolist(), [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(columns["valid"][2].tolist(), [True, True, False, False])
+        self.assertEqual(columns["stamp"].shape, (3, 9))
+        self.assertEqual(columns["all_stamps"].shape, (3, 36))
+
+    def test_load_old_results_file(self):
+        # Results files written before the bary_index column have 14 tokens per line.
+        dir_name = os.path.join(self.tmp_dir.name, "old")
+        os.makedirs(dir_name)
+        with open(os.path.join(dir_name, "results_tmp.txt"), "w") as f:
+            f.write("lh: 3.0 flux: 5.0 x: 10 y: 12 x_v: 1.5 y_v: -0.5 obs_count: 4\n")
+        columns, _ = load_result_directory(dir_name, "tmp")
+        self.assertEqual(columns["x"].tolist(), [10])
+        self.assertEqual(columns["num_obs"].tolist(), [4])
+        self.assertEqual(columns["bary_index"].tolist(), [0])
+
+    def test_load_table(self):
+        for num_workers in [1, 2]:
+            table = load_result_table(self.dirs, "tmp", num_workers=num_workers)
+            self.assertEqual(len(table), 5)
+            self.assertEqual(table["patch"].tolist(), ["pg001_ccd01"] * 3 + ["pg002_ccd05"] * 2)
+            self.assertEqual(table["index"].tolist(), [0, 1, 2, 0, 1])
+            self.assertEqual(table["x"].tolist(), [10, 11, 12, 10, 11])
+
+            # The curves of the patch with fewer times are padded.
+            self.assertEqual(table["psi"].shape, (5, 5))
+            self.assertTrue(np.isnan(table["psi"][0, 4]))
+            self.assertFalse(table["valid"][0, 4])
+            self.assertEqual(table["psi"][4].tolist(), [1.0, 2.0, 3.0, 4.0, 5.0])
+            self.assertEqual(len(table.meta["times"]["pg002_ccd05"]), 5)
+
+            rows = select_patch(table, "pg001_ccd01")
+            self.assertEqual(len(rows), 3)
+            self.assertEqual(rows["lc"].shape, (3, 4))
+            self.assertEqual(rows["valid"][1].tolist(), [True, True, True, False])
+
+        # A list of directories is named by the directories.
+        table = load_result_table(list(self.dirs.values()), "tmp")
+        self.assertEqual(sorted(set(table["patch"])), ["pg001_ccd01", "pg002_ccd05"])
+
+        self.assertRaises(ValueError, load_result_table, self.dirs, "tmp", 0)
+
+    def test_missing_results(self):
+        dirs = dict(self.dirs)
+        dirs["pg003_ccd01"] = os.path.join(self.tmp_dir.name, "pg003_ccd01")
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            table = load_result_table(dirs, "tmp")
+        self.assertEqual(len(caught), 1)
+        self.assertEqual(len(table), 5)
+        self.assertEqual(len(select_patch(table, "pg003_ccd01")), 0)
+
+    def test_cache(self):
+        cache_file = os.path.join(self.tmp_dir.name, "cache.npz")
+        table = load_result_table(self.dirs, "tmp", cache_file=cache_file)
+        self.assertTrue(os.path.isfile(cache_file))
+
+        # The cached table is reused.
+        cached = load_result_table(self.dirs, "tmp", cache_file=cache_file)
+        self.assertEqual(cached.colnames, table.colnames)
+        for name in table.colnames:
+            np.testing.assert_array_equal(np.asarray(cached[name]), np.asarray(table[name]))
+        self.assertEqual(cached.meta["times"]["pg001_ccd01"].tolist(), [0.0, 1.0, 2.0, 3.0])
+
+        # Changing the results rebuilds the table.
+        self._save_patch(self.dirs["pg002_ccd05"], 4, 5)
+        updated = load_result_table(self.dirs, "tmp", cache_file=cache_file)
+        self.assertEqual(len(updated), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -121,6 +121,71 @@ class test_search(unittest.TestCase):
                     )
                     self.assertAlmostEqual(phi[1].get_pixel(x, y), 1.0 / var.get_pixel(x, y), delta=1e-6)
 
+    def test_trajectory_arrays(self):
+        trjs = []
+        for i in range(5):
+            trj = trajectory()
+            trj.x = i
+            trj.y = 2 * i
+            trj.x_v = 1.5 * i
+            trj.y_v = -1.0
+            trj.lh = 10.0 - i
+            trj.flux = 100.0
+            trj.obs_count = self.imCount
+            trj.bary_index = 0
+            trjs.append(trj)
+
+        arr = trajectory_array(trjs)
+        self.assertEqual(arr.dtype, trajectory_dtype)
+        self.assertEqual(list(arr["x"]), [0, 1, 2, 3, 4])
+        self.assertEqual(list(arr["lh"]), [10.0, 9.0, 8.0, 7.0, 6.0])
+
+        # The results can be set and retrieved as arrays.
+        self.search.set_results(arr)
+        results = self.search.get_results_array(1, 3)
+        self.assertEqual(results.dtype, trajectory_dtype)
+        self.assertEqual(list(results["y"]), [2, 4, 6])
+        self.assertEqual(list(results["x_v"]), [1.5, 3.0, 4.5])
+        self.assertEqual([trj.x for trj in trajectory_list(results)], [1, 2, 3])
+
+        # Requests past the end of the results are clamped.
+        self.assertEqual([trj.x for trj in self.search.get_results(4, 3)], [4])
+        self.assertEqual(len(self.search.get_results(7, 3)), 0)
+        self.assertRaises(RuntimeError, self.search.get_results, -1, 3)
+
+        # The positions of all the trajectories at every time.
+        pos = self.search.get_mult_traj_pos(arr)
+        self.assertEqual(pos.dtype, pixel_pos_dtype)
+        self.assertEqual(pos.shape, (5, self.imCount))
+        for i, trj in enumerate(trjs):
+            expected = self.search.get_mult_traj_pos(trj)
+            for t in range(self.imCount):
+                self.assertAlmostEqual(pos[i, t]["x"], expected[t].x, delta=1e-5)
+                self.assertAlmostEqual(pos[i, t]["y"], expected[t].y, delta=1e-5)
+
+    def test_set_phi_images(self):
+        self.search.prepare_psi_phi()
+        phi = self.search.get_phi_images()
+
+        # A search of a stack with more flux (but the same variance) reuses phi.
+        for img in self.imlist:
+            img.add_object(40.5, 30.5, 500.0)
+        search2 = stack_search(image_stack(self.imlist))
+        search2.set_phi_images(phi)
+        search2.prepare_psi_phi()
+        phi2 = search2.get_phi_images()
+        psi = self.search.get_psi_images()
+        psi2 = search2.get_psi_images()
+        self.assertEqual(len(phi2), self.imCount)
+        self.assertEqual(phi2[0].get_pixel(40, 30), phi[0].get_pixel(40, 30))
+        self.assertGreater(psi2[0].get_pixel(40, 30), psi[0].get_pixel(40, 30))
+
+        # The phi images cannot be set after psi/phi were generated or with the wrong shapes.
+        self.assertRaises(RuntimeError, self.search.set_phi_images, phi)
+        search3 = stack_search(self.stack)
+        self.assertRaises(RuntimeError, search3.set_phi_images, phi[1:])
+        self.assertRaises(RuntimeError, search3.set_phi_images, [raw_image(5, 5)] * self.imCount)
+
     def test_results(self):
         self.search.search(
             self.angle_steps,
@@ -140,6 +205,40 @@ class test_search(unittest.TestCase):
         self.assertAlmostEqual(best.y_v / self.y_vel, 1, delta=self.velocity_error)
         self.assertAlmostEqual(best.flux / self.object_flux, 1, delta=self.flux_error)
 
+    def test_timings(self):
+        self.assertEqual(len(self.search.get_timings()), 0)
+        self.search.prepare_psi_phi()
+
+        # The timings are recorded even when debugging output is disabled.
+        timings = self.search.get_timings()
+        self.assertEqual(len(timings), 1)
+        self.assertEqual(timings[0][0], "Generating psi/phi images")
+        self.assertGreaterEqual(timings[0][1], 0.0)
+
+        self.search.clear_timings()
+        self.assertEqual(len(self.search.get_timings()), 0)
+
+        # A timer started inside another one does not replace the outer timer.
+        search = stack_search(self.stack)
+        search.find_active_start_pixels([trajectory()], 1)
+        timings = search.get_timings()
+        self.assertEqual(
+            [t[0] for t in timings], ["Generating psi/phi images", "Finding active starting pixels"]
+        )
+        self.assertGreaterEqual(timings[1][1], timings[0][1])
+
+    def test_release_image_layers(self):
+        self.search.release_image_layers()
+        self.assertEqual(len(self.search.get_psi_images()), self.imCount)
+
+        # Only the science layer of the search's images is kept.
+        img = self.search.get_image_stack().get_single_image(0)
+        self.assertRaises(RuntimeError, img.get_variance)
+        self.assertEqual(len(self.search.science_viz_stamps(self.trj, 2)), self.imCount)
+
+        # The original stack is not changed.
+        self.assertEqual(self.stack.get_single_image(0).get_variance().get_width(), self.dim_x)
+
     def test_results_extended_bounds(self):
         self.search.set_start_bounds_x(-10, self.dim_x + 10)
         self.search.set_start_bounds_y(-10, self.dim_y + 10)
@@ -228,6 +327,311 @@ class test_search(unittest.TestCase):
         self.assertAlmostEqual(best.x_v / trj.x_v, 1, delta=self.velocity_error)
         self.assertAlmostEqual(best.y_v / trj.y_v, 1, delta=self.velocity_error)
 
+    def test_drift_search_list(self):
+        max_drift = 1.0
+        trjs = self.search.create_drift_search_list(
+            max_drift, self.min_angle, self.max_angle, self.min_vel, self.max_vel
+        )
+        self.assertGreater(len(trjs), 0)
+        self.assertLess(len(trjs), self.angle_steps * self.velocity_steps)
+
+        times = np.array(self.stack.get_times())
+        time_span = times[-1] - times[0]
+        vels = np.array([[t.x_v, t.y_v] for t in trjs])
+
+        # All the velocities are within the covering radius of the search region.
+        for t in trjs:
+            dist = velocity_distance_to_region(
+                t.x_v, t.y_v, self.min_angle, self.max_angle, self.min_vel, self.max_vel
+            )
+            self.assertLessEqual(dist, max_drift / time_span + 1e-4)
+
+        # No two velocities produce the same rounded pixel offsets.
+        offsets = set()
+        for t in trjs:
+            key = tuple(int(t.x_v * tm + 0.5) for tm in times) + tuple(int(t.y_v * tm + 0.5) for tm in times)
+            self.assertNotIn(key, offsets)
+            offsets.add(key)
+
+        # Every velocity in the region ends up within max_drift pixels of a searched velocity's
+        # track (plus up to one pixel lost when removing duplicated tracks).
+        for a in np.linspace(self.min_angle, self.max_angle, 20):
+            for v in np.linspace(self.min_vel, self.max_vel, 20):
+                end_diff = np.linalg.norm(vels - [v * np.cos(a), v * np.sin(a)], axis=1) * time_span
+                self.assertLessEqual(np.min(end_diff), max_drift + 1.0)
+
+    def test_drift_search_list_invalid(self):
+        self.assertRaises(
+            RuntimeError, self.search.create_drift_search_list, 0.0, 0.0, 1.0, self.min_vel, self.max_vel
+        )
+        self.assertRaises(RuntimeError, self.search.create_drift_search_list, 1.0, 0.0, 1.0, 10.0, 5.0)
+
+    def test_results_drift(self):
+        self.search.search_drift(
+            0.5, self.min_angle, self.max_angle, self.min_vel, self.max_vel, int(self.imCount / 2)
+        )
+
+        results = self.search.get_results(0, 10)
+        best = results[0]
+        self.assertAlmostEqual(best.x, self.start_x, delta=self.pixel_error)
+        self.assertAlmostEqual(best.y, self.start_y, delta=self.pixel_error)
+        self.assertAlmostEqual(best.x_v / self.x_vel, 1, delta=self.velocity_error)
+        self.assertAlmostEqual(best.y_v / self.y_vel, 1, delta=self.velocity_error)
+
+    def test_find_active_start_pixels(self):
+        width = 30
+        height = 20
+        num_images = 5
+
+        # Mask the left third of every image and the entire first two images.
+        imlist = []
+        for i in range(num_images):
+            im = layered_image(str(i), width, height, 2.0, 4.0, float(i), psf(0.00001), i)
+            mask = im.get_mask()
+            for y in range(height):
+                for x in range(width):
+                    if x < 10 or i < 2:
+                        mask.set_pixel(x, y, 1)
+            im.set_mask(mask)
+            im.apply_mask_flags(1, [])
+            imlist.append(im)
+        search = stack_search(image_stack(imlist))
+
+        # Use a single stationary trajectory, so each starting pixel can only reach
+        # the pixels within one pixel of itself.
+        trj = trajectory()
+        trj.x_v = 0.0
+        trj.y_v = 0.0
+
+        expected = [y * width + x for y in range(height) for x in range(9, width)]
+        self.assertEqual(search.find_active_start_pixels([trj], 1), expected)
+        self.assertEqual(search.find_active_start_pixels([trj], 3), expected)
+        self.assertEqual(len(search.find_active_start_pixels([trj], 4)), 0)
+        self.assertEqual(len(search.find_active_start_pixels([], 1)), 0)
+
+        # The minimum fraction can require more images than the minimum observations.
+        search.enable_start_pixel_filter(0.6)
+        self.assertEqual(search.find_active_start_pixels([trj], 1), expected)
+        search.enable_start_pixel_filter(0.8)
+        self.assertEqual(len(search.find_active_start_pixels([trj], 1)), 0)
+        self.assertRaises(RuntimeError, search.enable_start_pixel_filter, 1.5)
+
+        # Starting pixels off the image are active if they can reach the data. The indices
+        # are relative to the search space.
+        search.enable_start_pixel_filter(0.0)
+        search.set_start_bounds_x(-5, width + 5)
+        expected = [y * (width + 10) + x + 5 for y in range(height) for x in range(9, width + 1)]
+        self.assertEqual(search.find_active_start_pixels([trj], 1), expected)
+
+        # A moving trajectory can reach the data from further away, but leaves the
+        # image from the right-most pixels.
+        trj.x_v = 2.0
+        expected = [y * (width + 10) + x + 5 for y in range(height) for x in range(1, 27)]
+        self.assertEqual(search.find_active_start_pixels([trj], 1), expected)
+
+    def test_results_start_pixel_filter(self):
+        self.search.set_start_bounds_x(-50, self.dim_x + 50)
+        self.search.search(
+            self.angle_steps,
+            self.velocity_steps,
+            self.min_angle,
+            self.max_angle,
+            self.min_vel,
+            self.max_vel,
+            int(self.imCount / 2),
+        )
+        expected = self.search.get_results(0, 10)
+
+        search2 = stack_search(self.stack)
+        search2.set_start_bounds_x(-50, self.dim_x + 50)
+        search2.enable_start_pixel_filter(0.0)
+        search2.search(
+            self.angle_steps,
+            self.velocity_steps,
+            self.min_angle,
+            self.max_angle,
+            self.min_vel,
+            self.max_vel,
+            int(self.imCount / 2),
+        )
+        results = search2.get_results(0, 10)
+
+        self.assertEqual(len(results), len(expected))
+        for i in range(len(results)):
+            self.assertEqual(results[i].x, expected[i].x)
+            self.assertEqual(results[i].y, expected[i].y)
+            self.assertAlmostEqual(results[i].x_v, expected[i].x_v, delta=1e-5)
+            self.assertAlmostEqual(results[i].y_v, expected[i].y_v, delta=1e-5)
+            self.assertAlmostEqual(results[i].lh, expected[i].lh, delta=1e-3)
+
+    def test_results_start_pixel_filter_none_active(self):
+        # Every starting pixel must reach valid data in all the images, but the first image
+        # is fully masked, so no pixel is searched.
+        imlist = [self.stack.get_single_image(i) for i in range(self.imCount)]
+        mask = imlist[0].get_mask()
+        mask.set_all(1.0)
+        imlist[0].set_mask(mask)
+        imlist[0].apply_mask_flags(1, [])
+        search = stack_search(image_stack(imlist))
+        search.enable_start_pixel_filter(1.0)
+        search.search(
+            self.angle_steps,
+            self.velocity_steps,
+            self.min_angle,
+            self.max_angle,
+            self.min_vel,
+            self.max_vel,
+            int(self.imCount / 2),
+        )
+
+        # All the results keep their prefilled values.
+        results = search.get_results(0, 100)
+        self.assertEqual(len(results), 100)
+        for trj in results:
+            self.assertEqual(trj.lh, -1.0)
+
+    def test_results_session(self):
+        self.search.search(
+            self.angle_steps,
+            self.velocity_steps,
+            self.min_angle,
+            self.max_angle,
+            self.min_vel,
+            self.max_vel,
+            int(self.imCount / 2),
+        )
+        expected = self.search.get_results(0, 10)
+
+        search2 = stack_search(self.stack)
+        search2.start_session()
+        self.assertTrue(search2.in_session())
+
+        # The encoding cannot change while the data is on the GPU.
+        self.assertRaises(RuntimeError, search2.enable_gpu_encoding, 1, 1)
+
+        # Run a different search first and check the data is reused correctly.
+        search2.search_drift(1.0, self.min_angle, self.max_angle, self.min_vel, self.max_vel, 2)
+        search2.search(
+            self.angle_steps,
+            self.velocity_steps,
+            self.min_angle,
+            self.max_angle,
+            self.min_vel,
+            self.max_vel,
+            int(self.imCount / 2),
+        )
+        results = search2.get_results(0, 10)
+        search2.end_session()
+        self.assertFalse(search2.in_session())
+
+        self.assertEqual(len(results), len(expected))
+        for i in range(len(results)):
+            self.assertEqual(results[i].x, expected[i].x)
+            self.assertEqual(results[i].y, expected[i].y)
+            self.assertAlmostEqual(results[i].x_v, expected[i].x_v, delta=1e-5)
+            self.assertAlmostEqual(results[i].y_v, expected[i].y_v, delta=1e-5)
+            self.assertAlmostEqual(results[i].lh, expected[i].lh, delta=1e-3)
+
+    def test_multiple_bary_corrections(self):
+        # The first set of corrections is zero, the second shifts every image by (2, -1).
+        corr = np.zeros((2, self.imCount, 6))
+        corr[1, :, 0] = 2.0
+        corr[1, :, 3] = -1.0
+        self.search.enable_corr(corr.flatten())
+
+        trj = trajectory()
+        trj.x = 10
+        trj.y = 20
+        trj.x_v = 1.0
+        trj.y_v = 2.0
+        self.assertEqual(trj.bary_index, 0)
+
+        times = self.stack.get_times()
+        for i in [0, 5, self.imCount - 1]:
+            pos = self.search.get_traj_pos(trj, i)
+            self.assertAlmostEqual(pos.x, 10.0 + times[i], delta=1e-5)
+            self.assertAlmostEqual(pos.y, 20.0 + 2.0 * times[i], delta=1e-5)
+
+        trj.bary_index = 1
+        for i in [0, 5, self.imCount - 1]:
+            pos = self.search.get_traj_pos(trj, i)
+            self.assertAlmostEqual(pos.x, 12.0 + times[i], delta=1e-5)
+            self.assertAlmostEqual(pos.y, 19.0 + 2.0 * times[i], delta=1e-5)
+
+        trj.bary_index = 2
+        self.assertRaises(RuntimeError, self.search.get_traj_pos, trj, 0)
+
+        # The number of coefficients must match the number of images.
+        self.assertRaises(RuntimeError, self.search.enable_corr, np.zeros(6 * self.imCount + 1))
+
+    def test_trajectory_offsets(self):
+        rng = np.random.default_rng(100)
+        trjs = []
+        for i in range(30):
+            trj = trajectory()
+            trj.x = int(rng.integers(0, self.dim_x))
+            trj.y = int(rng.integers(0, self.dim_y))
+            trj.x_v = float(rng.uniform(-40.0, 40.0))
+            trj.y_v = float(rng.uniform(-40.0, 40.0))
+            trj.bary_index = i % 2
+            trjs.append(trj)
+
+        def evaluate():
+            return [
+                (
+                    self.search.psi_curves(trj),
+                    self.search.phi_curves(trj),
+                    [(p.x, p.y) for p in self.search.get_mult_traj_pos(trj)],
+                    [s.get_all_pixels() for s in self.search.science_viz_stamps(trj, 2)],
+                )
+                for trj in trjs
+            ]
+
+        corr = np.zeros((2, self.imCount, 6))
+        corr[1, :, 0] = np.linspace(-1.3, 2.7, self.imCount)
+        corr[1, :, 2] = 0.001
+        corr[1, :, 3] = -0.6
+        corr[1, :, 4] = -0.002
+        for use_corr in [False, True]:
+            if use_corr:
+                self.search.enable_corr(corr.flatten())
+            expected = evaluate()
+
+            # Only the first 20 velocities are in the table, the others use the direct computation.
+            self.search.build_trajectory_offsets(trjs[:20] + trjs[:5])
+            self.assertEqual(self.search.num_trajectory_offsets(), 20)
+            self.assertEqual(evaluate(), expected)
+
+            self.search.clear_trajectory_offsets()
+            self.assertEqual(self.search.num_trajectory_offsets(), 0)
+
+            # An empty list gives an empty table.
+            self.search.build_trajectory_offsets([])
+            self.assertEqual(self.search.num_trajectory_offsets(), 0)
+
+    def test_results_multiple_bary_corrections(self):
+        # Only the second set of corrections (zero) matches the object.
+        corr = np.zeros((2, self.imCount, 6))
+        corr[0, :, 0] = np.arange(self.imCount) * 0.5
+        self.search.enable_corr(corr.flatten())
+        self.search.search(
+            self.angle_steps,
+            self.velocity_steps,
+            self.min_angle,
+            self.max_angle,
+            self.min_vel,
+            self.max_vel,
+            int(self.imCount / 2),
+        )
+
+        results = self.search.get_results(0, 10)
+        best = results[0]
+        self.assertEqual(best.bary_index, 1)
+        self.assertAlmostEqual(best.x, self.start_x, delta=self.pixel_error)
+        self.assertAlmostEqual(best.y, self.start_y, delta=self.pixel_error)
+        self.assertAlmostEqual(best.x_v / self.x_vel, 1, delta=self.velocity_error)
+        self.assertAlmostEqual(best.y_v / self.y_vel, 1, delta=self.velocity_error)
+
     def test_sci_viz_stamps(self):
         sci_stamps = self.search.science_viz_stamps(self.trj, 2)
         self.assertEqual(len(sci_stamps), self.imCount)
@@ -456,6 +860,10 @@ class test_search(unittest.TestCase):
         self.assertAlmostEqual(stamps[0].get_pixel(1, 1), 2.5)
         self.assertAlmostEqual(stamps[0].get_pixel(2, 1), 2.0)
 
+        # The trajectories can also be given as an array.
+        stamps = search.gpu_coadded_stamps(trajectory_array([trj]), [all_valid], params)
+        self.assertAlmostEqual(stamps[0].get_pixel(1, 1), 2.5)
+
     def test_coadd_gpu(self):
         params = stamp_parameters()
         params.radius = 3
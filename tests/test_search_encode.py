@@ -127,6 +127,69 @@ class test_search_filter(unittest.TestCase):
         self.assertAlmostEqual(best.y_v / self.y_vel, 1, delta=self.velocity_error)
         self.assertAlmostEqual(best.flux / self.object_flux, 1, delta=self.flux_error)
 
+    def test_tiled_encodings(self):
+        for num_bytes, half in [(1, False), (2, True)]:
+            search = stack_search(self.stack)
+            search.enable_gpu_encoding(num_bytes, num_bytes, tile_size=32, clip_frac=0.001, half=half)
+            search.search(
+                self.angle_steps,
+                self.velocity_steps,
+                self.min_angle,
+                self.max_angle,
+                self.min_vel,
+                self.max_vel,
+                int(self.imCount / 2),
+            )
+
+            results = search.get_results(0, 10)
+            best = results[0]
+            self.assertAlmostEqual(best.x, self.start_x, delta=self.pixel_error)
+            self.assertAlmostEqual(best.y, self.start_y, delta=self.pixel_error)
+            self.assertAlmostEqual(best.x_v / self.x_vel, 1, delta=self.velocity_error)
+            self.assertAlmostEqual(best.y_v / self.y_vel, 1, delta=self.velocity_error)
+            self.assertAlmostEqual(best.flux / self.object_flux, 1, delta=self.flux_error)
+
+    def test_encode_and_decode(self):
+        pixels = np.random.default_rng(5).normal(0.0, 1.0, size=(40, 30)).astype(np.float32)
+        pixels[2, 3] = 1000.0
+        pixels[35, 25] = KB_NO_DATA
+        img = raw_image(pixels)
+
+        def max_error(decoded, rows, cols):
+            return np.max(
+                np.abs(np.array(decoded.get_all_pixels()).reshape(pixels.shape) - pixels)[rows, cols]
+            )
+
+        # With a single scale the hot pixel reduces the precision of the whole image.
+        decoded = encode_and_decode_images([img], 1)[0]
+        self.assertEqual(decoded.get_pixel(25, 35), KB_NO_DATA)
+        self.assertGreater(max_error(decoded, slice(10, 40), slice(0, 30)), 1.0)
+
+        # The tiles away from the hot pixel keep their precision.
+        decoded = encode_and_decode_images([img], 1, tile_size=10)[0]
+        self.assertEqual(decoded.get_pixel(25, 35), KB_NO_DATA)
+        self.assertLess(max_error(decoded, slice(10, 35), slice(0, 30)), 0.05)
+
+        # Clipping the most extreme pixels keeps the precision of the others.
+        decoded = encode_and_decode_images([img], 1, clip_frac=0.01)[0]
+        errors = np.abs(np.array(decoded.get_all_pixels()).reshape(pixels.shape) - pixels)
+        self.assertLess(np.max(errors[np.abs(pixels) < 2.0]), 0.05)
+        self.assertLess(decoded.get_pixel(3, 2), 10.0)
+
+        # Half precision floats keep the relative precision of every pixel.
+        decoded = np.array(encode_and_decode_images([img], 2, half=True)[0].get_all_pixels())
+        decoded = decoded.reshape(pixels.shape)
+        valid = pixels != KB_NO_DATA
+        self.assertEqual(decoded[35, 25], KB_NO_DATA)
+        self.assertTrue(np.allclose(decoded[valid], pixels[valid], rtol=1e-3, atol=1000.0 * 1e-3))
+
+        # Invalid encodings.
+        self.assertRaises(RuntimeError, encode_and_decode_images, [img], 4)
+        self.assertRaises(RuntimeError, encode_and_decode_images, [img], 1, half=True)
+        self.assertRaises(RuntimeError, encode_and_decode_images, [img], 1, clip_frac=0.5)
+        search = stack_search(self.stack)
+        self.assertRaises(RuntimeError, search.enable_gpu_encoding, 1, 1, half=True)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -87,6 +87,23 @@ class test_predicted_position(unittest.TestCase):
         dist = (math.sqrt(2.0) + 0.5 + 1.0) / 3.0
         self.assertAlmostEqual(result, dist, delta=1e-5)
 
+    def test_velocity_distance_to_region(self):
+        # Inside the region.
+        self.assertAlmostEqual(velocity_distance_to_region(10.0, 0.0, -0.5, 0.5, 5.0, 20.0), 0.0)
+
+        # Too slow or too fast along a valid angle.
+        self.assertAlmostEqual(velocity_distance_to_region(2.0, 0.0, -0.5, 0.5, 5.0, 20.0), 3.0, delta=1e-5)
+        self.assertAlmostEqual(velocity_distance_to_region(0.0, 25.0, 1.0, 2.0, 5.0, 20.0), 5.0, delta=1e-5)
+
+        # Outside the angle limits, the closest point is on the bounding ray.
+        self.assertAlmostEqual(
+            velocity_distance_to_region(0.0, 10.0, -0.1, 0.0, 5.0, 20.0), math.sqrt(125.0), delta=1e-4
+        )
+        self.assertAlmostEqual(velocity_distance_to_region(-10.0, 0.0, 0.0, 0.0, 5.0, 20.0), 15.0, delta=1e-4)
+
+        # Angle limits that wrap around the full circle.
+        self.assertAlmostEqual(velocity_distance_to_region(-10.0, 0.0, 0.0, 7.0, 5.0, 20.0), 0.0)
+
 
 if __name__ == "__main__":
     unittest.main()